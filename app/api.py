@@ -1,44 +1,110 @@
 """FastAPI routes."""
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from app.pipeline import run_pipeline
-from app.monitoring import MetricsCollector, HealthCheck
-from app.feedback import FeedbackCollector
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List
+from app.pipeline import (
+    compute_cohorts,
+    compute_funnel,
+    feedback_stats_async,
+    is_ready,
+    log_feedback_async,
+    metrics,
+    run_pipeline_async,
+    run_analytics_async,
+    run_pipeline_batch_async,
+)
+from app.config import MAX_BATCH_QUERIES
+from app.monitoring import HealthCheck
 
 router = APIRouter()
-metrics = MetricsCollector()
-health = HealthCheck()
-feedback = FeedbackCollector()
+health = HealthCheck(metrics)
 
 
 class Query(BaseModel):
     query: str
 
 
+class BatchQuery(BaseModel):
+    queries: List[str] = Field(..., max_length=MAX_BATCH_QUERIES)
+
+
 class FeedbackRequest(BaseModel):
     query_id: str
     helpful: bool
     feedback: Optional[str] = None
 
 
+class FunnelRequest(BaseModel):
+    steps: List[str]
+    window_days: Optional[float] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    by: Optional[str] = None
+
+
+class CohortRequest(BaseModel):
+    period: str = "week"
+    periods: int = 8
+    cohort_event: Optional[str] = None
+    activity_event: Optional[str] = None
+
+
 @router.post("/query")
 async def query(q: Query) -> Dict[str, Any]:
     """Answer a query about SaaS product metrics."""
-    return run_pipeline(q.query)
+    return await run_pipeline_async(q.query)
+
+
+@router.post("/query/batch")
+async def query_batch(q: BatchQuery) -> Dict[str, Any]:
+    """Answer several queries with one batched retrieval pass."""
+    return {"results": await run_pipeline_batch_async(q.queries)}
+
+
+@router.post("/analytics/funnel")
+async def funnel(f: FunnelRequest) -> Dict[str, Any]:
+    """Ordered conversion funnel over events.csv, optionally broken down by a user/account column."""
+    window = f.window_days * 86400 if f.window_days is not None else None
+    try:
+        return await run_analytics_async(
+            compute_funnel, f.steps, window_seconds=window, start=f.start, end=f.end, by=f.by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/analytics/cohorts")
+async def cohorts(c: CohortRequest) -> Dict[str, Any]:
+    """Retention by signup cohort over events.csv."""
+    try:
+        return await run_analytics_async(
+            compute_cohorts,
+            period=c.period,
+            periods=c.periods,
+            cohort_event=c.cohort_event,
+            activity_event=c.activity_event,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/health")
 async def health_check() -> Dict[str, Any]:
-    """System health and drift detection."""
+    """System health, drift detection and readiness (pipeline warmed up)."""
     h = health.get_health()
+    ready = is_ready()
+    if not ready:
+        message = "Warming up - loading indexes and models"
+    elif h["status"] == "ok":
+        message = "System operational"
+    else:
+        message = "System degraded - check metrics"
     return {
         "status": h["status"],
+        "ready": ready,
         "uptime_seconds": h["uptime_seconds"],
         "drift_detected": h["drift_detected"],
-        "message": "System operational"
-        if h["status"] == "ok"
-        else "System degraded - check metrics",
+        "message": message,
     }
 
 
@@ -51,11 +117,12 @@ async def get_metrics() -> Dict[str, Any]:
 @router.post("/feedback")
 async def submit_feedback(f: FeedbackRequest) -> Dict[str, str]:
     """Submit feedback on an answer."""
-    feedback.log_feedback(f.query_id, f.helpful, f.feedback)
+    if not await log_feedback_async(f.query_id, f.helpful, f.feedback):
+        raise HTTPException(status_code=404, detail=f"Unknown query_id {f.query_id}")
     return {"status": "feedback recorded", "query_id": f.query_id}
 
 
 @router.get("/feedback/stats")
 async def feedback_stats() -> Dict[str, Any]:
     """Feedback statistics."""
-    return feedback.get_feedback_stats()
+    return await feedback_stats_async()
@@ -2,7 +2,81 @@
 # Retrieval
 TOP_K = 5
 DOC_PATH = "data/unstructured/internal_docs.md"
+
+# Ingestion: every source indexed by the pipeline, chunked into passages
+SOURCES = [
+    {"path": "data/unstructured/internal_docs.md", "format": "markdown", "source_type": "doc"},
+    {"path": "data/unstructured/release_notes.md", "format": "markdown", "source_type": "doc"},
+    {
+        "path": "data/unstructured/support_tickets.json",
+        "format": "json",
+        "source_type": "ticket",
+        "id_field": "ticket_id",
+        "text_fields": ["subject", "body", "resolution"],
+    },
+    {
+        "path": "data/unstructured/incidents.json",
+        "format": "json",
+        "source_type": "event",
+        "id_field": "incident_id",
+        "text_fields": ["description"],
+    },
+    {"path": "data/structured/daily_metrics.csv", "format": "csv", "source_type": "metric"},
+    {
+        "path": "data/structured/events.csv",
+        "format": "csv",
+        "source_type": "event",
+        "id_field": "event_id",
+    },
+    {
+        "path": "data/structured/accounts.csv",
+        "format": "csv",
+        "source_type": "doc",
+        "id_field": "account_id",
+    },
+    {
+        "path": "data/structured/users.csv",
+        "format": "csv",
+        "source_type": "doc",
+        "id_field": "user_id",
+    },
+]
+SOURCE_METADATA_PATH = "data/config/source_metadata.json"
+# Passage size and overlap, in words
+CHUNK_SIZE = 120
+CHUNK_OVERLAP = 20
 DENSE_MODEL = "all-MiniLM-L6-v2"
+# Persisted dense index (embedding matrix + FAISS index), keyed by corpus hash
+INDEX_DIR = "indexes"
+# Dense index type: "flat" (exact), "ivf_flat", "hnsw" or "ivf_pq" (see app/retrieval/ann.py).
+# Unset params use ann.DEFAULT_PARAMS; nprobe / ef_search trade recall for latency.
+DENSE_INDEX_TYPE = "flat"
+DENSE_INDEX_PARAMS = {"nlist": 1024, "nprobe": 16, "ef_search": 64}
+# Vector storage scanned per query: "float32", "float16" (2x smaller) or "int8" (4x).
+# Reduced precision shortlists k * DENSE_RESCORE_FACTOR candidates, rescored in float32.
+DENSE_STORAGE = "float32"
+DENSE_RESCORE_FACTOR = 4
+# Corpus drift: per-document fingerprints saved between runs (app/fingerprints.py).
+# Distribution drift is flagged above these token JS-divergence / centroid cosine distances.
+FINGERPRINTS_PATH = "indexes/fingerprints.npz"
+TOKEN_DRIFT_THRESHOLD = 0.05
+CENTROID_DRIFT_THRESHOLD = 0.05
+# Query embedding cache: in-memory LRU capacity, plus an optional directory
+# shared by all workers on the host (None disables the disk tier), whose least
+# recently used files are evicted once it exceeds QUERY_EMBEDDING_CACHE_DISK_BYTES
+QUERY_EMBEDDING_CACHE_BYTES = 64 * 1024 * 1024
+QUERY_EMBEDDING_CACHE_DIR = None
+QUERY_EMBEDDING_CACHE_DISK_BYTES = 256 * 1024 * 1024
+# Hybrid fusion: "rrf", "minmax" or "zscore"
+FUSION_STRATEGY = "rrf"
+HYBRID_CANDIDATES = 50
+
+# Query result cache (LRU + TTL); keyed on normalized query, corpus and ranker version
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL_SECONDS = 300
+
+# Structured metrics engine: CSVs queried for numeric evidence attached to answers
+STRUCTURED_DATA_DIR = "data/structured"
 
 # LLM Reasoning
 CONFIDENCE_THRESHOLD = 0.5
@@ -12,6 +86,31 @@ MAX_TOKENS = 256
 LATENCY_BASELINE_MS = 300
 RECALL_BASELINE = 0.75
 REFUSAL_BASELINE = 0.08
+# Per-stage latency spans recorded into the metrics (app/tracing.py)
+TRACING_ENABLED = True
+# Profile a PROFILE_SAMPLE_RATE fraction of requests ("sample": collapsed stacks
+# every PROFILE_INTERVAL_MS; "cprofile": .prof files), keeping those slower than
+# PROFILE_SLOW_MS in PROFILE_DIR. 0 disables profiling.
+PROFILE_MODE = "sample"
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_SLOW_MS = 1000
+PROFILE_INTERVAL_MS = 5
+PROFILE_DIR = "logs/profiles"
+
+# Serving
+# Threads running CPU-bound pipeline stages for async requests
+PIPELINE_WORKERS = 4
+# Most queries accepted by one POST /query/batch request (larger ones get a 422)
+MAX_BATCH_QUERIES = 64
+
+# Metrics / interaction logs: buffered records, flushed in batches of
+# LOG_BATCH_SIZE or every LOG_FLUSH_INTERVAL_SECONDS; LOG_FSYNC is "none",
+# "batch" or "interval" (every LOG_FSYNC_INTERVAL_SECONDS)
+LOG_BUFFER_RECORDS = 10000
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL_SECONDS = 1.0
+LOG_FSYNC = "none"
+LOG_FSYNC_INTERVAL_SECONDS = 5.0
 
 # App
 APP_NAME = "SaaS-Product-Intelligence"
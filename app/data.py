@@ -1,8 +1,117 @@
-"""Data validation, ingestion, and versioning."""
-import json
+"""Data validation, streaming typed loading, and versioning.
+
+`DataLoader` parses CSV and JSON (arrays or JSON Lines) `chunk_rows` records
+at a time into typed NumPy columns (see `to_column`). The schema is checked
+once per chunk, against the CSV header or the chunk's JSON keys, not per
+row. `iter_chunks` keeps memory proportional to one chunk; `load_columns`
+concatenates the chunks and caches the result in a byte-bounded LRU keyed
+by path and invalidated when the file's mtime or size changes.
+"""
+import csv
+import os
 from datetime import datetime
-from typing import Dict, List, Any
-import hashlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+
+from app.cache import ByteLRUCache
+from app.fingerprints import FingerprintTable, digest
+from app.sources import iter_json_records
+
+Columns = Dict[str, np.ndarray]
+
+# Date-like columns by name; everything else is numeric if it parses, else text
+DAY_COLUMNS = ("date", "signup_date")
+TIMESTAMP_COLUMNS = ("event_timestamp", "timestamp", "created_at")
+
+# Required columns of the known structured exports, by file stem
+SCHEMAS: Dict[str, Set[str]] = {
+    "daily_metrics": {"date", "metric_name", "value"},
+    "events": {"user_id", "event_name", "event_timestamp"},
+    "users": {"user_id", "account_id"},
+    "accounts": {"account_id"},
+}
+
+CHUNK_ROWS = 65536
+CACHE_BYTES = 256 * 1024 * 1024
+
+
+def _is_number(value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _infer_kind(name: str, values: List[Any]) -> str:
+    if name in DAY_COLUMNS:
+        return "day"
+    if name in TIMESTAMP_COLUMNS:
+        return "timestamp"
+    present = [v for v in values if v not in ("", None)]
+    if all(_is_number(v) for v in present):
+        return "float"
+    return "str" if all(isinstance(v, str) for v in present) else "object"
+
+
+def _concat(parts: List[np.ndarray]) -> np.ndarray:
+    """Concatenate chunk columns, falling back to object dtype if their types differ."""
+    try:
+        return np.concatenate(parts)
+    except (TypeError, ValueError):
+        return np.concatenate([p.astype(object) for p in parts])
+
+
+def to_column(values: List[Any], kind: str) -> np.ndarray:
+    """Convert raw values to a typed column: "day" / "timestamp" (datetime64,
+    NaT for blanks), "float" (NaN for blanks), "str" or "object".
+
+    Values that do not parse as `kind` leave the column as text.
+    """
+    try:
+        if kind in ("day", "timestamp"):
+            times = np.array(
+                [str(v).rstrip("Z") if v not in ("", None) else "NaT" for v in values],
+                dtype="datetime64[s]",
+            )
+            return times.astype("datetime64[D]") if kind == "day" else times
+        if kind == "float":
+            return np.array([float(v) if v not in ("", None) else np.nan for v in values], dtype=np.float64)
+    except (TypeError, ValueError):
+        kind = "str"
+    if kind == "str":
+        return np.array(["" if v is None else str(v) for v in values], dtype=str)
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+
+def _blank(n: int, dtype: np.dtype) -> np.ndarray:
+    """`n` missing values of a column type: NaT, NaN, "" or None."""
+    if dtype.kind == "M":
+        return np.full(n, "NaT", dtype=dtype)
+    if dtype.kind == "f":
+        return np.full(n, np.nan)
+    if dtype.kind == "U":
+        return np.full(n, "", dtype=dtype)
+    return np.full(n, None, dtype=object)
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate bytes held by cached columns or documents."""
+    if isinstance(value, dict):
+        return sum(_sizeof(col) for col in value.values())
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(len(str(v)) for v in value)
+        return value.nbytes
+    return sum(len(s) + 49 for s in value)
 
 
 class DataValidator:
@@ -12,26 +121,46 @@ class DataValidator:
         self.version = datetime.utcnow().isoformat()
         self.checksums = {}
 
-    def validate_structured_data(self, data: List[Dict[str, Any]]) -> bool:
-        """Validate structured data schema."""
-        required_keys = {"date", "metric", "value"}
-        for row in data:
-            if not required_keys.issubset(set(row.keys())):
-                return False
-        return True
+    def validate_columns(self, columns: Iterable[str], required: Iterable[str]) -> bool:
+        """Check a header (or a chunk's keys) once for the required columns."""
+        return set(columns) >= set(required)
+
+    def validate_structured_data(self, data, required: Optional[Iterable[str]] = None) -> bool:
+        """Validate structured data schema: typed columns or a list of row dicts."""
+        required = {"date", "metric", "value"} if required is None else set(required)
+        if isinstance(data, dict):
+            return self.validate_columns(data, required)
+        return all(row.keys() >= required for row in data)
 
     def validate_documents(self, docs: List[str]) -> bool:
         """Validate unstructured documents."""
         return all(isinstance(d, str) and len(d.strip()) > 0 for d in docs)
 
-    def detect_drift(self, old_docs: List[str], new_docs: List[str]) -> Dict[str, Any]:
-        """Detect data drift by comparing doc distributions."""
-        old_hash = hashlib.md5("\n".join(sorted(old_docs)).encode()).hexdigest()
-        new_hash = hashlib.md5("\n".join(sorted(new_docs)).encode()).hexdigest()
+    def detect_drift(self, old_docs, new_docs) -> Dict[str, Any]:
+        """
+        Detect data drift between two corpora by per-document fingerprints.
+
+        Lists are keyed by content, so an edited document shows up as one
+        removal plus one addition; dicts (key -> text) also report
+        modifications. For repeated checks against a persisted baseline use
+        FingerprintTable directly (app/fingerprints.py), which only revisits
+        changed documents.
+        """
+        old, new = (
+            FingerprintTable.from_documents(
+                docs.items() if isinstance(docs, dict) else ((digest(d).hex(), d) for d in docs)
+            )
+            for docs in (old_docs, new_docs)
+        )
+        report = new.drift_report(old)
         return {
-            "drifted": old_hash != new_hash,
-            "old_hash": old_hash,
-            "new_hash": new_hash,
+            "drifted": report["changed"],
+            "added": report["added"],
+            "removed": report["removed"],
+            "modified": report["modified"],
+            "token_js_divergence": report["token_js_divergence"],
+            "old_hash": report["old_root"],
+            "new_hash": report["new_root"],
             "timestamp": datetime.utcnow().isoformat(),
         }
 
@@ -41,46 +170,139 @@ class DataValidator:
 
 
 class DataLoader:
-    """Loads and caches data from sources."""
+    """Streams data files into typed column chunks, with a bounded, mtime-checked cache."""
 
-    def __init__(self, base_path: str = "data"):
+    def __init__(
+        self,
+        base_path: str = "data",
+        chunk_rows: int = CHUNK_ROWS,
+        cache_bytes: int = CACHE_BYTES,
+    ):
         self.base_path = base_path
-        self.cache = {}
+        self.chunk_rows = chunk_rows
+        self.cache = ByteLRUCache(cache_bytes, sizeof=lambda item: _sizeof(item[1]))
         self.validator = DataValidator()
 
-    def load_documents(self, path: str) -> List[str]:
-        """Load unstructured documents from file."""
-        if path in self.cache:
-            return self.cache[path]
+    def _cached(self, key, path: str) -> Optional[Any]:
+        """Cached value for `key`, or None if absent or `path` changed since."""
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.cache.pop(key)
+            return None
+        if item[0] != (st.st_mtime_ns, st.st_size):
+            self.cache.pop(key)
+            return None
+        return item[1]
+
+    @staticmethod
+    def _stamp(path: str):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def iter_chunks(self, path: str, required: Optional[Iterable[str]] = None) -> Iterator[Columns]:
+        """
+        Yield typed column chunks of up to `chunk_rows` records from a CSV,
+        JSON array or JSON Lines file.
+
+        `required` defaults to the file's entry in SCHEMAS; a chunk missing a
+        required column stops the load. Column types are inferred from the
+        first chunk and reused for the rest.
+        """
+        required = set(SCHEMAS.get(Path(path).stem, ()) if required is None else required)
+        kinds: Dict[str, str] = {}
+        if str(path).endswith(".csv"):
+            chunks = self._csv_chunks(path, required)
+        else:
+            chunks = self._json_chunks(path, required)
+        for raw in chunks:
+            for name, values in raw.items():
+                if name not in kinds:
+                    kinds[name] = _infer_kind(name, values)
+            yield {name: to_column(values, kinds[name]) for name, values in raw.items()}
+
+    def _csv_chunks(self, path: str, required: Set[str]) -> Iterator[Dict[str, List[str]]]:
+        with open(path, "r", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            if not self.validator.validate_columns(header, required):
+                print(f"Schema error in {path}: missing columns {sorted(required - set(header))}")
+                return
+            width = len(header)
+            while True:
+                rows = [row for _, row in zip(range(self.chunk_rows), reader)]
+                if not rows:
+                    return
+                good = [row for row in rows if len(row) == width]
+                if len(good) < len(rows):
+                    print(f"Skipping {len(rows) - len(good)} malformed rows in {path}")
+                yield {name: [row[i] for row in good] for i, name in enumerate(header)}
+
+    def _json_chunks(self, path: str, required: Set[str]) -> Iterator[Dict[str, List[Any]]]:
+        records = iter_json_records(path)
+        while True:
+            chunk = [r for _, r in zip(range(self.chunk_rows), records) if isinstance(r, dict)]
+            if not chunk:
+                return
+            keys: Dict[str, None] = {}
+            for record in chunk:
+                keys.update(dict.fromkeys(record))
+            if not self.validator.validate_columns(keys, required):
+                print(f"Schema error in {path}: missing columns {sorted(required - set(keys))}")
+                return
+            yield {k: [r.get(k) for r in chunk] for k in keys}
 
+    def load_columns(self, path: str, required: Optional[Iterable[str]] = None) -> Columns:
+        """Whole file as typed columns (cached until the file changes); {} on error."""
+        path = str(path)
+        key = (path, None if required is None else frozenset(required))
+        cached = self._cached(key, path)
+        if cached is not None:
+            return cached
         try:
-            with open(path, "r") as f:
-                content = f.read().strip()
-            docs = [line.strip() for line in content.split("\n") if line.strip()]
-            if self.validator.validate_documents(docs):
-                self.cache[path] = docs
-                return docs
-        except Exception as e:
+            stamp = self._stamp(path)
+            parts: Dict[str, List[np.ndarray]] = {}
+            rows = 0
+            for chunk in self.iter_chunks(path, required):
+                n = len(next(iter(chunk.values()), ()))
+                # Columns absent from some chunks (JSON) are filled with blanks
+                for name in parts.keys() - chunk.keys():
+                    parts[name].append(_blank(n, parts[name][0].dtype))
+                for name, col in chunk.items():
+                    if name not in parts and rows:
+                        parts[name] = [_blank(rows, col.dtype)]
+                    parts.setdefault(name, []).append(col)
+                rows += n
+        except (OSError, ValueError) as e:
             print(f"Error loading {path}: {e}")
+            return {}
+        columns = {name: _concat(cols) for name, cols in parts.items()}
+        if columns:
+            self.cache.set(key, (stamp, columns))
+        return columns
 
-        return []
+    def load_structured_csv(self, path: str, required: Optional[Iterable[str]] = None) -> Columns:
+        """Load structured data from CSV as typed columns."""
+        return self.load_columns(path, required)
 
-    def load_structured_csv(self, path: str) -> List[Dict[str, Any]]:
-        """Load structured data from CSV."""
-        if path in self.cache:
-            return self.cache[path]
+    def load_documents(self, path: str) -> List[str]:
+        """Load unstructured documents (one per non-empty line) from file."""
+        cached = self._cached(path, path)
+        if cached is not None:
+            return cached
 
         try:
-            import csv
-
-            data = []
+            stamp = self._stamp(path)
             with open(path, "r") as f:
-                reader = csv.DictReader(f)
-                data = list(reader)
-
-            if self.validator.validate_structured_data(data):
-                self.cache[path] = data
-                return data
+                docs = [line.strip() for line in f if line.strip()]
+            if self.validator.validate_documents(docs):
+                self.cache.set(path, (stamp, docs))
+                return docs
         except Exception as e:
             print(f"Error loading {path}: {e}")
 
@@ -1,23 +1,405 @@
-"""Feedback collection and logging."""
+"""Feedback collection and logging.
+
+Interactions are appended to a JSONL log, and their ids are registered in a
+SQLite table so feedback can check the interaction exists with one indexed
+lookup. With a background writer, ids are registered in one batch per
+written log batch, on the writer thread, so answering a query does no
+SQLite I/O; interactions logged before ids were registered are backfilled
+from the log once. User feedback on an interaction is an append-only event in a second
+table indexed by interaction id (WAL mode, so several server processes can
+write concurrently), and is joined onto interactions when logs are read.
+
+`FeedbackStats` keeps running aggregates over both: it consumes only what was
+appended since its last refresh (a byte offset into the log, a sequence
+number into the events table), keeps per-minute buckets for time windows,
+and checkpoints its state to a small JSON file so restarts resume from there.
+"""
 import json
-from datetime import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Any, Optional
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 import uuid
 
+import numpy as np
+
+from app.log_reader import Timestamp, iter_lines, iter_records, json_loads
+from app.log_writer import BackgroundLogWriter
+
+# SQLite's default limit on host parameters per statement is 999
+_MAX_SQL_PARAMS = 900
+
+
+class FeedbackStore:
+    """Append-only feedback events in SQLite, looked up by interaction id."""
+
+    def __init__(self, db_path: str = "logs/feedback.db", busy_timeout: float = 5.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        # sqlite3 connections are not shared across threads; keep one per thread
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback_events ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " interaction_id TEXT NOT NULL,"
+                " helpful INTEGER NOT NULL,"
+                " feedback TEXT,"
+                " timestamp TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS feedback_events_interaction"
+                " ON feedback_events (interaction_id, seq)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS interactions ("
+                " interaction_id TEXT PRIMARY KEY,"
+                " timestamp TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=self.busy_timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_interaction(self, interaction_id: str, timestamp: str) -> None:
+        """Register a logged interaction id."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO interactions (interaction_id, timestamp) VALUES (?, ?)",
+                (interaction_id, timestamp),
+            )
+
+    def add_interactions(self, interactions: Iterable[Tuple[str, str]]) -> None:
+        """Register (interaction_id, timestamp) pairs in one transaction."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO interactions (interaction_id, timestamp) VALUES (?, ?)",
+                interactions,
+            )
+
+    def backfill_interactions(self, name: str, interactions: Iterable[Tuple[str, str]]) -> bool:
+        """Register `interactions` unless the backfill `name` already ran; True if it ran now."""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+            return False
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO interactions (interaction_id, timestamp) VALUES (?, ?)",
+                interactions,
+            )
+            conn.execute("INSERT OR IGNORE INTO migrations (name) VALUES (?)", (name,))
+        return True
+
+    def has_interaction(self, interaction_id: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM interactions WHERE interaction_id = ?", (interaction_id,)
+        ).fetchone()
+        return row is not None
+
+    def add(self, interaction_id: str, helpful: bool, feedback: Optional[str] = None) -> None:
+        """Append one feedback event (a single indexed insert)."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO feedback_events (interaction_id, helpful, feedback, timestamp)"
+                " VALUES (?, ?, ?, ?)",
+                (interaction_id, int(helpful), feedback, datetime.utcnow().isoformat()),
+            )
+
+    def latest(self, interaction_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Most recent feedback per interaction id, as stored in `user_feedback`."""
+        ids = list(dict.fromkeys(interaction_ids))
+        conn = self._connect()
+        result: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(ids), _MAX_SQL_PARAMS):
+            chunk = ids[start:start + _MAX_SQL_PARAMS]
+            rows = conn.execute(
+                "SELECT interaction_id, helpful, feedback, timestamp FROM feedback_events"
+                f" WHERE interaction_id IN ({','.join('?' * len(chunk))}) ORDER BY seq",
+                chunk,
+            )
+            for interaction_id, helpful, feedback, timestamp in rows:
+                result[interaction_id] = {
+                    "helpful": bool(helpful),
+                    "feedback": feedback,
+                    "feedback_timestamp": timestamp,
+                }
+        return result
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM feedback_events").fetchone()[0]
+
+    def events_since(self, seq: int, limit: int = 10000) -> List[Tuple[int, str, bool, str]]:
+        """(seq, interaction_id, helpful, timestamp) of events after `seq`, oldest first."""
+        rows = self._connect().execute(
+            "SELECT seq, interaction_id, helpful, timestamp FROM feedback_events"
+            " WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, limit),
+        )
+        return [(s, i, bool(h), t) for s, i, h, t in rows]
+
+    def previous_feedback(self, interaction_id: str, seq: int) -> Optional[Tuple[bool, str]]:
+        """(helpful, timestamp) of the interaction's feedback before event `seq`, or None."""
+        row = self._connect().execute(
+            "SELECT helpful, timestamp FROM feedback_events WHERE interaction_id = ? AND seq < ?"
+            " ORDER BY seq DESC LIMIT 1",
+            (interaction_id, seq),
+        ).fetchone()
+        return None if row is None else (bool(row[0]), row[1])
+
+
+# Aggregate columns
+_TOTAL, _REFUSED, _CONFIDENCE, _FEEDBACK, _HELPFUL = range(5)
+
+STATS_WINDOWS = {"1h": 3600, "24h": 86400}
+
+
+def _epoch(timestamp: Optional[str]) -> float:
+    """Seconds since the epoch for the naive-UTC ISO timestamps the logs use."""
+    try:
+        return datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class FeedbackStats:
+    """Incrementally maintained interaction and feedback aggregates.
+
+    `refresh()` reads only the log bytes and feedback events added since the
+    previous refresh, so `summary()` costs the same however large the logs
+    grow. Aggregates are all-time plus windows (STATS_WINDOWS) built from
+    per-minute buckets covering the longest window.
+    """
+
+    def __init__(
+        self,
+        log_path: Path,
+        store: FeedbackStore,
+        checkpoint_path: Optional[Path] = None,
+        bucket_seconds: int = 60,
+        windows: Optional[Dict[str, int]] = None,
+        checkpoint_interval: float = 30.0,
+    ):
+        self.log_path = Path(log_path)
+        self.store = store
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.bucket_seconds = bucket_seconds
+        self.windows = dict(STATS_WINDOWS if windows is None else windows)
+        self.checkpoint_interval = checkpoint_interval
+        num_buckets = max(self.windows.values(), default=0) // bucket_seconds + 1
+
+        self._lock = threading.Lock()
+        self._reset(num_buckets)
+        self._last_checkpoint = time.monotonic()
+        self._load_checkpoint()
+
+    def _reset(self, num_buckets: int) -> None:
+        self.offset = 0
+        self.seq = 0
+        self.totals = np.zeros(5, dtype=np.float64)
+        self._buckets = np.zeros((num_buckets, 5), dtype=np.float64)
+        self._bucket_ids = np.full(num_buckets, -1, dtype=np.int64)
+
+    def _add(self, timestamp: float, values: np.ndarray) -> None:
+        self.totals += values
+        bucket = int(timestamp // self.bucket_seconds)
+        slot = bucket % len(self._bucket_ids)
+        if self._bucket_ids[slot] > bucket:
+            return  # older than every window
+        if self._bucket_ids[slot] < bucket:
+            self._bucket_ids[slot] = bucket
+            self._buckets[slot] = 0
+        self._buckets[slot] += values
+
+    def refresh(self) -> None:
+        """Fold in interactions and feedback appended since the last refresh."""
+        with self._lock:
+            try:
+                size = self.log_path.stat().st_size
+            except OSError:
+                size = 0
+            if size < self.offset:
+                # The log was truncated or replaced: start over
+                self._reset(len(self._bucket_ids))
+            if size > self.offset:
+                self._consume_log()
+            self._consume_feedback()
+            if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self._save_checkpoint()
+
+    def _consume_log(self) -> None:
+        loads = json_loads()
+        # Only complete lines; a partially written record is read next time
+        for line, self.offset in iter_lines(self.log_path, self.offset):
+            try:
+                record = loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            values = np.zeros(5)
+            values[_TOTAL] = 1
+            values[_REFUSED] = bool(record.get("refused", False))
+            values[_CONFIDENCE] = record.get("confidence", 0) or 0
+            feedback = record.get("user_feedback") or {}
+            if feedback:
+                values[_FEEDBACK] = 1
+                values[_HELPFUL] = bool(feedback.get("helpful", False))
+            self._add(_epoch(record.get("timestamp")), values)
+
+    def _consume_feedback(self) -> None:
+        while True:
+            events = self.store.events_since(self.seq)
+            for seq, interaction_id, helpful, timestamp in events:
+                # Only an interaction's latest feedback counts: it moves out of
+                # the bucket of the event it replaces and into this event's
+                previous = self.store.previous_feedback(interaction_id, seq)
+                if previous is not None:
+                    previous_helpful, previous_timestamp = previous
+                    values = np.zeros(5)
+                    values[_FEEDBACK] = -1
+                    values[_HELPFUL] = -int(previous_helpful)
+                    self._add(_epoch(previous_timestamp), values)
+                values = np.zeros(5)
+                values[_FEEDBACK] = 1
+                values[_HELPFUL] = helpful
+                self._add(_epoch(timestamp), values)
+                self.seq = seq
+            if not events:
+                return
+
+    @staticmethod
+    def _rates(values: np.ndarray) -> Dict[str, Any]:
+        total, feedback = values[_TOTAL], values[_FEEDBACK]
+        return {
+            "total_interactions": int(total),
+            "refused_rate": values[_REFUSED] / total if total > 0 else 0,
+            "feedback_rate": feedback / total if total > 0 else 0,
+            "helpful_rate": values[_HELPFUL] / feedback if feedback > 0 else 0,
+            "avg_confidence": values[_CONFIDENCE] / total if total > 0 else 0,
+        }
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """All-time rates plus the same rates per window."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stats = self._rates(self.totals)
+            current = int(now // self.bucket_seconds)
+            stats["windows"] = {}
+            for name, seconds in self.windows.items():
+                live = self._bucket_ids > current - seconds // self.bucket_seconds
+                stats["windows"][name] = self._rates(self._buckets[live].sum(axis=0))
+        return stats
+
+    def save_checkpoint(self) -> None:
+        with self._lock:
+            self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        self._last_checkpoint = time.monotonic()
+        if self.checkpoint_path is None:
+            return
+        live = self._bucket_ids >= 0
+        state = {
+            "offset": self.offset,
+            "seq": self.seq,
+            "totals": self.totals.tolist(),
+            "bucket_seconds": self.bucket_seconds,
+            "buckets": dict(zip(map(str, self._bucket_ids[live].tolist()), self._buckets[live].tolist())),
+        }
+        fd, tmp = tempfile.mkstemp(dir=str(self.checkpoint_path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.checkpoint_path)
+        except OSError as e:
+            print(f"Failed to save feedback stats checkpoint {self.checkpoint_path}: {e}")
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def _load_checkpoint(self) -> None:
+        if self.checkpoint_path is None or not self.checkpoint_path.exists():
+            return
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                state = json.load(f)
+            if state["bucket_seconds"] != self.bucket_seconds:
+                raise ValueError("bucket size changed")
+            self.offset, self.seq = int(state["offset"]), int(state["seq"])
+            self.totals = np.asarray(state["totals"], dtype=np.float64)
+            for bucket, values in state["buckets"].items():
+                slot = int(bucket) % len(self._bucket_ids)
+                if int(bucket) > self._bucket_ids[slot]:
+                    self._bucket_ids[slot] = int(bucket)
+                    self._buckets[slot] = values
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring feedback stats checkpoint {self.checkpoint_path}: {e}")
+            self._reset(len(self._bucket_ids))
+
 
 class FeedbackCollector:
     """Collects and logs user feedback for continuous improvement."""
 
-    def __init__(self, log_path: str = "logs/feedback.jsonl"):
+    def __init__(
+        self,
+        log_path: str = "logs/feedback.jsonl",
+        writer: Optional[BackgroundLogWriter] = None,
+        store: Optional[FeedbackStore] = None,
+    ):
         self.log_path = Path(log_path)
         self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = writer
+        self.store = store if store is not None else FeedbackStore(
+            str(self.log_path.with_suffix(".db"))
+        )
+        self.stats = FeedbackStats(
+            self.log_path, self.store, self.log_path.with_suffix(".stats.json")
+        )
+        self._backfill_interactions()
+        if self.writer is not None:
+            self.writer.add_listener(self._register_interactions)
+
+    def _backfill_interactions(self) -> None:
+        """Register the ids of interactions logged before ids were registered (runs once)."""
+        records = iter_records(self.log_path)
+        ran = self.store.backfill_interactions(
+            f"interactions:{self.log_path}",
+            (
+                (r["interaction_id"], r.get("timestamp") or "")
+                for r in records
+                if isinstance(r.get("interaction_id"), str)
+            ),
+        )
+        if ran and self.log_path.exists():
+            print(f"Registered logged interaction ids from {self.log_path}")
+
+    def _register_interactions(self, batch: List[Tuple[Path, Dict[str, Any]]]) -> None:
+        """Writer listener: register the ids of interactions it just wrote."""
+        interactions = [
+            (record["interaction_id"], record["timestamp"])
+            for path, record in batch
+            if path == self.log_path and "interaction_id" in record
+        ]
+        if interactions:
+            self.store.add_interactions(interactions)
 
     def log_interaction(
         self,
         query: str,
         answer: Dict[str, Any],
         user_feedback: Optional[Dict[str, Any]] = None,
+        interaction_id: Optional[str] = None,
     ) -> str:
         """
         Log a query-answer interaction and optional user feedback.
@@ -26,11 +408,13 @@ class FeedbackCollector:
             query: user query
             answer: response from reasoning layer
             user_feedback: {"helpful": bool, "corrected_answer": str, "rating": int}
+            interaction_id: id to log under (the pipeline passes its query_id);
+                a new uuid if not given
 
         Returns:
             interaction_id for tracking
         """
-        interaction_id = str(uuid.uuid4())
+        interaction_id = interaction_id or str(uuid.uuid4())
 
         record = {
             "interaction_id": interaction_id,
@@ -43,74 +427,103 @@ class FeedbackCollector:
             "user_feedback": user_feedback or {},
         }
 
-        # Append to JSONL log
-        with open(self.log_path, "a") as f:
-            f.write(json.dumps(record) + "\n")
+        # Append to JSONL log; the writer registers the id once the record is written
+        if self.writer is not None:
+            self.writer.write(self.log_path, record)
+        else:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self.store.add_interaction(interaction_id, record["timestamp"])
 
         return interaction_id
 
-    def load_feedback_logs(self, limit: int = 1000) -> list:
-        """Load recent feedback logs for analysis."""
-        logs = []
-        if not self.log_path.exists():
-            return logs
-
-        with open(self.log_path, "r") as f:
-            for i, line in enumerate(f):
-                if i >= limit:
-                    break
-                try:
-                    logs.append(json.loads(line))
-                except json.JSONDecodeError:
-                    pass
+    def iter_feedback_logs(
+        self,
+        since: Timestamp = None,
+        until: Timestamp = None,
+        newest_first: bool = True,
+        join_batch: int = 512,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yield logged interactions with feedback events joined in.
+
+        Reads the log in blocks (backward by default, newest first) and joins
+        feedback `join_batch` records at a time, so memory stays constant
+        however long the log is. `since` / `until` bound the records'
+        timestamps (see log_reader.iter_records).
+        """
+        if self.writer is not None:
+            self.writer.flush()
 
+        records = iter_records(self.log_path, since, until, newest_first=newest_first)
+        while True:
+            batch = list(islice(records, join_batch))
+            if not batch:
+                return
+            feedback = self.store.latest(r.get("interaction_id") for r in batch)
+            for record in batch:
+                if record.get("interaction_id") in feedback:
+                    record["user_feedback"] = feedback[record["interaction_id"]]
+                yield record
+
+    def load_feedback_logs(self, limit: int = 1000, since: Timestamp = None) -> list:
+        """The `limit` most recent logged interactions, oldest first, with feedback joined in."""
+        logs = list(islice(self.iter_feedback_logs(since=since), limit))
+        logs.reverse()
         return logs
 
     def get_feedback_stats(self) -> Dict[str, Any]:
-        """Compute feedback statistics for monitoring."""
-        logs = self.load_feedback_logs()
-        if not logs:
+        """Compute feedback statistics for monitoring (all-time and windowed).
+
+        Only records appended since the previous call are read; interactions
+        still buffered in the background writer are counted once written.
+        """
+        self.stats.refresh()
+        stats = self.stats.summary()
+        if not stats["total_interactions"]:
             return {"total": 0}
+        return stats
 
-        total = len(logs)
-        refused = sum(1 for l in logs if l.get("refused", False))
-        with_feedback = sum(1 for l in logs if l.get("user_feedback", {}))
-        helpful = sum(
-            1 for l in logs if l.get("user_feedback", {}).get("helpful", False)
-        )
+    def add_interactions(self, interactions: Iterable[Tuple[str, str]]) -> None:
+        """Register (interaction_id, timestamp) pairs in one transaction."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO interactions (interaction_id, timestamp) VALUES (?, ?)",
+                interactions,
+            )
 
-        avg_confidence = (
-            sum(l.get("confidence", 0) for l in logs) / total if total > 0 else 0
-        )
+    def backfill_interactions(self, name: str, interactions: Iterable[Tuple[str, str]]) -> bool:
+        """Register `interactions` unless the backfill `name` already ran; True if it ran now."""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+            return False
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO interactions (interaction_id, timestamp) VALUES (?, ?)",
+                interactions,
+            )
+            conn.execute("INSERT OR IGNORE INTO migrations (name) VALUES (?)", (name,))
+        return True
 
-        return {
-            "total_interactions": total,
-            "refused_rate": refused / total if total > 0 else 0,
-            "feedback_rate": with_feedback / total if total > 0 else 0,
-            "helpful_rate": helpful / with_feedback if with_feedback > 0 else 0,
-            "avg_confidence": avg_confidence,
-        }
+    def has_interaction(self, interaction_id: str) -> bool:
+        """Whether `interaction_id` was logged, including records still buffered in the writer."""
+        if self.store.has_interaction(interaction_id):
+            return True
+        if self.writer is None or not self.writer.pending:
+            return False
+        self.writer.flush()
+        return self.store.has_interaction(interaction_id)
 
     def log_feedback(
         self, interaction_id: str, helpful: bool, feedback: Optional[str] = None
-    ) -> None:
-        """Update an interaction with user feedback."""
-        logs = self.load_feedback_logs(limit=10000)
-
-        # Find and update interaction
-        updated = False
-        for log in logs:
-            if log.get("interaction_id") == interaction_id:
-                log["user_feedback"] = {
-                    "helpful": helpful,
-                    "feedback": feedback,
-                    "feedback_timestamp": datetime.utcnow().isoformat(),
-                }
-                updated = True
-                break
-
-        if updated:
-            # Rewrite log file
-            with open(self.log_path, "w") as f:
-                for log in logs:
-                    f.write(json.dumps(log) + "\n")
+    ) -> bool:
+        """
+        Record user feedback on an interaction (an append; joined when logs are read).
+
+        Returns False, recording nothing, if no such interaction was logged.
+        """
+        if not self.has_interaction(interaction_id):
+            print(f"Feedback for unknown interaction {interaction_id}; ignored")
+            return False
+        self.store.add(interaction_id, helpful, feedback)
+        return True
@@ -0,0 +1,305 @@
+"""Per-document fingerprints with a Merkle-style rollup for incremental drift checks.
+
+A `FingerprintTable` maps document key -> blake2b digest of its text. Keys
+hash into NUM_BUCKETS buckets; a bucket's hash is the XOR of
+H(key, digest) over its entries, so adding, changing or removing a document
+updates one bucket in O(1), and the root (a hash of the bucket hashes)
+changes whenever any document does. Two tables are diffed by comparing
+roots, then bucket hashes, then only the keys of buckets that differ, so a
+drift check touches changed buckets (about n / NUM_BUCKETS keys each), not
+the whole corpus.
+
+The table also keeps the aggregates that distribution-level drift needs,
+updated per changed document:
+- a hashed token histogram (TOKEN_BINS bins); each document's bin counts
+  are kept so they can be subtracted when it changes or is removed
+- the running sum and count of document embeddings the caller adds or
+  removes (`add_embeddings` / `remove_embeddings`), for the centroid
+
+Tables persist to a single .npz file between runs (`save` / `load`),
+together with the (mtime, size) stamps of the source files they were built
+from, so unchanged sources can be skipped on re-ingestion.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+NUM_BUCKETS = 4096
+TOKEN_BINS = 4096
+_DIGEST_SIZE = 16
+_TOKEN = re.compile(r"\w+")
+
+# A document's token histogram, sparse: (bins, counts)
+Sketch = Tuple[np.ndarray, np.ndarray]
+
+
+def digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=_DIGEST_SIZE).digest()
+
+
+def _bucket(key: str) -> int:
+    return zlib.crc32(key.encode("utf-8")) % NUM_BUCKETS
+
+
+def _entry_hash(key: str, doc_digest: bytes) -> int:
+    h = hashlib.blake2b(key.encode("utf-8") + b"\0" + doc_digest, digest_size=_DIGEST_SIZE)
+    return int.from_bytes(h.digest(), "little")
+
+
+def file_stamp(path: str) -> Optional[List[int]]:
+    """[mtime_ns, size] of a file, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def token_sketch(text: str) -> Sketch:
+    """Token counts of `text` folded into TOKEN_BINS stable hash bins."""
+    bins: Counter = Counter()
+    for token, n in Counter(_TOKEN.findall(text.lower())).items():
+        bins[zlib.crc32(token.encode("utf-8")) % TOKEN_BINS] += n
+    return (
+        np.fromiter(bins.keys(), dtype=np.uint16, count=len(bins)),
+        np.fromiter(bins.values(), dtype=np.uint32, count=len(bins)),
+    )
+
+
+def js_divergence(p: np.ndarray, q: np.ndarray) -> float:
+    """Jensen-Shannon divergence (base 2, in [0, 1]) between two count vectors."""
+    p = p / p.sum() if p.sum() else p.astype(np.float64)
+    q = q / q.sum() if q.sum() else q.astype(np.float64)
+    m = (p + q) / 2
+
+    def kl(a):
+        nz = a > 0
+        return float(np.sum(a[nz] * np.log2(a[nz] / m[nz])))
+
+    return (kl(p) + kl(q)) / 2
+
+
+class FingerprintTable:
+    """Document fingerprints, bucket/root rollup and incremental distribution aggregates."""
+
+    def __init__(self):
+        self.digests: Dict[str, bytes] = {}
+        self.sketches: Dict[str, Sketch] = {}
+        self.sources: Dict[str, List[int]] = {}
+        self.token_counts = np.zeros(TOKEN_BINS, dtype=np.int64)
+        self.emb_sum: Optional[np.ndarray] = None
+        self.emb_count = 0
+        self._buckets = [0] * NUM_BUCKETS
+        self._bucket_keys: List[Set[str]] = [set() for _ in range(NUM_BUCKETS)]
+
+    @classmethod
+    def from_documents(
+        cls, documents: Iterable[Tuple[str, str]], embeddings: Optional[np.ndarray] = None
+    ) -> "FingerprintTable":
+        table = cls()
+        for key, text in documents:
+            table.update(key, text)
+        if embeddings is not None and len(embeddings):
+            table.add_embeddings(embeddings)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.digests
+
+    @property
+    def root(self) -> str:
+        """Hash over all bucket hashes: equal roots mean identical tables."""
+        h = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+        for value in self._buckets:
+            h.update(value.to_bytes(_DIGEST_SIZE, "little"))
+        return h.hexdigest()
+
+    # Incremental updates
+
+    def _toggle(self, key: str, doc_digest: bytes) -> None:
+        """XOR an entry into (or out of) its bucket."""
+        b = _bucket(key)
+        self._buckets[b] ^= _entry_hash(key, doc_digest)
+        keys = self._bucket_keys[b]
+        if key in keys:
+            keys.remove(key)
+        else:
+            keys.add(key)
+
+    def update(self, key: str, text: str) -> str:
+        """Record `key`'s current text; returns "added", "modified" or "unchanged"."""
+        new = digest(text)
+        old = self.digests.get(key)
+        if old == new:
+            return "unchanged"
+        if old is not None:
+            self._drop(key, old)
+        self.digests[key] = new
+        self._toggle(key, new)
+        sketch = token_sketch(text)
+        self.sketches[key] = sketch
+        np.add.at(self.token_counts, sketch[0], sketch[1])
+        return "added" if old is None else "modified"
+
+    def remove(self, key: str) -> bool:
+        old = self.digests.pop(key, None)
+        if old is None:
+            return False
+        self._drop(key, old)
+        return True
+
+    def _drop(self, key: str, old: bytes) -> None:
+        self.digests.pop(key, None)
+        self._toggle(key, old)
+        bins, counts = self.sketches.pop(key)
+        np.subtract.at(self.token_counts, bins, counts)
+
+    def add_embeddings(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float64)
+        if self.emb_sum is None:
+            self.emb_sum = np.zeros(vectors.shape[1])
+        self.emb_sum += vectors.sum(axis=0)
+        self.emb_count += len(vectors)
+
+    def remove_embeddings(self, vectors: np.ndarray) -> None:
+        if self.emb_sum is None or not len(vectors):
+            return
+        self.emb_sum -= np.asarray(vectors, dtype=np.float64).sum(axis=0)
+        self.emb_count -= len(vectors)
+
+    @property
+    def centroid(self) -> Optional[np.ndarray]:
+        if self.emb_sum is None or self.emb_count <= 0:
+            return None
+        return self.emb_sum / self.emb_count
+
+    # Source stamps
+
+    def source_unchanged(self, path: str) -> bool:
+        """True if `path` has the same (mtime, size) as when last marked."""
+        stamp = file_stamp(path)
+        return stamp is not None and self.sources.get(path) == stamp
+
+    def mark_source(self, path: str, stamp: Optional[List[int]] = None) -> None:
+        """Record `path`'s stamp (taken now unless given, e.g. from before it was read)."""
+        stamp = stamp or file_stamp(path)
+        if stamp is not None:
+            self.sources[path] = stamp
+
+    # Comparison
+
+    def diff(self, baseline: "FingerprintTable") -> Dict[str, List[str]]:
+        """Keys added, removed and modified relative to `baseline`.
+
+        Only buckets whose hashes differ are inspected.
+        """
+        added, removed, modified = [], [], []
+        if self.root == baseline.root:
+            return {"added": added, "removed": removed, "modified": modified}
+        for b in range(NUM_BUCKETS):
+            if self._buckets[b] == baseline._buckets[b]:
+                continue
+            mine, theirs = self._bucket_keys[b], baseline._bucket_keys[b]
+            added += mine - theirs
+            removed += theirs - mine
+            modified += [k for k in mine & theirs if self.digests[k] != baseline.digests[k]]
+        return {"added": sorted(added), "removed": sorted(removed), "modified": sorted(modified)}
+
+    def distribution_drift(self, baseline: "FingerprintTable") -> Dict[str, Optional[float]]:
+        """Token-distribution divergence and embedding-centroid shift vs `baseline`."""
+        shift = None
+        a, b = self.centroid, baseline.centroid
+        if a is not None and b is not None and a.shape == b.shape:
+            denom = np.linalg.norm(a) * np.linalg.norm(b)
+            shift = float(1.0 - a @ b / denom) if denom > 0 else None
+        return {
+            "token_js_divergence": js_divergence(self.token_counts, baseline.token_counts),
+            "centroid_cosine_distance": shift,
+        }
+
+    def drift_report(
+        self,
+        baseline: "FingerprintTable",
+        token_threshold: float = 0.05,
+        centroid_threshold: float = 0.05,
+    ) -> Dict[str, Any]:
+        """Document-level changes plus distribution drift, with a drifted flag for each."""
+        changes = self.diff(baseline)
+        dist = self.distribution_drift(baseline)
+        shift = dist["centroid_cosine_distance"]
+        return {
+            "changed": any(changes.values()),
+            **changes,
+            **dist,
+            "distribution_drifted": dist["token_js_divergence"] > token_threshold
+            or (shift is not None and shift > centroid_threshold),
+            "old_root": baseline.root,
+            "new_root": self.root,
+        }
+
+    # Persistence
+
+    def save(self, path: str) -> None:
+        """Write the table to `path` (.npz) atomically."""
+        path = Path(path)
+        keys = list(self.digests)
+        sketches = [self.sketches[k] for k in keys]
+        offsets = np.cumsum([0] + [len(s[0]) for s in sketches])
+        arrays = {
+            "keys": np.array(keys, dtype=str),
+            "digests": np.frombuffer(b"".join(self.digests[k] for k in keys), dtype=np.uint8).reshape(
+                -1, _DIGEST_SIZE
+            ),
+            "offsets": offsets.astype(np.int64),
+            "bins": np.concatenate([s[0] for s in sketches]) if keys else np.zeros(0, np.uint16),
+            "counts": np.concatenate([s[1] for s in sketches]) if keys else np.zeros(0, np.uint32),
+            "emb_sum": self.emb_sum if self.emb_sum is not None else np.zeros(0),
+            "emb_count": np.array(self.emb_count),
+            "sources": np.array(json.dumps(self.sources)),
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Failed to save fingerprints {path}: {e}")
+
+    @classmethod
+    def load(cls, path: str) -> Optional["FingerprintTable"]:
+        """Read a saved table; None if it is missing or unreadable."""
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError) as e:
+            if Path(path).exists():
+                print(f"Failed to load fingerprints {path}: {e}")
+            return None
+        table = cls()
+        offsets = arrays["offsets"]
+        for i, key in enumerate(arrays["keys"].tolist()):
+            d = arrays["digests"][i].tobytes()
+            table.digests[key] = d
+            table._toggle(key, d)
+            table.sketches[key] = (
+                arrays["bins"][offsets[i]:offsets[i + 1]],
+                arrays["counts"][offsets[i]:offsets[i + 1]],
+            )
+        np.add.at(table.token_counts, arrays["bins"], arrays["counts"])
+        if len(arrays["emb_sum"]):
+            table.emb_sum = arrays["emb_sum"].astype(np.float64)
+            table.emb_count = int(arrays["emb_count"])
+        table.sources = json.loads(str(arrays["sources"]))
+        return table
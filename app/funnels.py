@@ -0,0 +1,329 @@
+"""Vectorized funnel and cohort computation over the event log (events.csv).
+
+Events are held as compact typed columns (int32 user code, int16 event code,
+int64 epoch seconds), in sorted runs ordered by (user, timestamp). New
+events, read from the end of events.csv by `refresh()` or passed to
+`append()`, become a new run; runs are merged pairwise once the newest is at
+least half the size of the one before it, so there are O(log n) runs and
+each event is re-sorted O(log n) times.
+
+Funnels and cohorts are computed one user range at a time: each chunk
+gathers about `chunk_rows` events for a contiguous range of user codes from
+every run (a `searchsorted` per run), sorts them locally, and evaluates the
+steps with `searchsorted` / `np.unique` instead of per-user loops. Memory
+beyond the columns themselves stays proportional to `chunk_rows`.
+"""
+import csv
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.log_reader import iter_lines
+from app.metrics_engine import Table, _week_start
+
+CHUNK_ROWS = 1 << 20
+PERIODS = {"day": 86400, "week": 7 * 86400}
+
+# One sorted run of events: (user codes, event codes, epoch seconds)
+Run = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+_TIME_BITS = 32  # epoch seconds fit in 32 bits until 2106
+
+
+def _sorted_run(users: np.ndarray, events: np.ndarray, times: np.ndarray) -> Run:
+    order = np.lexsort((times, users))
+    return users[order], events[order], times[order]
+
+
+class FunnelEngine:
+    """Ordered funnels and retention cohorts over user events."""
+
+    def __init__(
+        self,
+        events_path: Optional[str] = None,
+        users: Optional[Table] = None,
+        accounts: Optional[Table] = None,
+        chunk_rows: int = CHUNK_ROWS,
+    ):
+        self.events_path = Path(events_path) if events_path else None
+        self.users = users
+        self.accounts = accounts
+        self.chunk_rows = chunk_rows
+        self.offset = 0
+        self.version = 0
+
+        self.user_ids: List[str] = []
+        self.event_names: List[str] = []
+        self._user_codes: Dict[str, int] = {}
+        self._event_codes: Dict[str, int] = {}
+        self._runs: List[Run] = []
+        self._columns: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(run[0]) for run in self._runs)
+
+    # Ingestion
+
+    def _encode(self, values: np.ndarray, codes: Dict[str, int], names: List[str], dtype) -> np.ndarray:
+        """Map strings to dense integer codes, looking up each distinct value once."""
+        uniq, inverse = np.unique(values, return_inverse=True)
+        mapped = np.empty(len(uniq), dtype=dtype)
+        for i, value in enumerate(uniq.tolist()):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(names)
+                names.append(value)
+            mapped[i] = code
+        return mapped[inverse]
+
+    def append(self, user_ids: Sequence[str], event_names: Sequence[str], timestamps: Sequence[Any]) -> int:
+        """Add events (ISO timestamps or datetime64); rows without a valid time are skipped."""
+        times = np.asarray(timestamps, dtype="datetime64[s]")
+        valid = ~np.isnat(times)
+        if not valid.any():
+            return 0
+        users = np.asarray(user_ids, dtype=str)[valid]
+        events = np.asarray(event_names, dtype=str)[valid]
+        with self._lock:
+            run = _sorted_run(
+                self._encode(users, self._user_codes, self.user_ids, np.int32),
+                self._encode(events, self._event_codes, self.event_names, np.int16),
+                times[valid].astype(np.int64),
+            )
+            self._runs.append(run)
+            while len(self._runs) > 1 and 2 * len(self._runs[-1][0]) >= len(self._runs[-2][0]):
+                newer, older = self._runs.pop(), self._runs.pop()
+                self._runs.append(_sorted_run(*(np.concatenate(cols) for cols in zip(older, newer))))
+            self.version += 1
+        return int(valid.sum())
+
+    def refresh(self) -> int:
+        """Append events written to `events_path` since the last call, `chunk_rows` at a time."""
+        if self.events_path is None or not self.events_path.exists():
+            return 0
+        with self._refresh_lock:
+            return self._read_appended()
+
+    def _read_appended(self) -> int:
+        added = 0
+        chunk: List[List[str]] = []
+        offset = self.offset
+        for line, next_offset in iter_lines(self.events_path, self.offset):
+            row = next(csv.reader([line.decode("utf-8")]))
+            if self._columns is None:
+                self._columns = {name: i for i, name in enumerate(row)}
+            else:
+                chunk.append(row)
+            offset = next_offset
+            if len(chunk) >= self.chunk_rows:
+                added += self._append_rows(chunk)
+                self.offset, chunk = offset, []
+        added += self._append_rows(chunk)
+        self.offset = offset
+        return added
+
+    def _append_rows(self, rows: List[List[str]]) -> int:
+        if not rows:
+            return 0
+        u, e, t = (self._columns[c] for c in ("user_id", "event_name", "event_timestamp"))
+        rows = [r for r in rows if len(r) > max(u, e, t)]
+        return self.append(
+            [r[u] for r in rows], [r[e] for r in rows], [r[t] or "NaT" for r in rows]
+        )
+
+    # Chunked scans
+
+    def _chunks(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+        """Yield (first user code, users, events, times) sorted by (user, time), per user range."""
+        runs = list(self._runs)
+        num_users = len(self.user_ids)
+        if not runs or not num_users:
+            return
+        per_user = sum(np.bincount(run[0], minlength=num_users) for run in runs)
+        cum = np.cumsum(per_user)
+        # User codes where each chunk of ~chunk_rows events ends
+        bounds = np.searchsorted(cum, np.arange(self.chunk_rows, cum[-1], self.chunk_rows), side="left") + 1
+        bounds = np.unique(np.concatenate([[0], bounds, [num_users]]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            parts = []
+            for users, events, times in runs:
+                a, b = np.searchsorted(users, [lo, hi], side="left")
+                parts.append((users[a:b], events[a:b], times[a:b]))
+            yield (int(lo), *_sorted_run(*(np.concatenate(cols) for cols in zip(*parts))))
+
+    def _event_code(self, name: Optional[str]) -> int:
+        """Code of `name` (-1 if never seen); None means any event (-2)."""
+        return -2 if name is None else self._event_codes.get(name, -1)
+
+    def _group_of(self, user_codes: np.ndarray, by: str) -> np.ndarray:
+        """The `by` attribute (users.csv or accounts.csv column) of each user code."""
+        out = np.full(len(user_codes), "unknown", dtype=object)
+        if self.users is None:
+            return out
+        rows = self.users.rows_for([self.user_ids[c] for c in user_codes])
+        known = rows >= 0
+        if by in self.users.columns:
+            out[known] = self.users.columns[by][rows[known]].astype(str)
+        elif self.accounts is not None and by in self.accounts.columns and "account_id" in self.users.columns:
+            acc = np.full(len(rows), -1)
+            acc[known] = self.accounts.rows_for(self.users.columns["account_id"][rows[known]])
+            has = acc >= 0
+            out[has] = self.accounts.columns[by][acc[has]].astype(str)
+        return out
+
+    # Queries
+
+    def funnel(
+        self,
+        steps: Sequence[str],
+        window_seconds: Optional[float] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+        by: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Ordered funnel: users who did steps[0], then steps[1] at or after it, ...
+
+        Users enter with their first steps[0] event in [start, end); each later
+        step is its first occurrence at or after the previous step, and within
+        `window_seconds` of entry if given. `by` breaks counts down by a
+        users.csv or accounts.csv column (e.g. "plan", "industry").
+
+        Returns:
+            {"steps": [{"event", "users", "conversion_from_previous",
+                        "conversion_from_start", "avg_seconds_from_previous"}],
+             "breakdown": {group: [users per step]}}  (only with `by`)
+        """
+        if not steps:
+            raise ValueError("A funnel needs at least one step")
+        self._check_by(by)
+        codes = [self._event_code(s) for s in steps]
+        lo_t = None if start is None else np.datetime64(start, "s").astype(np.int64)
+        hi_t = None if end is None else np.datetime64(end, "s").astype(np.int64)
+        counts = np.zeros(len(steps), dtype=np.int64)
+        seconds = np.zeros(len(steps), dtype=np.float64)
+        breakdown: Dict[str, np.ndarray] = {}
+
+        for first_user, users, events, times in self._chunks():
+            local = (users - first_user).astype(np.int64)
+            keys = (local << _TIME_BITS) | times
+            mask = events == codes[0]
+            if lo_t is not None:
+                mask &= times >= lo_t
+            if hi_t is not None:
+                mask &= times < hi_t
+            # Sorted by (user, time), so the first index per user is its entry
+            cur_users, first = np.unique(local[mask], return_index=True)
+            cur_times = times[mask][first]
+            entry = cur_times
+            reached = [cur_users]
+            for k, code in enumerate(codes[1:], 1):
+                step_keys = keys[events == code]
+                idx = np.searchsorted(step_keys, (cur_users << _TIME_BITS) | cur_times, side="left")
+                found = step_keys[np.minimum(idx, max(len(step_keys) - 1, 0))] if len(step_keys) else idx
+                ok = (idx < len(step_keys)) & ((found >> _TIME_BITS) == cur_users)
+                step_times = found & ((1 << _TIME_BITS) - 1)
+                if window_seconds is not None:
+                    ok &= step_times - entry <= window_seconds
+                seconds[k] += float((step_times[ok] - cur_times[ok]).sum())
+                cur_users, cur_times, entry = cur_users[ok], step_times[ok], entry[ok]
+                reached.append(cur_users)
+            counts += [len(r) for r in reached]
+            if by is not None:
+                groups = self._group_of(reached[0] + first_user, by)
+                for k, r in enumerate(reached):
+                    in_step = np.isin(reached[0], r)
+                    names, n = np.unique(groups[in_step].astype(str), return_counts=True)
+                    for name, c in zip(names.tolist(), n.tolist()):
+                        breakdown.setdefault(name, np.zeros(len(steps), dtype=np.int64))[k] += c
+
+        result: Dict[str, Any] = {"steps": [
+            {
+                "event": step,
+                "users": int(counts[k]),
+                "conversion_from_previous": float(counts[k] / counts[k - 1]) if k and counts[k - 1] else None,
+                "conversion_from_start": float(counts[k] / counts[0]) if counts[0] else None,
+                "avg_seconds_from_previous": float(seconds[k] / counts[k]) if k and counts[k] else None,
+            }
+            for k, step in enumerate(steps)
+        ]}
+        if by is not None:
+            result["breakdown"] = {g: c.tolist() for g, c in sorted(breakdown.items())}
+        return result
+
+    def cohorts(
+        self,
+        period: str = "week",
+        periods: int = 8,
+        cohort_event: Optional[str] = None,
+        activity_event: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Retention by cohort: users grouped by the period of their first
+        `cohort_event` (any event if None), and the share of each cohort with
+        an `activity_event` (any event if None) 0, 1, ... `periods`-1 periods
+        after it.
+
+        Returns:
+            {"period": str, "cohorts": [{"cohort": "YYYY-MM-DD", "users": int,
+                                         "retention": [float] * periods}]}
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown cohort period {period!r}; expected one of {tuple(PERIODS)}")
+        length = PERIODS[period]
+        cohort_code, activity_code = self._event_code(cohort_event), self._event_code(activity_event)
+        sizes: Dict[int, int] = {}
+        active: Dict[int, np.ndarray] = {}
+
+        for _, users, events, times in self._chunks():
+            local = users - users[0] if len(users) else users
+            entry_mask = events == cohort_code if cohort_code != -2 else np.ones(len(events), bool)
+            cohort_users, first = np.unique(local[entry_mask], return_index=True)
+            if not len(cohort_users):
+                continue
+            start = np.full(int(local.max()) + 1, -1, dtype=np.int64)
+            start[cohort_users] = times[entry_mask][first]
+
+            labels = start[cohort_users].astype("datetime64[s]")
+            labels = _week_start(labels) if period == "week" else labels.astype("datetime64[D]")
+            label_days = labels.astype(np.int64)
+            label_of = np.zeros(len(start), dtype=np.int64)
+            label_of[cohort_users] = label_days
+            for day, n in zip(*np.unique(label_days, return_counts=True)):
+                sizes[int(day)] = sizes.get(int(day), 0) + int(n)
+
+            act = (start[local] >= 0) & (
+                events == activity_code if activity_code != -2 else np.ones(len(events), bool)
+            )
+            offset = (times[act] - start[local[act]]) // length
+            keep = (offset >= 0) & (offset < periods)
+            # One count per (user, period offset)
+            pairs = np.unique(local[act][keep].astype(np.int64) * periods + offset[keep])
+            pair_labels, pair_offsets = label_of[pairs // periods], pairs % periods
+            for day in np.unique(pair_labels):
+                hits = np.bincount(pair_offsets[pair_labels == day], minlength=periods)
+                active.setdefault(int(day), np.zeros(periods, dtype=np.int64))[:] += hits
+
+        return {
+            "period": period,
+            "cohorts": [
+                {
+                    "cohort": str(np.datetime64(day, "D")),
+                    "users": n,
+                    "retention": (active.get(day, np.zeros(periods)) / n).round(6).tolist(),
+                }
+                for day, n in sorted(sizes.items())
+            ],
+        }
+
+    def _check_by(self, by: Optional[str]) -> None:
+        if by is None:
+            return
+        columns = set(self.users.columns if self.users is not None else ())
+        columns |= set(self.accounts.columns if self.accounts is not None else ())
+        if by not in columns:
+            raise ValueError(f"Unknown breakdown column {by!r}; expected one of {sorted(columns)}")
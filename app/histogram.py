@@ -0,0 +1,174 @@
+"""Constant-memory streaming histograms for latency and quality metrics.
+
+`LogHistogram` is an HDR-style histogram: buckets grow geometrically, so any
+value in [min_value, max_value] is reported with relative error at most
+`precision`, using a fixed array of counts (~700 buckets at 1%) no matter how
+many values were recorded. Quantiles, means and counts are read in time
+proportional to the bucket count, independent of uptime.
+
+`WindowedHistogram` keeps a ring of per-slot histograms plus their running
+total, so the last N seconds are read without merging: expiring a slot
+subtracts its counts from the total. `MultiWindowHistogram` bundles an
+all-time histogram with 1m / 5m / 1h windows.
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+class LogHistogram:
+    """Log-bucketed histogram of non-negative values with bounded relative error."""
+
+    def __init__(self, min_value: float = 1e-3, max_value: float = 1e7, precision: float = 0.01):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = 1.0 + 2.0 * precision
+        self._log_gamma = math.log(self.gamma)
+        # Bucket 0 holds values <= min_value (including zero); the last one overflows
+        self.num_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_gamma)) + 2
+        self.counts = np.zeros(self.num_buckets, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        b = int(math.log(value / self.min_value) / self._log_gamma) + 1
+        return min(b, self.num_buckets - 1)
+
+    def _representative(self, bucket: int) -> float:
+        if bucket == 0:
+            return 0.0
+        # Geometric midpoint of [min * g^(b-1), min * g^b]
+        return self.min_value * self.gamma ** (bucket - 0.5)
+
+    def add(self, value: float) -> None:
+        value = float(value)
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LogHistogram") -> None:
+        self.counts += other.counts
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def subtract(self, other: "LogHistogram") -> None:
+        """Remove `other`'s values; min/max are left for the caller to recompute."""
+        self.counts -= other.counts
+        self.count -= other.count
+        self.sum -= other.sum
+
+    def clear(self) -> None:
+        self.counts[:] = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at rank int(q * count) (the nearest-rank definition), or None if empty."""
+        if self.count <= 0:
+            return None
+        rank = min(int(q * self.count), self.count - 1)
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank, side="right"))
+        return min(max(self._representative(bucket), self.min), self.max)
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count > 0 else None
+
+
+class WindowedHistogram:
+    """Histogram of the values recorded in the last `window_seconds`.
+
+    The window is split into `slots` sub-histograms; it slides one slot at a
+    time, so reads cover between window - window/slots and window seconds.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float,
+        slots: int = 12,
+        clock: Callable[[], float] = time.monotonic,
+        **histogram_kwargs,
+    ):
+        self.window_seconds = window_seconds
+        self.slot_seconds = window_seconds / slots
+        self._clock = clock
+        self._slots = [LogHistogram(**histogram_kwargs) for _ in range(slots)]
+        self._slot_ids = [-1] * slots
+        self.total = LogHistogram(**histogram_kwargs)
+
+    def _advance(self) -> LogHistogram:
+        """Expire slots older than the window; returns the current slot."""
+        now_id = int(self._clock() // self.slot_seconds)
+        expired = False
+        for i, slot_id in enumerate(self._slot_ids):
+            if slot_id != -1 and slot_id <= now_id - len(self._slots):
+                self.total.subtract(self._slots[i])
+                self._slots[i].clear()
+                self._slot_ids[i] = -1
+                expired = True
+        if expired:
+            live = [s for s in self._slots if s.count]
+            self.total.min = min((s.min for s in live), default=math.inf)
+            self.total.max = max((s.max for s in live), default=-math.inf)
+
+        current = now_id % len(self._slots)
+        self._slot_ids[current] = now_id
+        return self._slots[current]
+
+    def add(self, value: float) -> None:
+        self._advance().add(value)
+        self.total.add(value)
+
+    def snapshot(self) -> LogHistogram:
+        """The live window total (shared, do not modify)."""
+        self._advance()
+        return self.total
+
+
+class MultiWindowHistogram:
+    """All-time histogram plus sliding windows (default 1m / 5m / 1h); thread-safe."""
+
+    def __init__(
+        self,
+        windows: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        **histogram_kwargs,
+    ):
+        self.all_time = LogHistogram(**histogram_kwargs)
+        self.windows = {
+            name: WindowedHistogram(seconds, clock=clock, **histogram_kwargs)
+            for name, seconds in (WINDOWS if windows is None else windows).items()
+        }
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self.all_time.add(value)
+            for window in self.windows.values():
+                window.add(value)
+
+    def summary(self, window: Optional[str] = None) -> Dict[str, Optional[float]]:
+        """p50 / p95 / p99 / mean / count over all time, or over the named window."""
+        with self._lock:
+            h = self.all_time if window is None else self.windows[window].snapshot()
+            return {
+                "p50": h.quantile(0.50),
+                "p95": h.quantile(0.95),
+                "p99": h.quantile(0.99),
+                "mean": h.mean(),
+                "count": h.count,
+            }
@@ -1,10 +1,313 @@
+"""Document ingestion: initial loading and incremental index maintenance."""
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.fingerprints import FingerprintTable, file_stamp
+from app.retrieval.docstore import DocumentStore
+from app.sources import iter_passages
+
+
 def load_docs(path):
     with open(path) as f:
         return [l.strip() for l in f.readlines() if l.strip()]
 
 
-"""Minimal ingestion module."""
+class ReadWriteLock:
+    """Any number of readers, or one writer; a waiting writer holds off new readers.
+
+    Not reentrant: a thread holding a read must not read again while a
+    writer may be waiting.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IncrementalIndexer:
+    """Keeps dense, sparse and ranking-feature indexes in sync as documents change.
+
+    Documents are addressed by caller-chosen keys. Adds encode and index only
+    the new documents; updates tombstone the old version and append the new
+    one; deletes are tombstones. Once tombstones exceed `compaction_ratio` of
+    the corpus, every component is compacted together so doc ids stay aligned.
+
+    Every change is applied under the write side of a reader-writer lock:
+    components are updated one after another (and a BM25 add grows its
+    postings before its per-document arrays), so a query interleaved with a
+    change could see a doc id in one structure but not the next, and
+    compaction renumbers ids outright. Queries hold `reading()` from
+    retrieval until their doc ids are materialized; new documents are
+    encoded before the write lock is taken, so queries only wait for the
+    index updates themselves.
+
+    If the retrievers share a `DocumentStore`, the indexer owns it: texts and
+    metadata are appended to the store before the components index them.
+
+    Changes are detected against `fingerprints` (app/fingerprints.py), which
+    also tracks the token distribution and embedding centroid of the live
+    corpus; pass a table loaded from a previous run to `drift_report` to see
+    what changed between runs.
+    """
+
+    def __init__(
+        self,
+        dense,
+        sparse,
+        feature_extractor=None,
+        keys: Optional[List[str]] = None,
+        compaction_ratio: float = 0.2,
+    ):
+        self.dense = dense
+        self.sparse = sparse
+        self.feature_extractor = feature_extractor
+        self.compaction_ratio = compaction_ratio
+        self.store = dense.docs if isinstance(dense.docs, DocumentStore) else None
+
+        texts = dense.docs
+        keys = keys if keys is not None else [str(i) for i in range(len(texts))]
+        if len(keys) != len(texts):
+            raise ValueError("keys must match the indexed documents one-to-one")
+        self._keys: List[Optional[str]] = list(keys)
+        self._ids: Dict[str, int] = {k: i for i, k in enumerate(keys)}
+        self.fingerprints = FingerprintTable.from_documents(
+            zip(keys, texts), embeddings=getattr(dense, "emb", None)
+        )
+
+        self.version = 0
+        self._lock = threading.Lock()
+        self._rw = ReadWriteLock()
+
+    @property
+    def num_docs(self) -> int:
+        """Live (non-tombstoned) documents."""
+        return len(self._ids)
+
+    @property
+    def num_deleted(self) -> int:
+        return len(self._keys) - len(self._ids)
+
+    def keys(self) -> List[str]:
+        """Keys of all live documents."""
+        return list(self._ids)
+
+    def doc_id(self, key: str) -> Optional[int]:
+        return self._ids.get(key)
+
+    def reading(self):
+        """Context in which doc ids stay stable (no compaction runs)."""
+        return self._rw.reading()
+
+    def _components(self):
+        return [c for c in (self.dense, self.sparse, self.feature_extractor) if c is not None]
+
+    def upsert(
+        self,
+        documents: Dict[str, str],
+        metadata: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Dict[str, int]:
+        """Add new documents and replace changed ones; unchanged texts are skipped.
+
+        `metadata` (key -> {"source_type", "date", "weight"}) is kept in the
+        shared DocumentStore, if there is one.
+        """
+        metadata = metadata or {}
+        with self._lock:
+            added, updated, stale = [], [], []
+            for key, text in documents.items():
+                change = self.fingerprints.update(key, text)
+                if change == "added":
+                    added.append(key)
+                elif change == "modified":
+                    updated.append(key)
+                    stale.append(self._ids[key])
+
+            new_keys = added + updated
+            texts = [documents[k] for k in new_keys]
+            embeddings = self.dense._build_embeddings(texts) if new_keys else None
+
+            with self._rw.writing():
+                if stale:
+                    self._remove_embeddings(stale)
+                    for component in self._components():
+                        component.delete_documents(stale)
+                    for old_id in stale:
+                        self._keys[old_id] = None
+
+                if new_keys:
+                    if self.store is not None:
+                        self.store.append(texts, [metadata.get(k, {}) for k in new_keys])
+                    ids = self.dense.add_documents(texts, embeddings=embeddings)
+                    for component in (self.sparse, self.feature_extractor):
+                        if component is not None:
+                            component.add_documents(texts)
+                    self._add_embeddings(ids)
+                    for key, doc_id in zip(new_keys, ids.tolist()):
+                        self._ids[key] = doc_id
+                        self._keys.append(key)
+
+            if new_keys or stale:
+                self.version += 1
+            return {
+                "added": len(added),
+                "updated": len(updated),
+                "unchanged": len(documents) - len(new_keys),
+            }
+
+    def delete(self, keys: Iterable[str]) -> int:
+        """Tombstone documents by key; unknown keys are ignored."""
+        with self._lock, self._rw.writing():
+            ids = []
+            for key in keys:
+                doc_id = self._ids.pop(key, None)
+                if doc_id is None:
+                    continue
+                self.fingerprints.remove(key)
+                self._keys[doc_id] = None
+                ids.append(doc_id)
+            if ids:
+                self._remove_embeddings(ids)
+                for component in self._components():
+                    component.delete_documents(ids)
+                self.version += 1
+            return len(ids)
+
+    def _add_embeddings(self, ids) -> None:
+        if getattr(self.dense, "emb", None) is not None:
+            self.fingerprints.add_embeddings(self.dense.emb[np.asarray(ids)])
+
+    def _remove_embeddings(self, ids) -> None:
+        if getattr(self.dense, "emb", None) is not None:
+            self.fingerprints.remove_embeddings(self.dense.emb[np.asarray(ids)])
+
+    def drift_report(self, baseline: FingerprintTable, **thresholds) -> Dict[str, Any]:
+        """Documents added / removed / modified and distribution drift since `baseline`."""
+        with self._lock:
+            return self.fingerprints.drift_report(baseline, **thresholds)
+
+    def save_fingerprints(self, path: str) -> None:
+        with self._lock:
+            self.fingerprints.save(path)
+
+    def needs_compaction(self) -> bool:
+        total = len(self._keys)
+        return total > 0 and self.num_deleted / total > self.compaction_ratio
+
+    def compact(self) -> None:
+        """Physically drop tombstoned documents from every index."""
+        with self._lock, self._rw.writing():
+            if self.store is not None:
+                self.store.compact(np.array([k is not None for k in self._keys], dtype=bool))
+            remap = self.dense.compact()
+            self.sparse.compact()
+            if self.feature_extractor is not None:
+                self.feature_extractor.compact(remap)
+            self._keys = [k for k in self._keys if k is not None]
+            self._ids = {k: i for i, k in enumerate(self._keys)}
+            self.version += 1
+
+
+def ingest_sources(
+    indexer: IncrementalIndexer,
+    documents: Optional[Dict[str, str]] = None,
+    deleted_keys: Optional[Iterable[str]] = None,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    batch_size: int = 256,
+    sync: bool = False,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Apply a batch of document changes to the live indexes.
+
+    Args:
+        indexer: the pipeline's IncrementalIndexer
+        documents: key -> text to add or update
+        deleted_keys: keys to remove
+        sources: source configs (see config.SOURCES) to stream, chunk and
+            upsert in batches of `batch_size` passages
+        sync: with `sources`, also delete passages of those sources that
+            were not seen in this run
+        force: re-read sources whose file is unchanged (same mtime and size)
+            since they were last ingested; by default they are skipped
+
+    Returns:
+        counts of added / updated / unchanged / deleted documents, the
+        sources read and skipped as unchanged, whether a compaction ran, and
+        the live corpus size
+    """
+    summary = indexer.upsert(documents or {})
+    deleted_keys = list(deleted_keys or [])
+    read: List[Dict[str, Any]] = []
+
+    if sources:
+        seen = set()
+
+        def flush(batch):
+            counts = indexer.upsert(
+                {p["key"]: p["text"] for p in batch},
+                {p["key"]: {k: v for k, v in p.items() if k not in ("key", "text")} for p in batch},
+            )
+            for k, v in counts.items():
+                summary[k] += v
+
+        fingerprints = indexer.fingerprints
+        read = [s for s in sources if force or not fingerprints.source_unchanged(s["path"])]
+        for source in read:
+            stamp = file_stamp(source["path"])
+            batch = []
+            for passage in iter_passages([source]):
+                seen.add(passage["key"])
+                batch.append(passage)
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+            fingerprints.mark_source(source["path"], stamp)
 
+        if sync and read:
+            prefixes = tuple(f"{s['path']}:" for s in read)
+            deleted_keys += [k for k in indexer.keys() if k.startswith(prefixes) and k not in seen]
 
-def ingest_sources():
-    return {"sources": []}
+    summary["sources"] = [s["path"] for s in read]
+    summary["skipped_sources"] = [s["path"] for s in sources or [] if s not in read]
+    summary["deleted"] = indexer.delete(deleted_keys)
+    summary["compacted"] = indexer.needs_compaction()
+    if summary["compacted"]:
+        indexer.compact()
+    summary["num_docs"] = indexer.num_docs
+    return summary
@@ -0,0 +1,134 @@
+"""Streaming readers for JSONL logs.
+
+Logs grow for months, so nothing here loads a whole file: lines are read in
+fixed-size blocks, either forward from a byte offset or backward from the end
+of the file (newest first), and records are parsed and yielded one at a time.
+Memory stays proportional to the block size (plus the longest line).
+
+Records are parsed with orjson when it is installed and `fast=True`, which
+is several times faster than the standard json module on log-sized records.
+"""
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Union
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+BLOCK_SIZE = 1 << 16
+
+Timestamp = Union[str, datetime, None]
+
+# Logs are appended in roughly time order: the background writer flushes
+# batches from several workers, so neighbouring timestamps can interleave by
+# up to a few flush intervals. Backward reads stop only at records older
+# than `since` by more than this.
+ORDER_SLACK = timedelta(seconds=60)
+
+
+def json_loads(fast: bool = True) -> Callable[[bytes], Any]:
+    """The JSON parser to use: orjson if available and `fast`, else json."""
+    if fast and orjson is not None:
+        return orjson.loads
+    return json.loads
+
+
+def iter_lines(path: Path, offset: int = 0, block_size: int = BLOCK_SIZE) -> Iterator[Tuple[bytes, int]]:
+    """Yield (line, offset after it) for complete lines from `offset` on.
+
+    A trailing line without its newline is still being written and is left
+    for a later read.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pending = b""
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            lines = (pending + block).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                offset += len(line) + 1
+                if line.strip():
+                    yield line, offset
+
+
+def iter_lines_reverse(path: Path, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Yield the file's lines last to first, reading fixed-size blocks backward."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, 2)
+        pending = b""
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + pending).split(b"\n")
+            # The first piece may continue in the previous block
+            pending = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+
+def _iso(value: Timestamp) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def iter_records(
+    path: Path,
+    since: Timestamp = None,
+    until: Timestamp = None,
+    newest_first: bool = False,
+    fast: bool = True,
+    block_size: int = BLOCK_SIZE,
+    slack: timedelta = ORDER_SLACK,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily yield JSON records from a JSONL log, optionally within a time range.
+
+    Args:
+        path: log file
+        since / until: inclusive / exclusive bounds on the records' ISO
+            "timestamp" field (naive UTC, as the app writes them)
+        newest_first: read backward from the end of the file; records older
+            than `since` are skipped, and iteration stops at the first record
+            older than `since - slack` (logs are appended in time order, give
+            or take `slack`)
+        fast: parse with orjson when it is installed
+    """
+    path = Path(path)
+    if not path.exists():
+        return
+    since, until = _iso(since), _iso(until)
+    stop_before = None
+    if newest_first and since is not None:
+        try:
+            stop_before = (datetime.fromisoformat(since) - slack).isoformat()
+        except ValueError:
+            pass  # not an ISO time: scan the whole file
+    loads = json_loads(fast)
+    lines = iter_lines_reverse(path, block_size) if newest_first else (
+        line for line, _ in iter_lines(path, 0, block_size)
+    )
+    for line in lines:
+        try:
+            record = loads(line)
+        except ValueError:
+            continue  # torn or corrupt line
+        if not isinstance(record, dict):
+            continue
+        if since is not None or until is not None:
+            ts = record.get("timestamp") or ""
+            if until is not None and ts >= until:
+                continue
+            if since is not None and ts < since:
+                if stop_before is not None and ts and ts < stop_before:
+                    return
+                continue
+        yield record
@@ -0,0 +1,183 @@
+"""Background writer for JSONL logs.
+
+Request handlers hand records to the writer and return immediately: a write
+is one append to an in-memory buffer under a lock, and JSON encoding happens
+on the writer thread. A single daemon thread drains the buffer in batches,
+when `batch_size` records are pending or `flush_interval` seconds have
+passed, and appends each batch to its files with one open/write per file.
+
+Durability is set by `fsync`:
+- "none": leave flushing to the OS (default)
+- "batch": fsync every file after each batch
+- "interval": fsync at most every `fsync_interval` seconds
+
+When the buffer is full, writes wait for the writer (`drop_when_full=False`)
+or the oldest pending record is dropped and counted in `dropped`. `close()`
+(also registered with atexit) writes everything still buffered.
+
+Listeners added with `add_listener(fn)` are called on the writer thread with
+each batch once it is written, before `flush()` returns for those records;
+they let other stores follow the logs in batches rather than per request.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+FSYNC_POLICIES = ("none", "batch", "interval")
+
+
+class BackgroundLogWriter:
+    """Appends JSON records to files from a dedicated thread, in batches."""
+
+    def __init__(
+        self,
+        max_records: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        fsync: str = "none",
+        fsync_interval: float = 5.0,
+        drop_when_full: bool = False,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}; expected one of {FSYNC_POLICIES}")
+        self.max_records = max_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.drop_when_full = drop_when_full
+        self.dropped = 0
+
+        self._buffer: Deque[Tuple[Path, Dict[str, Any]]] = deque()
+        self._cond = threading.Condition()
+        self._pushed = 0
+        self._done = 0
+        self._flush_requested = False
+        self._closing = False
+        self._last_fsync = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        self._listeners: List[Callable[[List[Tuple[Path, Dict[str, Any]]]], None]] = []
+
+    def add_listener(self, fn: Callable[[List[Tuple[Path, Dict[str, Any]]]], None]) -> None:
+        """Call `fn(batch)` on the writer thread after each batch of (path, record) is written."""
+        self._listeners.append(fn)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+                if not self._atexit_registered:
+                    atexit.register(self.close)
+                    self._atexit_registered = True
+
+    def write(self, path: Path, record: Dict[str, Any]) -> None:
+        """Queue `record` to be appended to `path` as one JSON line."""
+        self._ensure_started()
+        with self._cond:
+            if len(self._buffer) >= self.max_records:
+                if self.drop_when_full:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                    self._done += 1
+                else:
+                    self._cond.wait_for(lambda: len(self._buffer) < self.max_records)
+            self._buffer.append((path, record))
+            self._pushed += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    @property
+    def pending(self) -> int:
+        """Records queued but not yet written."""
+        with self._cond:
+            return self._pushed - self._done
+
+    def flush(self) -> None:
+        """Block until every record queued so far has been written to its file."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        with self._cond:
+            target = self._pushed
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._done >= target)
+
+    def close(self) -> None:
+        """Write everything still buffered and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._buffer) >= self.batch_size
+                    or self._flush_requested
+                    or self._closing,
+                    timeout=self.flush_interval,
+                )
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._flush_requested = False
+                closing = self._closing
+                # Wake writers waiting for buffer space
+                self._cond.notify_all()
+
+            if batch:
+                # Anything still unsynced is synced on close
+                self._write_batch(batch, force_sync=closing and self.fsync != "none")
+                for fn in self._listeners:
+                    try:
+                        fn(batch)
+                    except Exception as e:
+                        print(f"Log writer listener {fn!r} failed: {e}")
+            with self._cond:
+                self._done += len(batch)
+                self._cond.notify_all()
+                if closing and not self._buffer:
+                    return
+
+    def _write_batch(self, batch: List[Tuple[Path, Dict[str, Any]]], force_sync: bool = False) -> None:
+        """Append a batch with one open + write per file, preserving record order."""
+        lines: Dict[Path, List[str]] = {}
+        for path, record in batch:
+            try:
+                line = json.dumps(record)
+            except (TypeError, ValueError) as e:
+                print(f"Dropping unserializable log record for {path}: {e}")
+                continue
+            lines.setdefault(Path(path), []).append(line + "\n")
+
+        now = time.monotonic()
+        sync = force_sync or self.fsync == "batch" or (
+            self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval
+        )
+        for path, file_lines in lines.items():
+            try:
+                with open(path, "a") as f:
+                    f.write("".join(file_lines))
+                    if sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Failed to write log {path}: {e}")
+        if sync:
+            self._last_fsync = now
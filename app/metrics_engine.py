@@ -0,0 +1,352 @@
+"""Columnar query engine over the structured CSVs in data/structured.
+
+Questions like "Why did activation drop in January?" get numeric evidence
+from here, not only from retrieved text. Each CSV is loaded once into typed
+NumPy columns (by `data.DataLoader`):
+
+- daily_metrics.csv: one `MetricSeries` per (metric_name, segment), sorted
+  by date, with precomputed daily and weekly (Monday-start) rollups and
+  their period-over-period deltas
+- events.csv: timestamps sorted within each event name, with per-event
+  offsets and daily counts
+- users.csv / accounts.csv: dimension `Table`s indexed on their id column
+
+Lookups are a dict hit followed by a binary search on dates
+(`np.searchsorted`), so they cost O(log n) however many years of data are
+loaded, never a scan over rows.
+"""
+import calendar
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.data import DataLoader
+
+# Words in metric names too generic to identify a metric in a question
+_GENERIC_WORDS = {"rate", "daily", "ms", "p95", "d7", "new", "step2", "success"}
+
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTH_RE = re.compile(r"\b(" + "|".join(_MONTHS) + r")\b(?:\s+(\d{4}))?")
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{2})(?:-(\d{2}))?\b")
+
+DatePeriod = Tuple[np.datetime64, np.datetime64]
+
+
+def _week_start(days: np.ndarray) -> np.ndarray:
+    """Monday of each day's week (1970-01-01 was a Thursday)."""
+    d = days.astype("datetime64[D]").astype(np.int64)
+    return (d - (d + 3) % 7).astype("datetime64[D]")
+
+
+def _day(value: np.datetime64) -> str:
+    return str(value.astype("datetime64[D]"))
+
+
+def _num(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 6)
+
+
+def _coerce(col: np.ndarray, dtype: str, missing) -> np.ndarray:
+    """`col` as `dtype`, with values that do not parse as `missing` (NaN / NaT)."""
+    try:
+        return col.astype(dtype)
+    except (TypeError, ValueError):
+        pass
+    out = np.empty(len(col), dtype=dtype)
+    for i, value in enumerate(col):
+        try:
+            out[i] = np.asarray(value).astype(dtype)
+        except (TypeError, ValueError):
+            out[i] = missing
+    return out
+
+
+class Table:
+    """Typed columns of a dimension CSV with an index on its key column."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], key: str):
+        self.columns = columns
+        self.key = key
+        self.index = {k: i for i, k in enumerate(columns.get(key, ()))}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def row(self, key: str) -> Optional[Dict[str, Any]]:
+        i = self.index.get(key)
+        if i is None:
+            return None
+        return {name: col[i].item() for name, col in self.columns.items()}
+
+    def rows_for(self, keys: Iterable[str]) -> np.ndarray:
+        """Row positions for `keys` (-1 where a key is unknown)."""
+        return np.array([self.index.get(k, -1) for k in keys], dtype=np.int64)
+
+
+class MetricSeries:
+    """One metric for one segment: daily values plus weekly rollups and deltas.
+
+    Rows on the same day are averaged. `daily_delta[i]` is the change from the
+    previous observed day (NaN for the first); likewise `weekly_delta`.
+    """
+
+    def __init__(self, dates: np.ndarray, values: np.ndarray):
+        order = np.argsort(dates, kind="stable")
+        dates, values = dates[order], values[order]
+        self.dates, starts, counts = np.unique(dates, return_index=True, return_counts=True)
+        self.values = np.add.reduceat(values, starts) / counts if len(values) else values
+        self.daily_delta = np.diff(self.values, prepend=np.nan)
+
+        weeks = _week_start(self.dates)
+        self.weeks, wstarts, wcounts = np.unique(weeks, return_index=True, return_counts=True)
+        self.weekly = np.add.reduceat(self.values, wstarts) / wcounts if len(weeks) else self.values
+        self.weekly_delta = np.diff(self.weekly, prepend=np.nan)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def window(self, start: Optional[np.datetime64] = None, end: Optional[np.datetime64] = None) -> slice:
+        """Positions of days in [start, end), found by binary search."""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, start, side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, end, side="left"))
+        return slice(lo, hi)
+
+    def weekly_window(self, start: Optional[np.datetime64] = None, end: Optional[np.datetime64] = None) -> slice:
+        lo = 0 if start is None else int(np.searchsorted(self.weeks, _week_start(np.array([start]))[0]))
+        hi = len(self.weeks) if end is None else int(np.searchsorted(self.weeks, end, side="left"))
+        return slice(lo, hi)
+
+
+class EventLog:
+    """Events sorted by (event name, timestamp) with per-event offsets."""
+
+    def __init__(self, names: np.ndarray, timestamps: np.ndarray, users: np.ndarray):
+        order = np.lexsort((timestamps, names))
+        self.names = names[order]
+        self.timestamps = timestamps[order]
+        self.users = users[order]
+        self.offsets: Dict[str, slice] = {}
+        # Daily counts per event: (days, counts)
+        self.daily: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        if len(self.names):
+            uniq, starts = np.unique(self.names, return_index=True)
+            ends = np.append(starts[1:], len(self.names))
+            for name, lo, hi in zip(uniq, starts, ends):
+                self.offsets[str(name)] = slice(int(lo), int(hi))
+                self.daily[str(name)] = np.unique(
+                    self.timestamps[lo:hi].astype("datetime64[D]"), return_counts=True
+                )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def window(self, name: str, start: Optional[np.datetime64] = None, end: Optional[np.datetime64] = None) -> slice:
+        """Positions of `name` events with start <= timestamp < end."""
+        span = self.offsets.get(name)
+        if span is None:
+            return slice(0, 0)
+        ts = self.timestamps[span]
+        lo = 0 if start is None else int(np.searchsorted(ts, np.datetime64(start, "s"), side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, np.datetime64(end, "s"), side="left"))
+        return slice(span.start + lo, span.start + hi)
+
+    def count(self, name: str, start: Optional[np.datetime64] = None, end: Optional[np.datetime64] = None) -> int:
+        w = self.window(name, start, end)
+        return w.stop - w.start
+
+
+class MetricsEngine:
+    """In-memory, index-driven lookups over daily metrics, events, users and accounts."""
+
+    def __init__(
+        self,
+        series: Dict[Tuple[str, str], MetricSeries],
+        events: EventLog,
+        users: Table,
+        accounts: Table,
+    ):
+        self.series = series
+        self.events = events
+        self.users = users
+        self.accounts = accounts
+        self._metric_words = {
+            metric: {w for w in metric.split("_") if w not in _GENERIC_WORDS}
+            for metric, _ in series
+        }
+        all_dates = [s.dates[[0, -1]] for s in series.values() if len(s)]
+        self.max_date = max((d[1] for d in all_dates), default=None)
+
+    @classmethod
+    def load(cls, base_path: str = "data/structured") -> "MetricsEngine":
+        base = Path(base_path)
+        loader = DataLoader(cache_bytes=0)
+
+        cols = loader.load_columns(base / "daily_metrics.csv")
+        series: Dict[Tuple[str, str], MetricSeries] = {}
+        if cols:
+            dates = _coerce(cols["date"], "datetime64[D]", np.datetime64("NaT"))
+            values = _coerce(cols["value"], "float64", np.nan)
+            names = cols["metric_name"].astype(str)
+            segments = cols["segment"].astype(str) if "segment" in cols else np.full(len(names), "all")
+            valid = ~np.isnat(dates) & ~np.isnan(values)
+            if not valid.all():
+                print(f"Skipping {int((~valid).sum())} daily metrics rows with an unparseable date or value")
+                dates, values, names, segments = (c[valid] for c in (dates, values, names, segments))
+            keys = np.char.add(np.char.add(names, "\x1f"), segments)
+            for key in np.unique(keys):
+                mask = keys == key
+                metric, segment = str(key).split("\x1f")
+                series[(metric, segment or "all")] = MetricSeries(dates[mask], values[mask])
+
+        cols = loader.load_columns(base / "events.csv")
+        events = EventLog(
+            cols.get("event_name", np.array([], dtype=str)).astype(str),
+            _coerce(
+                cols.get("event_timestamp", np.array([], dtype="datetime64[s]")),
+                "datetime64[s]",
+                np.datetime64("NaT"),
+            ),
+            cols.get("user_id", np.array([], dtype=str)).astype(str),
+        )
+
+        def table(filename: str, key: str) -> Table:
+            return Table(loader.load_columns(base / filename), key)
+
+        return cls(series, events, table("users.csv", "user_id"), table("accounts.csv", "account_id"))
+
+    @classmethod
+    def empty(cls) -> "MetricsEngine":
+        """An engine with no data, for when the CSVs cannot be loaded."""
+        no_strings = np.array([], dtype=str)
+        return cls(
+            {},
+            EventLog(no_strings, np.array([], dtype="datetime64[s]"), no_strings),
+            Table({}, "user_id"),
+            Table({}, "account_id"),
+        )
+
+    @property
+    def metrics(self) -> List[str]:
+        return sorted({metric for metric, _ in self.series})
+
+    def get_series(self, metric: str, segment: str = "all") -> Optional[MetricSeries]:
+        return self.series.get((metric, segment))
+
+    def find_metrics(self, text: str, limit: int = 3) -> List[str]:
+        """Metrics named in `text`, best match first ("activation" -> activation_rate)."""
+        tokens = set(re.findall(r"[a-z0-9]+", text.lower()))
+        scored = []
+        for metric, words in self._metric_words.items():
+            hits = sum(
+                1 for w in words
+                if any(t == w or (len(t) >= 5 and len(w) >= 5 and t[:5] == w[:5]) for t in tokens)
+            )
+            if hits:
+                scored.append((-hits / len(words), metric))
+        return [metric for _, metric in sorted(set(scored))][:limit]
+
+    def parse_period(self, text: str) -> Optional[DatePeriod]:
+        """[start, end) named in `text`: "January [2025]", "2025-01" or "2025-01-18".
+
+        A month without a year is its most recent occurrence in the data.
+        Dates that do not exist ("2025-02-30", "2025-13") name no period.
+        """
+        text = text.lower()
+        m = _ISO_RE.search(text)
+        if m:
+            year, month, day = m.groups()
+            try:
+                if day:
+                    start = np.datetime64(f"{year}-{month}-{day}")
+                    return start, start + np.timedelta64(1, "D")
+                start = np.datetime64(f"{year}-{month}")
+            except ValueError:
+                return None
+            return start.astype("datetime64[D]"), (start + 1).astype("datetime64[D]")
+        m = _MONTH_RE.search(text)
+        if m:
+            month = _MONTHS[m.group(1)]
+            if m.group(2):
+                year = int(m.group(2))
+            elif self.max_date is not None:
+                latest = self.max_date.astype(object)
+                year = latest.year if month <= latest.month else latest.year - 1
+            else:
+                return None
+            start = np.datetime64(f"{year:04d}-{month:02d}")
+            return start.astype("datetime64[D]"), (start + 1).astype("datetime64[D]")
+        return None
+
+    def summarize(
+        self,
+        metric: str,
+        start: Optional[np.datetime64] = None,
+        end: Optional[np.datetime64] = None,
+        segment: str = "all",
+        max_weeks: int = 12,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Numeric evidence for one metric over [start, end).
+
+        Returns first / last / change, min and max with their dates, the mean
+        and the previous period's mean (same length, just before `start`),
+        the largest day-over-day drop and rise, and up to `max_weeks` of the
+        weekly rollup; None if the metric has no values in the period.
+        """
+        s = self.get_series(metric, segment)
+        if s is None:
+            return None
+        w = s.window(start, end)
+        dates, values, deltas = s.dates[w], s.values[w], s.daily_delta[w]
+        if not len(values):
+            return None
+
+        summary: Dict[str, Any] = {
+            "metric": metric,
+            "segment": segment,
+            "start": _day(dates[0]),
+            "end": _day(dates[-1]),
+            "first": _num(values[0]),
+            "last": _num(values[-1]),
+            "change": _num(values[-1] - values[0]),
+            "change_pct": _num((values[-1] - values[0]) / values[0]) if values[0] else None,
+            "min": _num(values.min()),
+            "min_date": _day(dates[values.argmin()]),
+            "max": _num(values.max()),
+            "max_date": _day(dates[values.argmax()]),
+            "mean": _num(values.mean()),
+            "previous_mean": None,
+            "largest_drop": None,
+            "largest_rise": None,
+        }
+        if start is not None and end is not None:
+            prev = s.window(start - (end - start), start)
+            if prev.stop > prev.start:
+                summary["previous_mean"] = _num(s.values[prev].mean())
+        valid = ~np.isnan(deltas)
+        if valid.any():
+            idx = np.flatnonzero(valid)
+            lo, hi = idx[deltas[idx].argmin()], idx[deltas[idx].argmax()]
+            if deltas[lo] < 0:
+                summary["largest_drop"] = {"date": _day(dates[lo]), "delta": _num(deltas[lo])}
+            if deltas[hi] > 0:
+                summary["largest_rise"] = {"date": _day(dates[hi]), "delta": _num(deltas[hi])}
+
+        ww = s.weekly_window(start, end)
+        weeks = range(max(ww.start, ww.stop - max_weeks), ww.stop)
+        summary["weekly"] = [
+            {"week": _day(s.weeks[i]), "mean": _num(s.weekly[i]), "delta": _num(s.weekly_delta[i])}
+            for i in weeks
+        ]
+        return summary
+
+    def evidence(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """Summaries for the metrics and period a question mentions (JSON-ready)."""
+        metrics = self.find_metrics(query, limit=limit)
+        if not metrics:
+            return []
+        start, end = self.parse_period(query) or (None, None)
+        summaries = (self.summarize(metric, start, end) for metric in metrics)
+        return [s for s in summaries if s is not None]
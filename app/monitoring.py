@@ -3,17 +3,43 @@ import json
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any
+import threading
+from typing import Callable, Dict, Any, Optional
 from collections import defaultdict
+from app.histogram import WINDOWS, MultiWindowHistogram
+from app.log_writer import BackgroundLogWriter
+
+METRIC_NAMES = ("latency", "recall", "ndcg", "refused", "confidence")
+
+# Drift is judged on recent traffic rather than the whole session
+DRIFT_WINDOW = "5m"
 
 
 class MetricsCollector:
-    """Collects and tracks system metrics."""
+    """Collects and tracks system metrics.
+
+    In-memory stats are streaming histograms (see app.histogram): memory is
+    constant and `get_current_stats` costs the same however long the server
+    has been up. Session-wide stats keep their original keys; each window
+    adds `{metric}_{p50,p95,p99,mean}_{1m,5m,1h}`. Pipeline stage timings
+    (see app.tracing) get a histogram per stage, reported as
+    `stage_{name}_{p50,p95,p99,mean}_ms` plus a 5m p95.
+    """
 
-    def __init__(self, metrics_path: str = "logs/metrics.jsonl"):
+    def __init__(
+        self,
+        metrics_path: str = "logs/metrics.jsonl",
+        writer: Optional[BackgroundLogWriter] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
         self.metrics_path = Path(metrics_path)
         self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
-        self.current_metrics = defaultdict(list)
+        self.writer = writer
+        self.clock = clock
+        self.distributions = {name: MultiWindowHistogram(clock=clock) for name in METRIC_NAMES}
+        self.stage_distributions: Dict[str, MultiWindowHistogram] = {}
+        self._stages_lock = threading.Lock()
+        self.cache_counters = defaultdict(lambda: {"hits": 0, "misses": 0})
 
     def record_query(
         self,
@@ -23,8 +49,9 @@ class MetricsCollector:
         ranker_ndcg: float,
         llm_refused: bool,
         confidence: float,
+        stages_ms: Optional[Dict[str, float]] = None,
     ):
-        """Record metrics for a query."""
+        """Record metrics for a query (and its per-stage timings, if traced)."""
         record = {
             "query_id": query_id,
             "timestamp": datetime.utcnow().isoformat(),
@@ -34,57 +61,92 @@ class MetricsCollector:
             "llm_refused": llm_refused,
             "confidence": confidence,
         }
+        if stages_ms:
+            record["stages_ms"] = stages_ms
 
-        with open(self.metrics_path, "a") as f:
-            f.write(json.dumps(record) + "\n")
+        if self.writer is not None:
+            self.writer.write(self.metrics_path, record)
+        else:
+            with open(self.metrics_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
 
         # Track in memory for quick stats
-        self.current_metrics["latency"].append(latency_ms)
-        self.current_metrics["recall"].append(retrieval_recall)
-        self.current_metrics["ndcg"].append(ranker_ndcg)
-        self.current_metrics["refused"].append(llm_refused)
-        self.current_metrics["confidence"].append(confidence)
+        self.distributions["latency"].add(latency_ms)
+        self.distributions["recall"].add(retrieval_recall)
+        self.distributions["ndcg"].add(ranker_ndcg)
+        self.distributions["refused"].add(float(llm_refused))
+        self.distributions["confidence"].add(confidence)
+
+    def record_stages(self, stages_ms: Dict[str, float]):
+        """Record one request's per-stage timings (milliseconds by stage name)."""
+        for stage, ms in stages_ms.items():
+            histogram = self.stage_distributions.get(stage)
+            if histogram is None:
+                with self._stages_lock:
+                    histogram = self.stage_distributions.setdefault(
+                        stage, MultiWindowHistogram(clock=self.clock)
+                    )
+            histogram.add(ms)
+
+    def record_cache(self, cache_name: str, hit: bool):
+        """Count a hit or miss for the named cache."""
+        self.cache_counters[cache_name]["hits" if hit else "misses"] += 1
 
     def get_current_stats(self) -> Dict[str, Any]:
-        """Get statistics of current session."""
+        """Get statistics of current session, plus 1m / 5m / 1h windows."""
         stats = {}
 
-        for metric_name, values in self.current_metrics.items():
-            if values:
-                stats[f"{metric_name}_p50"] = sorted(values)[len(values) // 2]
-                stats[f"{metric_name}_p95"] = sorted(values)[int(len(values) * 0.95)]
-                stats[f"{metric_name}_mean"] = sum(values) / len(values)
+        for metric_name, histogram in self.distributions.items():
+            summary = histogram.summary()
+            if summary["count"]:
+                stats[f"{metric_name}_p50"] = summary["p50"]
+                stats[f"{metric_name}_p95"] = summary["p95"]
+                stats[f"{metric_name}_mean"] = summary["mean"]
+            for window in WINDOWS:
+                summary = histogram.summary(window)
+                if summary["count"]:
+                    for key in ("p50", "p95", "p99", "mean"):
+                        stats[f"{metric_name}_{key}_{window}"] = summary[key]
+
+        for stage, histogram in list(self.stage_distributions.items()):
+            summary = histogram.summary()
+            if summary["count"]:
+                for key in ("p50", "p95", "p99", "mean"):
+                    stats[f"stage_{stage}_{key}_ms"] = summary[key]
+            recent = histogram.summary(DRIFT_WINDOW)
+            if recent["count"]:
+                stats[f"stage_{stage}_p95_ms_{DRIFT_WINDOW}"] = recent["p95"]
+
+        for cache_name, counts in self.cache_counters.items():
+            lookups = counts["hits"] + counts["misses"]
+            stats[f"cache_{cache_name}_hits"] = counts["hits"]
+            stats[f"cache_{cache_name}_misses"] = counts["misses"]
+            stats[f"cache_{cache_name}_hit_rate"] = counts["hits"] / lookups if lookups else 0.0
 
         return stats
 
     def detect_drift(self) -> Dict[str, Any]:
         """Detect if metrics have drifted from baseline."""
-        stats = self.get_current_stats()
+        latency = self.distributions["latency"].summary(DRIFT_WINDOW)
+        recall = self.distributions["recall"].summary(DRIFT_WINDOW)
 
         # Simple drift detection: compare recent stats to thresholds
         baseline = {"latency_p95_ms": 1000, "recall_mean": 0.7, "refused_rate": 0.1}
 
         drift_detected = {}
 
-        if (
-            stats.get("latency_p95")
-            and stats["latency_p95"] > baseline["latency_p95_ms"]
-        ):
+        if latency["p95"] and latency["p95"] > baseline["latency_p95_ms"]:
             drift_detected[
                 "latency"
-            ] = f"P95 latency {stats['latency_p95']} > {baseline['latency_p95_ms']}"
+            ] = f"P95 latency {latency['p95']} > {baseline['latency_p95_ms']}"
 
-        if stats.get("recall_mean") and stats["recall_mean"] < baseline["recall_mean"]:
+        if recall["mean"] and recall["mean"] < baseline["recall_mean"]:
             drift_detected[
                 "recall"
-            ] = f"Recall {stats['recall_mean']} < {baseline['recall_mean']}"
-
-        refused = (
-            sum(1 for r in self.current_metrics["refused"] if r)
-            / len(self.current_metrics["refused"])
-            if self.current_metrics["refused"]
-            else 0
-        )
+            ] = f"Recall {recall['mean']} < {baseline['recall_mean']}"
+
+        # refused is recorded as 0/1, so its mean is the refusal rate
+        refused = self.distributions["refused"].summary(DRIFT_WINDOW)["mean"] or 0
         if refused > baseline["refused_rate"]:
             drift_detected[
                 "refusal"
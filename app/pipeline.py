@@ -1,26 +1,306 @@
-"""Core pipeline orchestration."""
+"""Core pipeline orchestration.
+
+Components are built lazily through a small registry, so importing this
+module is cheap: nothing is loaded, encoded or fitted until a component is
+first used (`get(name)`) or `warm_up()` builds them all, which the API does
+at startup. `is_ready()` reports whether warm-up has finished. Module-level
+names such as `pipeline.metrics` or `pipeline.ranker` still resolve, through
+the registry.
+
+Each request is traced (app/tracing.py): stages run inside `span(name)`
+and their timings are recorded as per-stage metrics when the request ends.
+"""
+import asyncio
+import hashlib
+import threading
 import time
 import uuid
-from typing import Dict, Any, List
-from app.ingestion import load_docs
-from app.retrieval.dense_retrieval import DenseRetriever
-from app.retrieval.sparse_retrieval import SparseRetriever
-from app.retrieval.hybrid_retrieval import HybridRetriever
-from app.ranking.ranker import RankingOrchestrator
-from app.llm.constrained import ConstrainedReasoning
-from app.feedback import FeedbackCollector
-from app.monitoring import MetricsCollector
-from app.config import DOC_PATH, TOP_K
-
-# Initialize components
-docs = load_docs(DOC_PATH)
-dense = DenseRetriever(docs)
-sparse = SparseRetriever(docs)
-hybrid = HybridRetriever(dense, sparse)
-ranker = RankingOrchestrator()
-reasoning = ConstrainedReasoning(confidence_threshold=0.5)
-feedback_collector = FeedbackCollector()
-metrics = MetricsCollector()
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.cache import TTLCache, normalize_query
+from app.config import (
+    CENTROID_DRIFT_THRESHOLD,
+    DENSE_INDEX_PARAMS,
+    DENSE_INDEX_TYPE,
+    DENSE_RESCORE_FACTOR,
+    DENSE_STORAGE,
+    FINGERPRINTS_PATH,
+    FUSION_STRATEGY,
+    HYBRID_CANDIDATES,
+    INDEX_DIR,
+    LOG_BATCH_SIZE,
+    LOG_BUFFER_RECORDS,
+    LOG_FLUSH_INTERVAL_SECONDS,
+    LOG_FSYNC,
+    LOG_FSYNC_INTERVAL_SECONDS,
+    PIPELINE_WORKERS,
+    PROFILE_DIR,
+    PROFILE_INTERVAL_MS,
+    PROFILE_MODE,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SLOW_MS,
+    QUERY_EMBEDDING_CACHE_BYTES,
+    QUERY_EMBEDDING_CACHE_DIR,
+    QUERY_EMBEDDING_CACHE_DISK_BYTES,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL_SECONDS,
+    STRUCTURED_DATA_DIR,
+    TOKEN_DRIFT_THRESHOLD,
+    TOP_K,
+    TRACING_ENABLED,
+)
+from app.tracing import bind, current_trace, span
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Fused hybrid candidates: (doc_ids, fused_scores, run_scores)
+Candidates = Tuple["np.ndarray", "np.ndarray", "np.ndarray"]
+# Result cache key: (namespace when the query started, normalized query)
+CacheKey = Tuple[Tuple[Any, ...], str]
+
+
+def _corpus_version(documents: Iterable[str]) -> str:
+    h = hashlib.sha256()
+    for d in documents:
+        h.update(d.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+# Component factories. Heavy modules (models, FAISS, BM25) are imported
+# inside them so only the components actually used are paid for.
+
+
+def _build_corpus():
+    """Stream every configured source into chunked passages: (store, keys, source stamps)."""
+    from app.config import SOURCES
+    from app.fingerprints import file_stamp
+    from app.retrieval.docstore import DocumentStore
+    from app.sources import iter_passages
+
+    # Stamped before reading, so a source edited mid-read is re-ingested later
+    stamps = {s["path"]: file_stamp(s["path"]) for s in SOURCES}
+    passages = list({p["key"]: p for p in iter_passages()}.values())
+    store = DocumentStore(
+        [p["text"] for p in passages],
+        [{k: v for k, v in p.items() if k not in ("key", "text")} for p in passages],
+    )
+    return store, [p["key"] for p in passages], stamps
+
+
+def _build_dense():
+    from app.retrieval.dense_retrieval import DenseRetriever, QueryEmbeddingCache
+
+    return DenseRetriever(
+        get("store"),
+        cache_dir=INDEX_DIR,
+        index_type=DENSE_INDEX_TYPE,
+        index_params=DENSE_INDEX_PARAMS,
+        storage=DENSE_STORAGE,
+        rescore_factor=DENSE_RESCORE_FACTOR,
+        query_cache=QueryEmbeddingCache(
+            QUERY_EMBEDDING_CACHE_BYTES,
+            disk_dir=QUERY_EMBEDDING_CACHE_DIR,
+            max_disk_bytes=QUERY_EMBEDDING_CACHE_DISK_BYTES,
+        ),
+    )
+
+
+def _build_sparse():
+    from app.retrieval.sparse_retrieval import SparseRetriever
+
+    return SparseRetriever(get("store"))
+
+
+def _build_hybrid():
+    from app.retrieval.hybrid_retrieval import HybridRetriever
+
+    return HybridRetriever(
+        get("dense"), get("sparse"), strategy=FUSION_STRATEGY, candidate_budget=HYBRID_CANDIDATES
+    )
+
+
+def _build_ranker():
+    from app.ranking.ranker import RankingOrchestrator
+
+    return RankingOrchestrator(get("store"))
+
+
+def _build_indexer():
+    from app.ingestion import IncrementalIndexer
+
+    _, keys, stamps = get("corpus")
+    indexer = IncrementalIndexer(
+        get("dense"), get("sparse"), get("ranker").feature_extractor, keys=keys
+    )
+    for path, stamp in stamps.items():
+        indexer.fingerprints.mark_source(path, stamp)
+    return indexer
+
+
+def _build_corpus_drift():
+    """What changed in the corpus since the last run; saves this run's fingerprints."""
+    from app.fingerprints import FingerprintTable
+
+    indexer = get("indexer")
+    baseline = FingerprintTable.load(FINGERPRINTS_PATH)
+    report = {"baseline": baseline is not None}
+    if baseline is not None:
+        report.update(
+            indexer.drift_report(
+                baseline,
+                token_threshold=TOKEN_DRIFT_THRESHOLD,
+                centroid_threshold=CENTROID_DRIFT_THRESHOLD,
+            )
+        )
+        if report["changed"]:
+            print(
+                f"Corpus changed since last run: {len(report['added'])} added, "
+                f"{len(report['removed'])} removed, {len(report['modified'])} modified"
+                + (" (distribution drift)" if report["distribution_drifted"] else "")
+            )
+    indexer.save_fingerprints(FINGERPRINTS_PATH)
+    return report
+
+
+def _build_reasoning():
+    from app.llm.constrained import ConstrainedReasoning
+
+    return ConstrainedReasoning(confidence_threshold=0.5)
+
+
+def _build_metrics_engine():
+    from app.metrics_engine import MetricsEngine
+
+    try:
+        return MetricsEngine.load(STRUCTURED_DATA_DIR)
+    except Exception as e:
+        # Answers fall back to text evidence rather than blocking warm-up
+        print(f"Failed to load metrics from {STRUCTURED_DATA_DIR}: {e}")
+        return MetricsEngine.empty()
+
+
+def _build_funnels():
+    from pathlib import Path
+
+    from app.funnels import FunnelEngine
+
+    engine = get("metrics_engine")
+    funnels = FunnelEngine(
+        Path(STRUCTURED_DATA_DIR) / "events.csv", users=engine.users, accounts=engine.accounts
+    )
+    try:
+        funnels.refresh()
+    except Exception as e:
+        print(f"Failed to load events for funnels: {e}")
+        return FunnelEngine(users=engine.users, accounts=engine.accounts)
+    return funnels
+
+
+def _build_log_writer():
+    from app.log_writer import BackgroundLogWriter
+
+    return BackgroundLogWriter(
+        max_records=LOG_BUFFER_RECORDS,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL_SECONDS,
+        fsync=LOG_FSYNC,
+        fsync_interval=LOG_FSYNC_INTERVAL_SECONDS,
+    )
+
+
+def _build_feedback_collector():
+    from app.feedback import FeedbackCollector
+
+    return FeedbackCollector(writer=get("log_writer"))
+
+
+def _build_metrics():
+    from app.monitoring import MetricsCollector
+
+    return MetricsCollector(writer=get("log_writer"))
+
+
+def _build_tracer():
+    from app.tracing import Tracer
+
+    return Tracer(
+        enabled=TRACING_ENABLED,
+        on_finish=lambda trace: get("metrics").record_stages(trace.stage_ms()),
+        profile_mode=PROFILE_MODE,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        slow_ms=PROFILE_SLOW_MS,
+        profile_dir=PROFILE_DIR,
+        interval_ms=PROFILE_INTERVAL_MS,
+    )
+
+
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "corpus": _build_corpus,
+    "store": lambda: get("corpus")[0],
+    "dense": _build_dense,
+    "sparse": _build_sparse,
+    "hybrid": _build_hybrid,
+    "ranker": _build_ranker,
+    "indexer": _build_indexer,
+    "corpus_drift": _build_corpus_drift,
+    "reasoning": _build_reasoning,
+    "metrics_engine": _build_metrics_engine,
+    "funnels": _build_funnels,
+    "log_writer": _build_log_writer,
+    "feedback_collector": _build_feedback_collector,
+    "metrics": _build_metrics,
+    "tracer": _build_tracer,
+    # Answers keyed on normalized query; namespaced by corpus + ranker version
+    "corpus_version": lambda: _corpus_version(get("store")),
+    "result_cache": lambda: TTLCache(
+        maxsize=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL_SECONDS
+    ),
+    # Bounded pool for the CPU-bound stages when called from the event loop
+    "executor": lambda: ThreadPoolExecutor(
+        max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline"
+    ),
+}
+
+_components: Dict[str, Any] = {}
+_components_lock = threading.RLock()
+_ready = threading.Event()
+
+
+def get(name: str) -> Any:
+    """Return the named component, building it (and its dependencies) on first use."""
+    component = _components.get(name)
+    if component is not None:
+        return component
+    if name not in _FACTORIES:
+        raise KeyError(f"Unknown pipeline component {name!r}")
+    with _components_lock:
+        if name not in _components:
+            _components[name] = _FACTORIES[name]()
+        return _components[name]
+
+
+def warm_up() -> None:
+    """Build every component (load the corpus, encode, fit BM25, load the ranker)."""
+    start = time.time()
+    for name in _FACTORIES:
+        get(name)
+    if not _ready.is_set():
+        _ready.set()
+        print(f"Pipeline ready in {time.time() - start:.1f}s")
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def __getattr__(name: str) -> Any:
+    # `pipeline.metrics`, `from app.pipeline import ranker`, ... resolve lazily
+    if name in _FACTORIES:
+        return get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def run_pipeline(query: str) -> Dict[str, Any]:
@@ -36,6 +316,7 @@ def run_pipeline(query: str) -> Dict[str, Any]:
             "citations": List[str],
             "confidence": float,
             "refused": bool,
+            "evidence": List[dict],  # metric summaries (see MetricsEngine.evidence)
             "latency_ms": float,
             "query_id": str
         }
@@ -43,48 +324,331 @@ def run_pipeline(query: str) -> Dict[str, Any]:
     query_id = str(uuid.uuid4())
     start_time = time.time()
 
+    with get("tracer").trace(query_id):
+        try:
+            cache_key = _cache_key(query)
+            cached = _cached_response(query, query_id, start_time, cache_key)
+            if cached is not None:
+                return cached
+
+            # Steps 1-2: Retrieve candidates (maximize recall), rank by usefulness
+            num_candidates, ranked = _retrieve_and_rank(query)
+            return _answer(query, query_id, start_time, cache_key, num_candidates, ranked)
+
+        except Exception as e:
+            return _error_response(query_id, start_time, e)
+
+
+def run_pipeline_batch(queries: List[str]) -> List[Dict[str, Any]]:
+    """
+    Batched pipeline: retrieval for all queries runs as one batch (one encode
+    call, one Q x N similarity pass); ranking and reasoning then run per query.
+
+    Returns one response per query, in order, shaped like `run_pipeline`.
+    Batches are not traced: their stages serve several queries at once.
+    """
+    query_ids = [str(uuid.uuid4()) for _ in queries]
+    start_time = time.time()
+
+    results: List[Any] = [None] * len(queries)
+    cache_keys = [_cache_key(query) for query in queries]
+    misses = []
+    for i, (query, query_id) in enumerate(zip(queries, query_ids)):
+        results[i] = _cached_response(query, query_id, start_time, cache_keys[i])
+        if results[i] is None:
+            misses.append(i)
+    if not misses:
+        return results
+
+    ranked_lists = {}
     try:
-        # Step 1: Retrieve candidates (maximize recall)
-        candidates = hybrid.search(query)
-
-        # Step 2: Rank by usefulness (LambdaRank)
-        ranked = ranker.rank_candidates(query, candidates, top_k=TOP_K)
-
-        # Step 3: Synthesize answer with constraints
-        answer = reasoning.synthesize_answer(query, ranked)
-
-        # Step 4: Log metrics
-        latency_ms = (time.time() - start_time) * 1000
-        metrics.record_query(
-            query_id=query_id,
-            latency_ms=latency_ms,
-            retrieval_recall=min(1.0, len(candidates) / max(len(docs), 1)),
-            ranker_ndcg=sum(r.get("rank_score", 0) for r in ranked)
-            / max(len(ranked), 1),
-            llm_refused=answer.get("refused", False),
-            confidence=answer.get("confidence", 0.0),
-        )
+        with get("indexer").reading():
+            candidate_lists = get("hybrid").search_ids_batch([queries[i] for i in misses])
+            for i, candidates in zip(misses, candidate_lists):
+                try:
+                    ranked_lists[i] = len(candidates[0]), _rank(queries[i], candidates)
+                except Exception as e:
+                    results[i] = _error_response(query_ids[i], start_time, e)
+    except Exception as e:
+        for i in misses:
+            results[i] = _error_response(query_ids[i], start_time, e)
+        return results
 
-        # Log interaction
-        feedback_collector.log_interaction(query, answer)
+    for i, (num_candidates, ranked) in ranked_lists.items():
+        try:
+            results[i] = _answer(
+                queries[i], query_ids[i], start_time, cache_keys[i], num_candidates, ranked
+            )
+        except Exception as e:
+            results[i] = _error_response(query_ids[i], start_time, e)
+    return results
 
-        return {
-            "query_id": query_id,
-            "answer": answer.get("answer"),
-            "citations": answer.get("citations", []),
-            "confidence": answer.get("confidence", 0.0),
-            "refused": answer.get("refused", False),
-            "latency_ms": latency_ms,
-        }
 
+async def run_pipeline_async(query: str) -> Dict[str, Any]:
+    """
+    Non-blocking variant of `run_pipeline` for the API.
+
+    Each CPU-bound stage runs on the bounded pipeline executor so the event loop
+    keeps serving other requests; log writes are handed to the background writer.
+    Stage spans measure the work itself, not time spent queued for a worker.
+    """
+    loop = asyncio.get_running_loop()
+    query_id = str(uuid.uuid4())
+    start_time = time.time()
+
+    try:
+        await _ensure_ready(loop)
     except Exception as e:
-        print(f"Pipeline error: {e}")
-        return {
-            "query_id": query_id,
-            "answer": None,
-            "citations": [],
-            "confidence": 0.0,
-            "refused": True,
-            "error": str(e),
-            "latency_ms": (time.time() - start_time) * 1000,
-        }
+        return _error_response(query_id, start_time, e)
+
+    with get("tracer").trace(query_id, own_thread=False):
+        try:
+            cache_key = _cache_key(query)
+            cached = _cached_response(query, query_id, start_time, cache_key)
+            if cached is not None:
+                return cached
+
+            executor = get("executor")
+            num_candidates, ranked = await loop.run_in_executor(
+                executor, bind(_retrieve_and_rank), query
+            )
+            answer = await loop.run_in_executor(executor, bind(_synthesize), query, ranked)
+            return _record(query, query_id, start_time, cache_key, num_candidates, ranked, answer)
+
+        except Exception as e:
+            return _error_response(query_id, start_time, e)
+
+
+async def run_pipeline_batch_async(queries: List[str]) -> List[Dict[str, Any]]:
+    """Non-blocking variant of `run_pipeline_batch`."""
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    try:
+        await _ensure_ready(loop)
+    except Exception as e:
+        return [_error_response(str(uuid.uuid4()), start_time, e) for _ in queries]
+    return await loop.run_in_executor(get("executor"), run_pipeline_batch, queries)
+
+
+async def _ensure_ready(loop: asyncio.AbstractEventLoop) -> None:
+    """Requests that arrive during warm-up wait for it off the event loop."""
+    if not _ready.is_set():
+        await loop.run_in_executor(get("executor"), warm_up)
+
+
+def compute_funnel(steps: List[str], **kwargs) -> Dict[str, Any]:
+    """Funnel over the event log, including events appended since the last call."""
+    funnels = get("funnels")
+    funnels.refresh()
+    return funnels.funnel(steps, **kwargs)
+
+
+def compute_cohorts(**kwargs) -> Dict[str, Any]:
+    """Retention cohorts over the event log, including newly appended events."""
+    funnels = get("funnels")
+    funnels.refresh()
+    return funnels.cohorts(**kwargs)
+
+
+async def run_analytics_async(fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]:
+    """Run `compute_funnel` / `compute_cohorts` on the pipeline executor."""
+    loop = asyncio.get_running_loop()
+    await _ensure_ready(loop)
+    return await loop.run_in_executor(get("executor"), lambda: fn(*args, **kwargs))
+
+
+async def log_feedback_async(query_id: str, helpful: bool, feedback: Optional[str] = None) -> bool:
+    """`FeedbackCollector.log_feedback` on the pipeline executor (it does SQLite and log I/O)."""
+    loop = asyncio.get_running_loop()
+    collector = get("feedback_collector")
+    return await loop.run_in_executor(
+        get("executor"), collector.log_feedback, query_id, helpful, feedback
+    )
+
+
+async def feedback_stats_async() -> Dict[str, Any]:
+    """`FeedbackCollector.get_feedback_stats` on the pipeline executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get("executor"), get("feedback_collector").get_feedback_stats)
+
+
+def ingest(
+    documents: Optional[Dict[str, str]] = None,
+    deleted_keys: Optional[Iterable[str]] = None,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    sync: bool = False,
+) -> Dict[str, Any]:
+    """Apply document adds/updates/deletes to the live indexes without a restart."""
+    from app.ingestion import ingest_sources
+
+    return ingest_sources(get("indexer"), documents, deleted_keys, sources=sources, sync=sync)
+
+
+def shutdown() -> None:
+    """Stop the pipeline executor and the hybrid retriever's pool, drain pending
+    log writes, checkpoint feedback stats and save corpus fingerprints for the
+    next run's drift check."""
+    if "executor" in _components:
+        _components["executor"].shutdown(wait=True)
+    if "hybrid" in _components:
+        _components["hybrid"].close()
+    if "log_writer" in _components:
+        _components["log_writer"].close()
+    if "feedback_collector" in _components:
+        _components["feedback_collector"].stats.save_checkpoint()
+    if "indexer" in _components:
+        _components["indexer"].save_fingerprints(FINGERPRINTS_PATH)
+
+
+def _retrieve(query: str) -> Candidates:
+    with span("retrieve"):
+        return get("hybrid").search_ids(query)
+
+
+def _retrieve_and_rank(query: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """(number of candidates, ranked top-k). Runs under the indexer's read lock:
+    doc ids must not be renumbered by a compaction before they are materialized."""
+    with get("indexer").reading():
+        candidates = _retrieve(query)
+        return len(candidates[0]), _rank(query, candidates)
+
+
+def _rank(query: str, candidates: Candidates) -> List[Dict[str, Any]]:
+    """Rank fused (doc_ids, scores, run_scores) and materialize only the top-k."""
+    doc_ids, fused, run_scores = candidates
+    with span("rank"):
+        positions, rank_scores = get("ranker").rank_ids(
+            query, doc_ids, run_scores[:, 0], run_scores[:, 1], top_k=TOP_K
+        )
+    with span("materialize"):
+        return get("store").materialize(
+            doc_ids[positions],
+            score=fused[positions],
+            dense_score=run_scores[positions, 0],
+            sparse_score=run_scores[positions, 1],
+            rank_score=rank_scores,
+        )
+
+
+def _synthesize(query: str, ranked: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reason over the ranked passages and attach metric evidence the query asks about."""
+    with span("synthesis"):
+        answer = get("reasoning").synthesize_answer(query, ranked)
+    # Evidence only supports the answer: failing to compute it drops the evidence
+    try:
+        with span("evidence"):
+            evidence = get("metrics_engine").evidence(query)
+    except Exception as e:
+        print(f"Metric evidence failed: {e}")
+        evidence = []
+    if evidence:
+        answer["evidence"] = evidence
+    return answer
+
+
+def _answer(
+    query: str,
+    query_id: str,
+    start_time: float,
+    cache_key: CacheKey,
+    num_candidates: int,
+    ranked: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Synthesize and log the answer for already-ranked passages."""
+    # Step 3: Synthesize answer with constraints, plus numeric evidence
+    answer = _synthesize(query, ranked)
+
+    return _record(query, query_id, start_time, cache_key, num_candidates, ranked, answer)
+
+
+def _record(
+    query: str,
+    query_id: str,
+    start_time: float,
+    cache_key: CacheKey,
+    num_candidates: int,
+    ranked: List[Dict[str, Any]],
+    answer: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Cache the answer, log metrics and the interaction, then build the response.
+
+    The answer is cached only if the corpus and ranker are still the ones the
+    query started with (the namespace in `cache_key`).
+    """
+    quality = {
+        "retrieval_recall": min(1.0, num_candidates / max(get("indexer").num_docs, 1)),
+        "ranker_ndcg": sum(r.get("rank_score", 0) for r in ranked)
+        / max(len(ranked), 1),
+    }
+    namespace, key = cache_key
+    get("result_cache").set(key, (answer, quality), namespace=namespace)
+    return _respond(query, query_id, start_time, answer, quality)
+
+
+def _cache_key(query: str) -> CacheKey:
+    """The current cache namespace (corpus, index and ranker versions) and query key."""
+    namespace = (get("corpus_version"), get("indexer").version, get("ranker").model.fingerprint())
+    return namespace, normalize_query(query)
+
+
+def _cached_response(query: str, query_id: str, start_time: float, cache_key: CacheKey):
+    """Serve a repeated query from the result cache, or None on a miss."""
+    namespace, key = cache_key
+    with span("cache_lookup"):
+        cache = get("result_cache")
+        cache.bind(namespace)
+        hit = cache.get(key)
+    get("metrics").record_cache("result", hit is not None)
+    if hit is None:
+        return None
+    answer, quality = hit
+    return _respond(query, query_id, start_time, answer, quality)
+
+
+def _respond(
+    query: str,
+    query_id: str,
+    start_time: float,
+    answer: Dict[str, Any],
+    quality: Dict[str, float],
+) -> Dict[str, Any]:
+    # Step 4: Log metrics
+    latency_ms = (time.time() - start_time) * 1000
+    trace = current_trace()
+    get("metrics").record_query(
+        query_id=query_id,
+        latency_ms=latency_ms,
+        retrieval_recall=quality["retrieval_recall"],
+        ranker_ndcg=quality["ranker_ndcg"],
+        llm_refused=answer.get("refused", False),
+        confidence=answer.get("confidence", 0.0),
+        stages_ms=trace.stage_ms() if trace is not None else None,
+    )
+
+    # Log interaction under the query_id the client sends feedback for
+    with span("log_interaction"):
+        get("feedback_collector").log_interaction(query, answer, interaction_id=query_id)
+
+    return {
+        "query_id": query_id,
+        "answer": answer.get("answer"),
+        "citations": answer.get("citations", []),
+        "confidence": answer.get("confidence", 0.0),
+        "refused": answer.get("refused", False),
+        "evidence": answer.get("evidence", []),
+        "latency_ms": latency_ms,
+    }
+
+
+def _error_response(query_id: str, start_time: float, e: Exception) -> Dict[str, Any]:
+    print(f"Pipeline error: {e}")
+    return {
+        "query_id": query_id,
+        "answer": None,
+        "citations": [],
+        "confidence": 0.0,
+        "refused": True,
+        "evidence": [],
+        "error": str(e),
+        "latency_ms": (time.time() - start_time) * 1000,
+    }
@@ -1,10 +1,100 @@
 """Feature engineering for ranking model."""
 import numpy as np
-from typing import List
+from typing import Dict, List, Optional, Sequence
+
+NUM_FEATURES = 6
 
 
 class FeatureExtractor:
-    """Extracts features for LambdaRank model."""
+    """Extracts features for LambdaRank model.
+
+    When built with the corpus, per-document statistics (length feature and a
+    term -> sorted doc id postings map) are computed once, and
+    `extract_batch_ids` fills the feature matrix for candidates addressed by
+    doc id without re-tokenizing any document.
+    """
+
+    def __init__(self, documents: Optional[Sequence[str]] = None):
+        self._doc_length: Optional[np.ndarray] = None
+        self._postings: Dict[str, np.ndarray] = {}
+        if documents is not None:
+            self.index_documents(documents)
+
+    @property
+    def indexed(self) -> bool:
+        return self._doc_length is not None
+
+    def index_documents(self, documents: Sequence[str]) -> None:
+        """Precompute document-side features for the corpus."""
+        self._doc_length = np.empty(0, dtype=np.float32)
+        self._postings = {}
+        self.add_documents(documents)
+
+    def add_documents(self, documents: List[str]) -> np.ndarray:
+        """Precompute features for documents appended to the corpus; returns their ids."""
+        if self._doc_length is None:
+            self._doc_length = np.empty(0, dtype=np.float32)
+        start = len(self._doc_length)
+        postings: Dict[str, List[int]] = {}
+        lengths = np.empty(len(documents), dtype=np.float32)
+        for i, doc in enumerate(documents):
+            lengths[i] = len(doc.split())
+            for term in set(doc.lower().split()):
+                postings.setdefault(term, []).append(start + i)
+
+        # doc ids only grow, so appending keeps every posting sorted
+        for term, ids in postings.items():
+            new = np.asarray(ids, dtype=np.int64)
+            old = self._postings.get(term)
+            self._postings[term] = new if old is None else np.concatenate([old, new])
+        self._doc_length = np.concatenate([self._doc_length, np.minimum(1.0, lengths / 500.0)])
+        return np.arange(start, len(self._doc_length), dtype=np.int64)
+
+    def delete_documents(self, doc_ids) -> None:
+        """No-op: deleted documents never reach ranking; `compact` drops them."""
+
+    def compact(self, remap: np.ndarray) -> None:
+        """Renumber documents after corpus compaction (remap: old -> new id, -1 = removed)."""
+        for term, ids in list(self._postings.items()):
+            new_ids = remap[ids]
+            new_ids = new_ids[new_ids >= 0]
+            if len(new_ids):
+                self._postings[term] = new_ids
+            else:
+                del self._postings[term]
+        self._doc_length = self._doc_length[remap >= 0]
+
+    def extract_batch_ids(
+        self,
+        query: str,
+        doc_ids: Sequence[int],
+        dense_scores: Sequence[float],
+        sparse_scores: Sequence[float],
+        recency_decay: float = 1.0,
+        feedback_signal: float = 0.5,
+    ) -> np.ndarray:
+        """Extract features for indexed documents; same columns as `extract_features`."""
+        if not self.indexed:
+            raise RuntimeError("FeatureExtractor.index_documents() has not been called")
+
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        features = np.empty((len(doc_ids), NUM_FEATURES), dtype=np.float32)
+        features[:, 0] = dense_scores
+        features[:, 1] = sparse_scores
+        features[:, 2] = self._doc_length[doc_ids]
+
+        overlap = np.zeros(len(doc_ids), dtype=np.float32)
+        for term in set(query.lower().split()):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            pos = np.minimum(np.searchsorted(posting, doc_ids), len(posting) - 1)
+            overlap += posting[pos] == doc_ids
+        features[:, 3] = overlap / max(len(query.split()), 1)
+
+        features[:, 4] = recency_decay
+        features[:, 5] = feedback_signal
+        return features
 
     @staticmethod
     def extract_features(
@@ -47,8 +137,7 @@ class FeatureExtractor:
         sparse_scores: List[float],
     ) -> np.ndarray:
         """Extract features for a batch of documents."""
-        features_list = []
-        for doc, ds, ss in zip(documents, dense_scores, sparse_scores):
-            feat = FeatureExtractor.extract_features(query, doc, ds, ss)
-            features_list.append(feat)
-        return np.array(features_list, dtype=np.float32)
+        features = np.empty((len(documents), NUM_FEATURES), dtype=np.float32)
+        for i, (doc, ds, ss) in enumerate(zip(documents, dense_scores, sparse_scores)):
+            features[i] = FeatureExtractor.extract_features(query, doc, ds, ss)
+        return features
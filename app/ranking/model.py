@@ -34,8 +34,8 @@ class LambdaRankModel:
 
     def rank(self, features: np.ndarray) -> np.ndarray:
         """
-        Rank candidates using the model.
-        Returns scores in descending order.
+        Score candidates using the model.
+        Returns one score per input row, aligned with `features`.
         """
         if self.model is not None and LIGHTGBM_AVAILABLE:
             scores = self.model.predict(features)
@@ -45,8 +45,20 @@ class LambdaRankModel:
             weights = np.array([0.45, 0.35, 0.01, 0.1, 0.05, 0.04], dtype=np.float32)
             scores = features @ weights
 
-        # Return scores in descending order
-        return np.array(sorted(scores, reverse=True))
+        return np.asarray(scores, dtype=np.float32)
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Indices of the k highest scores, best first (ties keep input order).
+        Uses argpartition so only the selected k are sorted.
+        """
+        n = len(scores)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        idx = np.arange(n) if k == n else np.argpartition(-scores, k - 1)[:k]
+        return idx[np.lexsort((idx, -scores[idx]))]
 
     def train(
         self, X: np.ndarray, y: np.ndarray, group_sizes: List[int], epochs: int = 100
@@ -76,6 +88,10 @@ class LambdaRankModel:
             self.model_path.parent.mkdir(parents=True, exist_ok=True)
             self.model.save_model(str(self.model_path))
 
+    def fingerprint(self) -> str:
+        """Identifies the loaded model; changes whenever it is (re)loaded or trained."""
+        return f"{self.version}:{self.created_at}"
+
     # IMPORTANT: tests expect metadata()
     def metadata(self) -> Dict[str, Any]:
         return {
@@ -1,16 +1,17 @@
 """Ranking orchestration."""
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from app.ranking.features import FeatureExtractor
 from app.ranking.model import LambdaRankModel
+from app.tracing import span
 
 
 class RankingOrchestrator:
     """Orchestrates retrieval candidates through ranking."""
 
-    def __init__(self):
+    def __init__(self, documents: Optional[Sequence[str]] = None):
         self.model = LambdaRankModel()
-        self.feature_extractor = FeatureExtractor()
+        self.feature_extractor = FeatureExtractor(documents)
 
     def rank_candidates(
         self, query: str, candidates: List[Dict[str, Any]], top_k: int = 5
@@ -19,24 +20,54 @@ class RankingOrchestrator:
         if not candidates:
             return []
 
-        docs = [c["text"] for c in candidates]
-        dense_scores = [c.get("score", 0.5) for c in candidates]
-        sparse_scores = [c.get("score", 0.5) for c in candidates]
+        # Hybrid candidates carry per-retriever scores; plain ones only "score"
+        dense_scores = [c.get("dense_score", c.get("score", 0.5)) for c in candidates]
+        sparse_scores = [c.get("sparse_score", c.get("score", 0.5)) for c in candidates]
 
-        features = self.feature_extractor.extract_batch(
-            query, docs, dense_scores, sparse_scores
-        )
+        if self.feature_extractor.indexed and all("id" in c for c in candidates):
+            features = self.feature_extractor.extract_batch_ids(
+                query, [c["id"] for c in candidates], dense_scores, sparse_scores
+            )
+        else:
+            docs = [c["text"] for c in candidates]
+            features = self.feature_extractor.extract_batch(
+                query, docs, dense_scores, sparse_scores
+            )
 
         rank_scores = self.model.rank(features)
 
+        # Only the selected top_k candidates are copied
         ranked = []
-        for i, cand in enumerate(candidates):
-            cand_copy = cand.copy()
+        for i in self.model.top_k(rank_scores, top_k).tolist():
+            cand_copy = candidates[i].copy()
             cand_copy["rank_score"] = float(rank_scores[i])
             ranked.append(cand_copy)
+        return ranked
 
-        ranked = sorted(ranked, key=lambda x: x["rank_score"], reverse=True)
-        return ranked[:top_k]
+    def rank_ids(
+        self,
+        query: str,
+        doc_ids: np.ndarray,
+        dense_scores: np.ndarray,
+        sparse_scores: np.ndarray,
+        top_k: int = 5,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank candidates given as id/score arrays (requires an indexed extractor).
+
+        Returns (positions, rank_scores) for the top_k candidates, best first;
+        positions index into the input arrays.
+        """
+        if len(doc_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        with span("features"):
+            features = self.feature_extractor.extract_batch_ids(
+                query, doc_ids, dense_scores, sparse_scores
+            )
+        with span("ranker_model"):
+            rank_scores = self.model.rank(features)
+            positions = self.model.top_k(rank_scores, top_k)
+        return positions, rank_scores[positions]
 
 
 def simple_rank(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
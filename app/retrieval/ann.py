@@ -0,0 +1,244 @@
+"""Approximate nearest-neighbor FAISS indexes for dense retrieval.
+
+Index types (all inner product over normalized vectors):
+- "flat": exact IndexFlatIP; cost grows linearly with the corpus
+- "ivf_flat": inverted file over `nlist` k-means cells, `nprobe` cells scanned per query
+- "hnsw": HNSW graph with `hnsw_m` links per node, `ef_search` candidates per query
+- "ivf_pq": IVF cells with product-quantized codes (`pq_m` sub-vectors of `pq_nbits`
+  bits), so the corpus fits in memory at tens of millions of passages
+
+Flat, IVF-Flat and HNSW can also store vectors scalar-quantized
+(`storage="float16"` or `"int8"`) instead of float32.
+
+Build parameters (`nlist`, `hnsw_m`, `ef_construction`, `pq_m`, `pq_nbits`)
+fix the index layout; search parameters (`nprobe`, `ef_search`) can be
+changed on a built index. `recall_latency_report` measures recall@k and
+query latency of any configuration against the exact flat baseline.
+"""
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import faiss  # type: ignore
+except Exception:
+    faiss = None  # type: ignore
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+DEFAULT_PARAMS: Dict[str, Any] = {
+    "nlist": 1024,
+    "nprobe": 16,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "pq_m": 48,
+    "pq_nbits": 8,
+    "train_size": 100_000,
+}
+
+# FAISS wants at least this many training points per k-means centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+_BUILD_KEYS = {
+    "flat": (),
+    "ivf_flat": ("nlist",),
+    "hnsw": ("hnsw_m", "ef_construction"),
+    "ivf_pq": ("nlist", "pq_m", "pq_nbits"),
+}
+_SEARCH_KEYS = {"flat": (), "ivf_flat": ("nprobe",), "hnsw": ("ef_search",), "ivf_pq": ("nprobe",)}
+
+
+def resolve_params(params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    merged = dict(DEFAULT_PARAMS)
+    merged.update(params or {})
+    return merged
+
+
+def index_signature(
+    index_type: str, params: Optional[Dict[str, Any]] = None, storage: str = "float32"
+) -> str:
+    """Stable name for an index layout, used in persisted file names."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+    params = resolve_params(params)
+    parts = [index_type] + [f"{k}{params[k]}" for k in _BUILD_KEYS[index_type]]
+    if storage != "float32" and index_type != "ivf_pq":
+        parts.append(storage)
+    return "-".join(parts)
+
+
+def _scalar_quantizer(storage: str):
+    if storage == "float32":
+        return None
+    if storage == "float16":
+        return faiss.ScalarQuantizer.QT_fp16
+    if storage == "int8":
+        return faiss.ScalarQuantizer.QT_8bit
+    raise ValueError(f"Unknown storage {storage!r}; expected float32, float16 or int8")
+
+
+def _training_sample(emb: np.ndarray, train_size: int, seed: int = 0) -> np.ndarray:
+    """Up to `train_size` rows, sampled in file order so memmapped corpora read sequentially."""
+    if len(emb) <= train_size:
+        return np.ascontiguousarray(emb, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(len(emb), train_size, replace=False))
+    return np.ascontiguousarray(emb[rows], dtype=np.float32)
+
+
+def build_index(
+    emb: np.ndarray,
+    index_type: str = "flat",
+    params: Optional[Dict[str, Any]] = None,
+    storage: str = "float32",
+):
+    """Create, train and fill a FAISS index over `emb` (rows: normalized vectors)."""
+    if faiss is None:
+        raise RuntimeError("faiss is not installed")
+    index_signature(index_type)  # validates the type
+    qtype = _scalar_quantizer(storage)
+    params = resolve_params(params)
+    n, dim = emb.shape
+
+    # Too few vectors to train the requested quantizers: degrade to a smaller layout
+    nlist = max(1, min(params["nlist"], n // _MIN_POINTS_PER_CENTROID))
+    if index_type == "ivf_pq" and (n < 2 ** params["pq_nbits"] or dim % params["pq_m"]):
+        print(f"Cannot train IVF-PQ (n={n}, dim={dim}, pq_m={params['pq_m']}); using IVF-Flat")
+        index_type = "ivf_flat"
+
+    if (index_type == "flat" or n == 0) and qtype is None:
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "flat" or n == 0:
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(dim, qtype, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat" and qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "ivf_flat":
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dim, nlist, qtype, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist, params["pq_m"], params["pq_nbits"], faiss.METRIC_INNER_PRODUCT
+            )
+
+    if not index.is_trained and n:
+        index.train(_training_sample(emb, params["train_size"]))
+
+    # Add in slices so a memmapped corpus is never copied whole
+    step = 65536
+    for start in range(0, n, step):
+        index.add(np.ascontiguousarray(emb[start:start + step], dtype=np.float32))
+    set_search_params(index, params)
+    return index
+
+
+def set_search_params(index, params: Optional[Dict[str, Any]] = None) -> None:
+    """Apply `nprobe` / `ef_search` to an IVF or HNSW index (no-op for flat)."""
+    params = resolve_params(params)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        ivf.nprobe = min(params["nprobe"], ivf.nlist)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = params["ef_search"]
+
+
+def recall_latency_report(
+    emb: np.ndarray,
+    queries: np.ndarray,
+    configs: Sequence[Tuple[str, Dict[str, Any]]],
+    k: int = 10,
+) -> List[Dict[str, Any]]:
+    """
+    Recall@k and latency of each (index_type, params) config versus exact search.
+
+    A config's params may include "storage" (float16 / int8) to measure the
+    raw recall of a scalar-quantized index, before any rescoring.
+
+    Returns one row per config (the flat baseline first):
+        {"index_type", "params", "build_s", "recall", "latency_ms_mean",
+         "latency_ms_p50", "latency_ms_p99"}
+    latencies are per query, searched one at a time as the API does.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(emb))
+    truth = None
+    rows = []
+    for index_type, params in [("flat", {})] + list(configs):
+        start = time.perf_counter()
+        storage = params.get("storage", "float32")
+        index = build_index(emb, index_type, params, storage=storage)
+        build_s = time.perf_counter() - start
+
+        found = np.empty((len(queries), k), dtype=np.int64)
+        latencies = np.empty(len(queries))
+        for i in range(len(queries)):
+            start = time.perf_counter()
+            _, ids = index.search(queries[i:i + 1], k)
+            latencies[i] = (time.perf_counter() - start) * 1000
+            found[i] = ids[0]
+        if truth is None:
+            truth = found
+
+        hits = sum(len(np.intersect1d(f[f >= 0], t)) for f, t in zip(found, truth))
+        resolved = resolve_params(params)
+        rows.append(
+            {
+                "index_type": index_type,
+                "params": {
+                    key: resolved[key]
+                    for key in _BUILD_KEYS[index_type] + _SEARCH_KEYS[index_type]
+                },
+                "storage": "pq" if index_type == "ivf_pq" else storage,
+                "build_s": build_s,
+                "recall": hits / max(truth.size, 1),
+                "latency_ms_mean": float(latencies.mean()),
+                "latency_ms_p50": float(np.percentile(latencies, 50)),
+                "latency_ms_p99": float(np.percentile(latencies, 99)),
+            }
+        )
+    return rows
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'index':<10} {'storage':<8} {'params':<36} {'build_s':>8} {'recall':>7} {'p50_ms':>8} {'p99_ms':>8}"]
+    for r in rows:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items())
+        lines.append(
+            f"{r['index_type']:<10} {r['storage']:<8} {params:<36} {r['build_s']:>8.2f} {r['recall']:>7.3f} "
+            f"{r['latency_ms_p50']:>8.3f} {r['latency_ms_p99']:>8.3f}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Synthetic benchmark: python -m app.retrieval.ann [num_vectors]
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    # Clustered vectors behave more like sentence embeddings than uniform noise
+    centers = rng.standard_normal((256, 384)).astype(np.float32)
+    emb = centers[rng.integers(0, 256, n)] + 0.5 * rng.standard_normal((n, 384)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    queries = emb[rng.choice(n, 200, replace=False)] + 0.1 * rng.standard_normal((200, 384)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    nlist = max(16, int(4 * np.sqrt(n)))
+    configs = [("ivf_flat", {"nlist": nlist, "nprobe": p}) for p in (4, 16, 64)]
+    configs += [("hnsw", {"ef_search": ef}) for ef in (32, 64, 128)]
+    configs += [("ivf_pq", {"nlist": nlist, "nprobe": p}) for p in (16, 64)]
+    configs += [("flat", {"storage": storage}) for storage in ("float16", "int8")]
+    print(format_report(recall_latency_report(emb, queries, configs, k=10)))
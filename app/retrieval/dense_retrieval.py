@@ -4,13 +4,49 @@ This module avoids importing heavy ML libraries (transformers/tensorflow/faiss)
 at import time. If `sentence_transformers` and `faiss` are available they will be
 used; otherwise a deterministic numpy-based embedding + brute-force search is
 used so unit tests can run in minimal environments.
+
+When a `cache_dir` is given, the document embedding matrix (and the FAISS index,
+if one is built) is persisted under a key derived from the corpus contents and
+the embedding backend. Later processes open the files instead of re-encoding:
+the matrix is loaded with `np.load(mmap_mode="r")`, so every worker maps the
+same page-cached file rather than holding a private copy.
+
+Documents can be added and deleted incrementally: new documents are encoded
+and appended to the matrix and FAISS index, deletions are tombstoned and
+filtered from results, and `compact()` drops tombstones and re-persists.
+
+The FAISS index type is configurable (see `app.retrieval.ann`): exact flat
+search, or IVF-Flat / HNSW / IVF-PQ approximate indexes whose query cost does
+not grow linearly with the corpus. ANN indexes are built with faiss whenever
+it is installed, even over the deterministic fallback embeddings.
+
+Vectors can be stored as float16 or int8 (`storage`) to cut the memory each
+search touches 2-4x: the FAISS index uses a scalar quantizer, or the numpy
+fallback scans a `QuantizedMatrix`. The top `k * rescore_factor` candidates
+are then rescored exactly against the float32 matrix, which stays memory-
+mapped and is only paged in for those rows.
+
+Query embeddings can be cached as well (`QueryEmbeddingCache`): an in-memory
+LRU bounded by bytes, optionally backed by a directory of `.npy` files that
+all workers on a host share. The directory is bounded too: reads refresh a
+file's mtime, and once it outgrows `max_disk_bytes` the least recently used
+files are removed.
 """
 
 import hashlib
-from typing import List, Optional
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 
+from app.cache import ByteLRUCache
+from app.retrieval import ann
+from app.retrieval.docstore import DocumentStore
+from app.retrieval.quantization import STORAGE_TYPES, QuantizedMatrix
+from app.tracing import span
+
 try:
     from sentence_transformers import SentenceTransformer  # type: ignore
 except Exception:
@@ -36,10 +72,152 @@ def _deterministic_embedding(text: str, dim: int = 384) -> np.ndarray:
     return v
 
 
+def _atomic_write(path: Path, write) -> None:
+    """Write `path` via a temp file + rename so concurrent readers never see partial files."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class QueryEmbeddingCache:
+    """Query vector cache: byte-bounded LRU in memory, optional shared disk tier.
+
+    Keys combine the embedding backend with the query text after whitespace
+    normalization. Case is preserved because cased models embed it.
+
+    The disk tier is bounded by `max_disk_bytes`. Each process tracks the bytes
+    it has written since the directory was last measured; once the estimate
+    passes the cap, the directory is rescanned and the files with the oldest
+    mtime are removed until it is back under `prune_to` of the cap.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        prune_to: float = 0.8,
+    ):
+        self.memory = ByteLRUCache(max_bytes)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.prune_to = prune_to
+        self._disk_bytes: Optional[int] = None
+
+    @staticmethod
+    def key(backend: str, text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{backend}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.npy"
+
+    def _disk_files(self) -> List[Tuple[float, int, Path]]:
+        """(mtime, size, path) of every cached vector; files removed mid-scan are skipped."""
+        files = []
+        for path in self.disk_dir.glob("*/*.npy"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def prune(self) -> int:
+        """Remove least recently used files until the disk tier is under `prune_to` of the cap.
+
+        Returns the number of files removed.
+        """
+        if self.disk_dir is None:
+            return 0
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        if total > self.max_disk_bytes:
+            target = self.max_disk_bytes * self.prune_to
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass  # another worker pruned it
+                except OSError as e:
+                    print(f"Failed to evict query embedding {path}: {e}")
+                    continue
+                total -= size
+                removed += 1
+        self._disk_bytes = total
+        return removed
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vec = self.memory.get(key)
+        if vec is not None or self.disk_dir is None:
+            return vec
+        path = self._disk_path(key)
+        try:
+            vec = np.load(path)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used for eviction
+        except OSError:
+            pass
+        self.memory.set(key, vec)
+        return vec
+
+    def set(self, key: str, vec: np.ndarray) -> None:
+        self.memory.set(key, vec)
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            if not path.exists():
+                try:
+                    _atomic_write(path, lambda f: np.save(f, vec))
+                except OSError as e:
+                    print(f"Failed to persist query embedding {path}: {e}")
+                    return
+                if self._disk_bytes is None:
+                    self.prune()
+                else:
+                    self._disk_bytes += vec.nbytes
+                    if self._disk_bytes > self.max_disk_bytes:
+                        self.prune()
+
+
 class DenseRetriever:
-    def __init__(self, docs: List[str], model_name: str = "sentence-transformers/all-MiniLM-L6-v2", dim: int = 384):
-        self.docs = docs
+    def __init__(
+        self,
+        docs,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        dim: int = 384,
+        cache_dir: Optional[str] = None,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        index_type: str = "flat",
+        index_params: Optional[Dict] = None,
+        storage: str = "float32",
+        rescore_factor: int = 4,
+    ):
+        # A DocumentStore is shared and maintained by its owner; a plain list is copied
+        self._owns_docs = not isinstance(docs, DocumentStore)
+        self.docs = list(docs) if self._owns_docs else docs
         self.dim = dim
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.query_cache = query_cache
+        self.index_type = index_type
+        self.index_params = ann.resolve_params(index_params)
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage {storage!r}; expected one of {STORAGE_TYPES}")
+        self.storage = storage
+        self.rescore_factor = max(1, rescore_factor)
+        self._index_signature = ann.index_signature(index_type, self.index_params, storage)
         self._model: Optional[object] = None
         self._use_real_model = False
 
@@ -52,45 +230,305 @@ class DenseRetriever:
                 self._model = None
                 self._use_real_model = False
 
-        # Build embeddings (either real model or deterministic fallback)
-        if self._use_real_model:
-            emb = self._model.encode(docs, normalize_embeddings=True)
-            emb = np.asarray(emb, dtype=np.float32)
-        else:
-            emb = np.vstack([_deterministic_embedding(d, dim=self.dim) for d in docs])
-
-        self.emb = emb
+        self.backend = self.model_name if self._use_real_model else f"deterministic-{self.dim}"
+        self.index_key = self._index_key()
+        self.emb = self._load_or_build_embeddings()
+        # Owned, over-allocated copy of `emb` created on the first incremental add
+        self._emb_buf: Optional[np.ndarray] = None
+        self._dead = np.empty(0, dtype=np.int64)
+        self._index_mapped = False
 
-        # If faiss is available and we used a real model, build an index for speed.
-        if faiss is not None and self._use_real_model:
-            self._index = faiss.IndexFlatIP(self.emb.shape[1])
-            self._index.add(self.emb)
+        # If faiss is available and we used a real model (or an ANN / quantized index was
+        # asked for), build an index for speed.
+        self._quant: Optional[QuantizedMatrix] = None
+        if faiss is not None and (
+            self._use_real_model or index_type != "flat" or storage != "float32"
+        ):
+            self._index = self._load_or_build_faiss()
             self._use_faiss = True
         else:
             self._index = None
             self._use_faiss = False
+            if storage != "float32":
+                self._quant = self._load_or_build_quantized()
 
-    def _encode(self, texts: List[str]) -> np.ndarray:
+    @property
+    def quantized(self) -> bool:
+        """Whether searches scan reduced-precision vectors and rescore candidates."""
+        return self.storage != "float32" or self.index_type == "ivf_pq"
+
+    @property
+    def num_deleted(self) -> int:
+        return len(self._dead)
+
+    def _index_key(self) -> str:
+        """Content hash of the corpus and the embedding backend that encodes it."""
+        h = hashlib.sha256()
+        h.update(self.backend.encode("utf-8"))
+        for d in self.docs:
+            h.update(b"\0")
+            h.update(d.encode("utf-8"))
+        return h.hexdigest()[:32]
+
+    def _cache_path(self, suffix: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"dense-{self.index_key}{suffix}"
+
+    def _build_embeddings(self, texts: Optional[List[str]] = None) -> np.ndarray:
+        """Encode documents (either real model or deterministic fallback); default: whole corpus."""
+        texts = list(self.docs) if texts is None else texts
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self._use_real_model:
+            emb = self._model.encode(texts, normalize_embeddings=True)
+            return np.asarray(emb, dtype=np.float32)
+        return np.vstack([_deterministic_embedding(d, dim=self.dim) for d in texts])
+
+    def _load_or_build_embeddings(self) -> np.ndarray:
+        path = self._cache_path(".npy")
+        if path is not None and path.exists():
+            try:
+                return np.load(path, mmap_mode="r")
+            except (OSError, ValueError) as e:
+                print(f"Failed to open dense index {path}: {e}. Rebuilding.")
+
+        emb = self._build_embeddings()
+        if path is None:
+            return emb
+
+        _atomic_write(path, lambda f: np.save(f, emb))
+        # Re-open as a read-only memmap so this process shares pages with its peers.
+        return np.load(path, mmap_mode="r")
+
+    def _load_or_build_quantized(self) -> QuantizedMatrix:
+        path = self._cache_path(f".{self.storage}.npy")
+        if path is not None and path.exists():
+            try:
+                return QuantizedMatrix.load(path, self.storage)
+            except (OSError, ValueError) as e:
+                print(f"Failed to open quantized index {path}: {e}. Rebuilding.")
+
+        quant = QuantizedMatrix.build(self.emb, self.storage)
+        if path is not None:
+            quant.save(path, lambda p, a: _atomic_write(p, lambda f: np.save(f, a)))
+            return QuantizedMatrix.load(path, self.storage)
+        return quant
+
+    def set_search_params(self, **params) -> None:
+        """Change `nprobe` / `ef_search` on the live ANN index."""
+        self.index_params.update(params)
+        if self._index is not None:
+            ann.set_search_params(self._index, self.index_params)
+
+    def _faiss_path(self) -> Optional[Path]:
+        # The float32 flat index keeps its original file name; other layouts
+        # are named by their build params and storage
+        plain = self.index_type == "flat" and self.storage == "float32"
+        return self._cache_path(".faiss" if plain else f".{self._index_signature}.faiss")
+
+    def _persisted_paths(self) -> List[Path]:
+        """Cache files backing the current index."""
+        if self.cache_dir is None:
+            return []
+        paths = [self._cache_path(".npy")]
+        if self._index is not None:
+            paths.append(self._faiss_path())
+        if self._quant is not None:
+            paths.append(self._cache_path(f".{self.storage}.npy"))
+        return paths
+
+    def _load_or_build_faiss(self):
+        path = self._faiss_path()
+        if path is not None and path.exists():
+            try:
+                flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+                index = faiss.read_index(str(path), flags)
+                self._index_mapped = True
+                ann.set_search_params(index, self.index_params)
+                return index
+            except RuntimeError:
+                try:
+                    index = faiss.read_index(str(path))
+                    ann.set_search_params(index, self.index_params)
+                    return index
+                except RuntimeError as e:
+                    print(f"Failed to read FAISS index {path}: {e}. Rebuilding.")
+
+        self._index_mapped = False
+        index = ann.build_index(self.emb, self.index_type, self.index_params, storage=self.storage)
+        if path is not None:
+            _atomic_write(path, lambda f: f.write(faiss.serialize_index(index).tobytes()))
+        return index
+
+    def add_documents(self, texts: List[str], embeddings: Optional[np.ndarray] = None) -> np.ndarray:
+        """Encode only `texts` and append them to the index; returns their new ids.
+
+        `embeddings` are used instead of encoding when the caller already has
+        them (e.g. encoded ahead of taking a lock).
+        """
+        start = len(self.emb)
+        new = self._build_embeddings(texts) if embeddings is None else embeddings
+        end = start + len(new)
+
+        if self._emb_buf is None or len(self._emb_buf) < end:
+            # Grow geometrically so repeated small adds stay amortized O(new docs)
+            buf = np.empty((max(end, int(1.5 * start) + 16), self.dim), dtype=np.float32)
+            buf[:start] = self.emb
+            self._emb_buf = buf
+        self._emb_buf[start:end] = new
+
+        if self._index is not None:
+            if self._index_mapped:
+                # A memory-mapped FAISS index is read-only; take an owned copy first
+                self._index = faiss.deserialize_index(faiss.serialize_index(self._index))
+                ann.set_search_params(self._index, self.index_params)
+                self._index_mapped = False
+            self._index.add(new)
+        if self._quant is not None:
+            self._quant.append(new)
+
+        # Publish texts before embeddings so concurrent searches never see an id without text
+        if self._owns_docs:
+            self.docs.extend(texts)
+        self.emb = self._emb_buf[:end]
+        return np.arange(start, end, dtype=np.int64)
+
+    def delete_documents(self, ids) -> None:
+        """Tombstone documents; they stop appearing in results immediately."""
+        self._dead = np.union1d(self._dead, np.asarray(ids, dtype=np.int64))
+
+    def compact(self) -> np.ndarray:
+        """Drop tombstoned documents and re-persist the index, deleting the
+        files of the index it replaces.
+
+        Returns an old id -> new id mapping (-1 for removed documents).
+        """
+        replaced = self._persisted_paths()
+        n = len(self.emb)
+        alive = np.ones(n, dtype=bool)
+        alive[self._dead] = False
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[alive] = np.arange(int(alive.sum()))
+
+        emb = np.asarray(self.emb)[alive]
+        # A shared store has already been compacted by its owner
+        if self._owns_docs:
+            self.docs = [d for d, keep in zip(self.docs, alive) if keep]
+        self._dead = np.empty(0, dtype=np.int64)
+        self._emb_buf = None
+        self.index_key = self._index_key()
+
+        path = self._cache_path(".npy")
+        if path is not None:
+            _atomic_write(path, lambda f: np.save(f, emb))
+            emb = np.load(path, mmap_mode="r")
+        self.emb = emb
+        if self._index is not None:
+            self._index = self._load_or_build_faiss()
+        if self._quant is not None:
+            self._quant = self._load_or_build_quantized()
+        for old in set(replaced) - set(self._persisted_paths()):
+            try:
+                old.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Failed to remove replaced index file {old}: {e}")
+        return remap
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
         if self._use_real_model and self._model is not None:
             return np.asarray(self._model.encode(texts, normalize_embeddings=True), dtype=np.float32)
         return np.vstack([_deterministic_embedding(t, dim=self.dim) for t in texts])
 
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode queries, running the model only for texts missing from the cache."""
+        if self.query_cache is None:
+            return self._encode_uncached(texts)
+
+        keys = [self.query_cache.key(self.backend, t) for t in texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            vec = self.query_cache.get(key)
+            if vec is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                out[i] = vec
+
+        if missing:
+            rows = [positions[0] for positions in missing.values()]
+            encoded = self._encode_uncached([" ".join(texts[i].split()) for i in rows])
+            for (key, positions), vec in zip(missing.items(), encoded):
+                out[positions] = vec
+                self.query_cache.set(key, vec.copy())
+        return out
+
     def search(self, query: str, k: int = 50):
-        q = self._encode([query])
-        if self._use_faiss and self._index is not None:
-            s, idx = self._index.search(q, k)
-            return [
-                {"text": self.docs[i], "score": float(s[0][j])}
-                for j, i in enumerate(idx[0])
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 50) -> List[List[dict]]:
+        """Search several queries with one encode call and one Q x N similarity pass."""
+        return [
+            [
+                {"id": i, "text": self.docs[i], "score": sc}
+                for i, sc in zip(ids.tolist(), scores.tolist())
             ]
+            for ids, scores in self.search_ids_batch(queries, k)
+        ]
+
+    def search_ids(self, query: str, k: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_ids_batch([query], k)[0]
 
-        # Fallback: brute-force dot product search using numpy.
-        sims = (self.emb @ q.T).flatten()
-        k = min(k, len(sims))
-        # select top k indices
-        if k == 0:
+    def search_ids_batch(
+        self, queries: List[str], k: int = 50
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Per-query (doc_ids, scores) arrays, best first; no text is touched."""
+        if not queries:
             return []
-        topk = np.argpartition(-sims, range(k))[:k]
-        topk_sorted = topk[np.argsort(-sims[topk])]
-        return [{"text": self.docs[i], "score": float(sims[i])} for i in topk_sorted]
+        with span("encode"):
+            q = self._encode(queries)
+        with span("dense_search"):
+            return self._search_vectors(q, k)
+
+    def _search_vectors(self, q: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        dead = self._dead
+        k = min(k, len(self.emb) - len(dead))
+        if k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in q]
+
+        # Quantized scores only shortlist candidates; the shortlist is rescored exactly
+        fetch = min(k * self.rescore_factor, len(self.emb) - len(dead)) if self.quantized else k
+
+        if self._use_faiss and self._index is not None:
+            # Over-fetch by the tombstone count so k live results remain after filtering
+            s, idx = self._index.search(q, min(fetch + len(dead), self._index.ntotal))
+            keep = idx >= 0
+            if len(dead):
+                keep &= ~np.isin(idx, dead)
+            runs = [(idx[row][keep[row]][:fetch], s[row][keep[row]][:fetch]) for row in range(len(q))]
+        else:
+            # Fallback: brute-force dot product search using numpy.
+            sims = self._quant.scores(q) if self._quant is not None else q @ np.asarray(self.emb).T
+            sims[:, dead] = -np.inf
+            # select top `fetch` indices per row, then order each row by score
+            topk = np.argpartition(-sims, fetch - 1, axis=1)[:, :fetch]
+            top_sims = np.take_along_axis(sims, topk, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind="stable")
+            topk = np.take_along_axis(topk, order, axis=1)
+            top_sims = np.take_along_axis(top_sims, order, axis=1)
+            runs = list(zip(topk, top_sims))
+
+        if self.quantized:
+            runs = [self._rescore(q[row], ids, k) for row, (ids, _) in enumerate(runs)]
+        return runs
 
+    def _rescore(self, query_vec: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact float32 scores for `ids`, best k first; reads only those rows of the matrix."""
+        if len(ids) == 0:
+            return ids, np.empty(0, dtype=np.float32)
+        rows = np.sort(ids)
+        exact = np.asarray(self.emb[rows], dtype=np.float32) @ query_vec
+        order = np.lexsort((rows, -exact))[:k]
+        return rows[order], exact[order]
@@ -0,0 +1,109 @@
+"""Columnar document store addressed by integer doc id.
+
+Texts live in one list and per-document attributes in parallel numpy
+columns (token count, date, source type code, source weight). The retrieval
+and ranking path passes only id/score arrays around; `materialize` builds
+result dicts for the final top-k.
+
+When a store is handed to the retrievers it is shared: its owner (the
+`IncrementalIndexer`) appends and compacts it, and the retrievers only index
+the ids.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+_NO_DATE = np.datetime64("NaT", "D")
+
+
+class DocumentStore:
+    """Texts plus metadata columns, one row per document."""
+
+    def __init__(
+        self,
+        texts: Sequence[str] = (),
+        metadata: Optional[Sequence[Dict[str, Any]]] = None,
+    ):
+        self._texts: List[str] = []
+        self.token_counts = np.empty(0, dtype=np.int32)
+        self.dates = np.empty(0, dtype="datetime64[D]")
+        self.weights = np.empty(0, dtype=np.float32)
+        self.source_codes = np.empty(0, dtype=np.int16)
+        self.source_types: List[str] = []
+        self._source_code: Dict[str, int] = {}
+        self.append(texts, metadata)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __getitem__(self, doc_id: int) -> str:
+        return self._texts[doc_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._texts)
+
+    def _code(self, source_type: Optional[str]) -> int:
+        if source_type is None:
+            return -1
+        code = self._source_code.get(source_type)
+        if code is None:
+            code = self._source_code[source_type] = len(self.source_types)
+            self.source_types.append(source_type)
+        return code
+
+    def append(
+        self,
+        texts: Sequence[str],
+        metadata: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> np.ndarray:
+        """Append documents (and optional per-document metadata); returns their ids."""
+        start, n = len(self._texts), len(texts)
+        metadata = metadata if metadata is not None else [{}] * n
+
+        token_counts = np.fromiter((len(t.split()) for t in texts), dtype=np.int32, count=n)
+        dates = np.array(
+            [np.datetime64(m["date"], "D") if m.get("date") else _NO_DATE for m in metadata],
+            dtype="datetime64[D]",
+        )
+        weights = np.fromiter((m.get("weight", 1.0) for m in metadata), dtype=np.float32, count=n)
+        codes = np.fromiter(
+            (self._code(m.get("source_type")) for m in metadata), dtype=np.int16, count=n
+        )
+
+        # Columns are published before texts so a reader that sees an id finds its row
+        self.token_counts = np.concatenate([self.token_counts, token_counts])
+        self.dates = np.concatenate([self.dates, dates])
+        self.weights = np.concatenate([self.weights, weights])
+        self.source_codes = np.concatenate([self.source_codes, codes])
+        self._texts.extend(texts)
+        return np.arange(start, start + n, dtype=np.int64)
+
+    def compact(self, alive: np.ndarray) -> None:
+        """Keep only rows where `alive` is True; ids are renumbered densely."""
+        self._texts = [t for t, keep in zip(self._texts, alive) if keep]
+        self.token_counts = self.token_counts[alive]
+        self.dates = self.dates[alive]
+        self.weights = self.weights[alive]
+        self.source_codes = self.source_codes[alive]
+
+    def metadata(self, doc_id: int) -> Dict[str, Any]:
+        date = self.dates[doc_id]
+        code = int(self.source_codes[doc_id])
+        return {
+            "source_type": self.source_types[code] if code >= 0 else None,
+            "date": None if np.isnat(date) else str(date),
+            "weight": float(self.weights[doc_id]),
+            "token_count": int(self.token_counts[doc_id]),
+        }
+
+    def materialize(self, doc_ids: np.ndarray, **columns: np.ndarray) -> List[Dict[str, Any]]:
+        """Result dicts for `doc_ids`: id, text, metadata, plus one key per score column."""
+        columns = {name: np.asarray(values).tolist() for name, values in columns.items()}
+        results = []
+        for row, doc_id in enumerate(np.asarray(doc_ids).tolist()):
+            result = {"id": doc_id, "text": self._texts[doc_id]}
+            result.update(self.metadata(doc_id))
+            for name, values in columns.items():
+                result[name] = values[row]
+            results.append(result)
+        return results
@@ -0,0 +1,93 @@
+"""Rank fusion for hybrid retrieval.
+
+Each retriever contributes a run: doc ids and scores, best first. Runs are
+merged on integer doc ids with one of the strategies below, and the
+per-run scores are kept so the ranker can use them as separate features.
+
+Strategies:
+- "rrf": reciprocal-rank fusion, sum of w / (rrf_k + rank); ignores raw scores
+- "minmax": weighted sum of scores rescaled to [0, 1] within each run
+- "zscore": weighted sum of scores standardized within each run
+"""
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+STRATEGIES = ("rrf", "minmax", "zscore")
+
+Run = Tuple[np.ndarray, np.ndarray]
+
+
+def _normalize(scores: np.ndarray, strategy: str, rrf_k: int) -> np.ndarray:
+    if strategy == "rrf":
+        return 1.0 / (rrf_k + np.arange(1, len(scores) + 1, dtype=np.float32))
+    if strategy == "minmax":
+        lo, hi = scores.min(), scores.max()
+        if hi - lo < 1e-12:
+            return np.ones_like(scores)
+        return (scores - lo) / (hi - lo)
+    std = scores.std()
+    if std < 1e-12:
+        return np.zeros_like(scores)
+    return (scores - scores.mean()) / std
+
+
+def fuse(
+    runs: Sequence[Run],
+    strategy: str = "rrf",
+    weights: Optional[Sequence[float]] = None,
+    rrf_k: int = 60,
+    budget: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge retriever runs keyed on doc id.
+
+    Args:
+        runs: one (doc_ids, scores) pair per retriever, each sorted best first
+        strategy: one of STRATEGIES
+        weights: per-run weight (default: equal)
+        rrf_k: RRF rank offset
+        budget: keep at most this many fused candidates
+
+    Returns:
+        (doc_ids, fused_scores, run_scores) ordered by fused score, where
+        run_scores[i, r] is the raw score run r gave doc_ids[i] (0.0 if absent)
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy {strategy!r}; expected one of {STRATEGIES}")
+    if weights is None:
+        weights = [1.0] * len(runs)
+
+    runs = [
+        (np.asarray(ids, dtype=np.int64), np.asarray(scores, dtype=np.float32))
+        for ids, scores in runs
+    ]
+    sizes = [len(ids) for ids, _ in runs]
+    if sum(sizes) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, np.empty(0, dtype=np.float32), np.empty((0, len(runs)), dtype=np.float32)
+
+    all_ids = np.concatenate([ids for ids, _ in runs])
+    contrib = np.concatenate(
+        [
+            w * _normalize(scores, strategy, rrf_k)
+            for (_, scores), w in zip(runs, weights)
+            if len(scores)
+        ]
+    )
+    doc_ids, inverse = np.unique(all_ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=contrib, minlength=len(doc_ids)).astype(np.float32)
+
+    run_scores = np.zeros((len(doc_ids), len(runs)), dtype=np.float32)
+    offset = 0
+    for r, (_, scores) in enumerate(runs):
+        run_scores[inverse[offset:offset + len(scores)], r] = scores
+        offset += len(scores)
+
+    if budget is not None and budget < len(doc_ids):
+        budget = max(budget, 1)
+        part = np.argpartition(-fused, budget - 1)[:budget]
+        doc_ids, fused, run_scores = doc_ids[part], fused[part], run_scores[part]
+    order = np.lexsort((doc_ids, -fused))
+    return doc_ids[order], fused[order], run_scores[order]
+
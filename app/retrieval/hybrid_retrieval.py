@@ -1,15 +1,87 @@
+"""Hybrid retriever: dense and sparse runs fetched concurrently, then fused."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.retrieval.fusion import fuse
+from app.tracing import bind, span
+
+
 class HybridRetriever:
-    def __init__(self, dense, sparse):
+    def __init__(
+        self,
+        dense,
+        sparse,
+        strategy: str = "rrf",
+        weights: Optional[Sequence[float]] = None,
+        candidate_budget: int = 50,
+        rrf_k: int = 60,
+        parallel: bool = True,
+    ):
         self.dense = dense
         self.sparse = sparse
+        self.strategy = strategy
+        self.weights = weights
+        self.candidate_budget = candidate_budget
+        self.rrf_k = rrf_k
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid") if parallel else None
+
+    def close(self) -> None:
+        """Shut down the fan-out pool; later searches run both retrievers inline."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _fan_out(self, dense_call, sparse_call, arg):
+        """Run both retrievers, concurrently when a pool is configured."""
+        def sparse(a):
+            with span("sparse_search"):
+                return sparse_call(a)
+
+        pool = self._pool
+        if pool is None:
+            return dense_call(arg), sparse(arg)
+        sparse_future = pool.submit(bind(sparse), arg)
+        return dense_call(arg), sparse_future.result()
 
     def search(self, query):
-        d = self.dense.search(query)
-        s = self.sparse.search(query)
-        merged = {}
-        for r in d + s:
-            merged[r["text"]] = merged.get(r["text"], 0) + r["score"]
+        return self._to_dicts(self.search_ids(query))
+
+    def search_batch(self, queries: List[str]) -> List[List[dict]]:
+        """Batched search: dense queries are encoded and scored in one pass."""
+        return [self._to_dicts(fused) for fused in self.search_ids_batch(queries)]
+
+    def search_ids(self, query: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(doc_ids, fused_scores, run_scores) where run_scores[:, 0/1] are dense/sparse."""
+        d, s = self._fan_out(self.dense.search_ids, self.sparse.search_ids, query)
+        return self._fuse(d, s)
+
+    def search_ids_batch(self, queries: List[str]) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        dense_runs, sparse_runs = self._fan_out(
+            self.dense.search_ids_batch, self.sparse.search_ids_batch, queries
+        )
+        return [self._fuse(d, s) for d, s in zip(dense_runs, sparse_runs)]
+
+    def _fuse(self, dense_run, sparse_run):
+        with span("fusion"):
+            return fuse(
+                [dense_run, sparse_run],
+                strategy=self.strategy,
+                weights=self.weights,
+                rrf_k=self.rrf_k,
+                budget=self.candidate_budget,
+            )
+
+    def _to_dicts(self, fused) -> List[dict]:
+        doc_ids, scores, run_scores = fused
         return [
-            {"text": t, "score": s}
-            for t, s in sorted(merged.items(), key=lambda x: x[1], reverse=True)
+            {
+                "id": i,
+                "text": self.dense.docs[i],
+                "score": score,
+                "dense_score": ds,
+                "sparse_score": ss,
+            }
+            for i, score, (ds, ss) in zip(doc_ids.tolist(), scores.tolist(), run_scores.tolist())
         ]
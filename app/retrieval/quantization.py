@@ -0,0 +1,112 @@
+"""Reduced-precision copies of the dense embedding matrix.
+
+Brute-force search scans every row, so scanning a float16 (2x smaller) or
+int8 (4x smaller) copy instead of the float32 matrix shrinks the memory each
+worker touches per query by the same factor. Scores from the compact copy
+only pick candidates; the retriever rescores those few rows against the
+float32 matrix, which stays memory-mapped on disk and is paged in only for
+the rows actually read.
+
+int8 uses per-dimension affine quantization, x ~= offset + scale * code,
+with codes in 0..255 (the same scheme as FAISS's QT_8bit).
+"""
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+# Rows converted to float32 at a time while scoring
+_BLOCK_ROWS = 16384
+
+
+class QuantizedMatrix:
+    """A float16 or int8 copy of an embedding matrix that can score queries."""
+
+    def __init__(
+        self,
+        kind: str,
+        data: np.ndarray,
+        scale: Optional[np.ndarray] = None,
+        offset: Optional[np.ndarray] = None,
+    ):
+        if kind not in STORAGE_TYPES[1:]:
+            raise ValueError(f"Unknown quantized storage {kind!r}; expected float16 or int8")
+        self.kind = kind
+        self.data = data
+        self.scale = scale
+        self.offset = offset
+        self._buf: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    @classmethod
+    def build(cls, emb: np.ndarray, kind: str) -> "QuantizedMatrix":
+        emb = np.asarray(emb, dtype=np.float32)
+        if kind == "float16":
+            return cls(kind, emb.astype(np.float16))
+        if len(emb):
+            lo, hi = emb.min(axis=0), emb.max(axis=0)
+        else:
+            lo = hi = np.zeros(emb.shape[1], dtype=np.float32)
+        scale = np.maximum(hi - lo, 1e-12) / 255.0
+        matrix = cls(kind, np.empty((0, emb.shape[1]), dtype=np.uint8), scale, lo)
+        matrix.data = matrix._encode(emb)
+        return matrix
+
+    def _encode(self, rows: np.ndarray) -> np.ndarray:
+        if self.kind == "float16":
+            return np.asarray(rows, dtype=np.float16)
+        # Rows added later may fall outside the trained range; clip them to it
+        codes = np.rint((np.asarray(rows, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def _paths(self, path: Path):
+        return path, path.with_name(path.name.replace(".npy", ".params.npy"))
+
+    def save(self, path: Path, write) -> None:
+        """Persist via `write(path, array)` (the retriever's atomic writer)."""
+        data_path, params_path = self._paths(path)
+        if self.kind == "int8":
+            write(params_path, np.stack([self.scale, self.offset]))
+        write(data_path, np.asarray(self.data))
+
+    @classmethod
+    def load(cls, path: Path, kind: str) -> "QuantizedMatrix":
+        """Open a saved matrix memory-mapped; raises OSError/ValueError if unusable."""
+        matrix = cls(kind, np.empty(0))
+        data_path, params_path = matrix._paths(path)
+        if kind == "int8":
+            matrix.scale, matrix.offset = np.load(params_path)
+        matrix.data = np.load(data_path, mmap_mode="r")
+        return matrix
+
+    def append(self, rows: np.ndarray) -> None:
+        start, end = len(self.data), len(self.data) + len(rows)
+        if self._buf is None or len(self._buf) < end:
+            buf = np.empty((max(end, int(1.5 * start) + 16), self.data.shape[1]), dtype=self.data.dtype)
+            buf[:start] = self.data
+            self._buf = buf
+        self._buf[start:end] = self._encode(rows)
+        self.data = self._buf[:end]
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate queries @ matrix.T, converting one block of rows at a time."""
+        queries = np.asarray(queries, dtype=np.float32)
+        out = np.empty((len(queries), len(self.data)), dtype=np.float32)
+        if self.kind == "int8":
+            # q . (offset + scale * c) = q . offset + (q * scale) . c
+            bias = queries @ self.offset
+            queries = queries * self.scale
+        for start in range(0, len(self.data), _BLOCK_ROWS):
+            block = np.asarray(self.data[start:start + _BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        if self.kind == "int8":
+            out += bias[:, None]
+        return out
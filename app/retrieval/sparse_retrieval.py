@@ -1,32 +1,175 @@
-"""Sparse retriever with lazy imports and fallback.
+"""Sparse retriever backed by an in-process BM25 inverted index.
 
-This module avoids importing heavy dependencies at import time.
-If rank_bm25 is available, it will be used; otherwise a simple
-deterministic fallback using word frequency is used.
+Postings are held per term as compact numpy arrays (doc ids + term
+frequencies), so a query only touches the documents that contain at least
+one of its terms. Scoring follows the BM25Okapi variant from `rank_bm25`
+(including its epsilon floor for negative idf) so results are unchanged from
+the previous implementation, but cost is O(postings) instead of O(corpus).
+
+The index supports incremental updates: new documents extend the postings of
+their terms, deletions are tombstoned (filtered at query time, still counted
+in corpus statistics) until `compact()` drops them and renumbers doc ids.
 """
 
-from typing import List
 import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.retrieval.docstore import DocumentStore
+
+
+class BM25Index:
+    """Term -> postings inverted index with BM25Okapi scoring."""
+
+    def __init__(
+        self,
+        tokenized_docs: List[List[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        self.vocab: Dict[str, int] = {}
+        self.postings_docs: List[np.ndarray] = []
+        self.postings_tf: List[np.ndarray] = []
+        self.doc_len = np.empty(0, dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self.add_documents(tokenized_docs)
+
+    def add_documents(self, tokenized_docs: List[List[str]]) -> np.ndarray:
+        """Index new documents, extending postings in place; returns their doc ids."""
+        start = self.num_docs
+        new_postings: Dict[int, List[Tuple[int, int]]] = {}
+        for doc_id, tokens in enumerate(tokenized_docs, start):
+            for term, tf in Counter(tokens).items():
+                tid = self.vocab.get(term)
+                if tid is None:
+                    tid = self.vocab[term] = len(self.postings_docs)
+                    self.postings_docs.append(np.empty(0, dtype=np.int32))
+                    self.postings_tf.append(np.empty(0, dtype=np.float32))
+                new_postings.setdefault(tid, []).append((doc_id, tf))
+
+        # One concatenate per touched term; doc ids stay sorted within each posting
+        for tid, plist in new_postings.items():
+            arr = np.asarray(plist, dtype=np.int32).reshape(-1, 2)
+            self.postings_docs[tid] = np.concatenate([self.postings_docs[tid], arr[:, 0]])
+            self.postings_tf[tid] = np.concatenate(
+                [self.postings_tf[tid], arr[:, 1].astype(np.float32)]
+            )
+
+        lengths = np.fromiter(
+            (len(t) for t in tokenized_docs), dtype=np.float32, count=len(tokenized_docs)
+        )
+        self.doc_len = np.concatenate([self.doc_len, lengths])
+        self.alive = np.concatenate([self.alive, np.ones(len(lengths), dtype=bool)])
+        self._refresh_stats()
+        return np.arange(start, self.num_docs, dtype=np.int64)
+
+    def delete_documents(self, doc_ids) -> None:
+        """Tombstone documents so they are no longer returned."""
+        alive = self.alive.copy()
+        alive[np.asarray(doc_ids, dtype=np.int64)] = False
+        self.alive = alive
+
+    def compact(self) -> np.ndarray:
+        """Drop tombstoned documents and renumber; returns old -> new id (-1 if removed)."""
+        remap = np.full(self.num_docs, -1, dtype=np.int64)
+        remap[self.alive] = np.arange(int(self.alive.sum()))
+
+        vocab: Dict[str, int] = {}
+        postings_docs: List[np.ndarray] = []
+        postings_tf: List[np.ndarray] = []
+        for term, tid in self.vocab.items():
+            docs = self.postings_docs[tid]
+            keep = self.alive[docs]
+            if not keep.any():
+                continue
+            vocab[term] = len(postings_docs)
+            postings_docs.append(remap[docs[keep]].astype(np.int32))
+            postings_tf.append(self.postings_tf[tid][keep])
+
+        self.vocab, self.postings_docs, self.postings_tf = vocab, postings_docs, postings_tf
+        self.doc_len = self.doc_len[self.alive]
+        self.alive = np.ones(len(self.doc_len), dtype=bool)
+        self._refresh_stats()
+        return remap
 
-try:
-    from rank_bm25 import BM25Okapi
-except ImportError:
-    BM25Okapi = None  # type: ignore
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_len)
+
+    def _refresh_stats(self) -> None:
+        """Recompute corpus-level statistics (avgdl, idf) from the postings."""
+        n = self.num_docs
+        self.avgdl = float(self.doc_len.sum()) / n if n else 0.0
+
+        df = np.fromiter(
+            (len(p) for p in self.postings_docs), dtype=np.float64, count=len(self.postings_docs)
+        )
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        average_idf = float(idf.mean()) if len(idf) else 0.0
+        idf[idf < 0] = self.epsilon * average_idf
+        self.idf = idf.astype(np.float32)
+
+    def score(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (doc_ids, scores) for every document containing a query term."""
+        tids = [self.vocab[t] for t in tokens if t in self.vocab]
+        if not tids or self.avgdl == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        docs = np.concatenate([self.postings_docs[t] for t in tids])
+        tf = np.concatenate([self.postings_tf[t] for t in tids])
+        idf = np.repeat(self.idf[tids], [len(self.postings_docs[t]) for t in tids])
+
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+        contrib = idf * (tf * (self.k1 + 1) / (tf + norm))
+
+        doc_ids, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib).astype(np.float32)
+        live = self.alive[doc_ids]
+        if not live.all():
+            doc_ids, scores = doc_ids[live], scores[live]
+        return doc_ids, scores
+
+    def top_k(self, tokens: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the k best (doc_ids, scores), best first; ties break on doc id."""
+        doc_ids, scores = self.score(tokens)
+        if k <= 0 or len(scores) == 0:
+            return doc_ids[:0], scores[:0]
+        if k < len(scores):
+            part = np.argpartition(-scores, k - 1)[:k]
+            doc_ids, scores = doc_ids[part], scores[part]
+        order = np.lexsort((doc_ids, -scores))
+        return doc_ids[order], scores[order]
 
 
 class SparseRetriever:
-    def __init__(self, documents: List[str]):
-        self.documents = documents
-        tokenized = [self._tokenize(doc) for doc in documents]
-        
-        if BM25Okapi is not None:
-            self.bm25 = BM25Okapi(tokenized)
-            self._use_bm25 = True
-        else:
-            # Fallback: store tokenized docs and use word frequency
-            self.tokenized_docs = tokenized
-            self._use_bm25 = False
-            self.bm25 = None
+    def __init__(self, documents):
+        # A DocumentStore is shared and maintained by its owner; a plain list is copied
+        self._owns_docs = not isinstance(documents, DocumentStore)
+        self.documents = list(documents) if self._owns_docs else documents
+        self.index = BM25Index([self._tokenize(doc) for doc in documents])
+
+    def add_documents(self, texts: List[str]) -> np.ndarray:
+        """Index new documents; returns their ids."""
+        tokenized = [self._tokenize(t) for t in texts]
+        if self._owns_docs:
+            self.documents.extend(texts)
+        return self.index.add_documents(tokenized)
+
+    def delete_documents(self, ids) -> None:
+        self.index.delete_documents(ids)
+
+    def compact(self) -> np.ndarray:
+        remap = self.index.compact()
+        if self._owns_docs:
+            self.documents = [d for d, new_id in zip(self.documents, remap) if new_id >= 0]
+        return remap
 
     @staticmethod
     def _tokenize(text: str) -> List[str]:
@@ -35,23 +178,23 @@ class SparseRetriever:
         tokens = re.findall(r'\w+', text)
         return tokens
 
+    def search_ids(self, query: str, top_k: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc_ids, scores) of the best matches, best first."""
+        return self.index.top_k(self._tokenize(query), top_k)
+
+    def search_ids_batch(
+        self, queries: List[str], top_k: int = 50
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search_ids(q, top_k) for q in queries]
+
     def search(self, query: str, top_k: int = 50):
         """Search for documents matching the query."""
-        if self._use_bm25 and self.bm25 is not None:
-            scores = self.bm25.get_scores(self._tokenize(query))
-        else:
-            # Fallback: compute simple word overlap score
-            query_tokens = set(self._tokenize(query))
-            scores = []
-            for doc_tokens in self.tokenized_docs:
-                doc_token_set = set(doc_tokens)
-                overlap = len(query_tokens & doc_token_set)
-                score = overlap / max(len(query_tokens), 1)
-                scores.append(score)
-            scores = scores  # keep as list of floats
-
-        # Rank and return top-k
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:top_k]
+        doc_ids, scores = self.search_ids(query, top_k)
         return [
-            {"text": self.documents[i], "score": float(score)} for i, score in ranked
+            {"id": i, "text": self.documents[i], "score": float(s)}
+            for i, s in zip(doc_ids.tolist(), scores.tolist())
         ]
+
+    def search_batch(self, queries: List[str], top_k: int = 50) -> List[List[dict]]:
+        """Search several queries; each only touches its own postings."""
+        return [self.search(q, top_k) for q in queries]
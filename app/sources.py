@@ -0,0 +1,251 @@
+"""Streaming readers that turn raw sources into indexable passages.
+
+Every reader is a generator over the file: markdown is consumed section by
+section, JSON arrays are decoded record by record from fixed-size reads, and
+CSVs row by row. Nothing holds a whole file in memory, so multi-GB exports
+are processed in memory proportional to one record/section.
+
+A passage is a dict:
+    {"key": str, "text": str, "source": str, "source_type": str,
+     "date": Optional[str], "weight": float}
+
+Keys are "<configured path>:<suffix>:<chunk>" and stay the same when
+unrelated parts of a source change, so re-ingesting an edited file only
+touches the passages that actually changed:
+- markdown: the slug of the section's heading path
+- JSON: the record's `id_field`
+- CSV: the `id_field` of the first and last row packed into the passage
+Without an id field, JSON records and CSV passages are keyed on a hash of
+their text. Repeated suffixes within a file get a "~2", "~3", ... suffix.
+"""
+import csv
+import hashlib
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import CHUNK_OVERLAP, CHUNK_SIZE, SOURCE_METADATA_PATH, SOURCES
+
+_ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})")
+_TEXT_DATE = re.compile(r"\b([A-Z][a-z]{2})[a-z]* (\d{1,2}), (\d{4})\b")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_NON_SLUG = re.compile(r"[^a-z0-9]+")
+
+
+def extract_date(text: str) -> Optional[str]:
+    """First date in `text` as YYYY-MM-DD ("2025-01-18" or "Jan 18, 2025" forms)."""
+    m = _ISO_DATE.search(text)
+    if m:
+        return m.group(1)
+    m = _TEXT_DATE.search(text)
+    if m:
+        try:
+            return datetime.strptime(" ".join(m.groups()), "%b %d %Y").date().isoformat()
+        except ValueError:
+            return None
+    return None
+
+
+def _first_date(values) -> Optional[str]:
+    for value in values:
+        date = extract_date(value)
+        if date:
+            return date
+    return None
+
+
+def slugify(text: str) -> str:
+    return _NON_SLUG.sub("-", text.lower()).strip("-")
+
+
+def _content_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _unique(suffixes: Iterator[Tuple[str, List[str], Optional[str]]]):
+    """Disambiguate repeated suffixes and number each suffix's chunks."""
+    counts: Dict[str, int] = {}
+    for suffix, chunks, date in suffixes:
+        counts[suffix] = counts.get(suffix, 0) + 1
+        if counts[suffix] > 1:
+            suffix = f"{suffix}~{counts[suffix]}"
+        for i, chunk in enumerate(chunks):
+            yield f"{suffix}:{i}", chunk, date
+
+
+def chunk_words(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Split `text` into windows of `chunk_size` words sharing `overlap` words."""
+    words = text.split()
+    if len(words) <= chunk_size:
+        return [" ".join(words)] if words else []
+    step = max(chunk_size - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def iter_markdown_sections(path: str) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """Yield (heading path, body, date) per section; dates are inherited from parent headings."""
+    stack: List[Tuple[int, str, Optional[str]]] = []
+    body: List[str] = []
+
+    def emit():
+        text = " ".join(body).strip()
+        if text:
+            title = " > ".join(h for _, h, _ in stack[1:]) or (stack[0][1] if stack else "")
+            date = next((d for _, _, d in reversed(stack) if d), None)
+            yield title, text, date
+
+    with open(path, "r") as f:
+        for line in f:
+            m = _HEADING.match(line.strip())
+            if not m:
+                if line.strip():
+                    body.append(line.strip())
+                continue
+            yield from emit()
+            body = []
+            level, heading = len(m.group(1)), m.group(2).strip()
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, heading, extract_date(heading)))
+    yield from emit()
+
+
+def iter_json_records(path: str, read_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield elements of a top-level JSON array (or JSON Lines) without loading the file."""
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+    in_array = None  # unknown until the first non-whitespace character
+    with open(path, "r") as f:
+        eof = False
+        while not eof:
+            chunk = f.read(read_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ",")):
+                    pos += 1
+                if pos >= len(buf):
+                    break
+                if in_array is None:
+                    in_array = buf[pos] == "["
+                    pos += in_array
+                    continue
+                if in_array and buf[pos] == "]":
+                    return
+                try:
+                    record, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    break  # incomplete record; read more
+                yield record
+                pos = end
+
+
+def iter_csv_rows(path: str) -> Iterator[Dict[str, str]]:
+    with open(path, "r", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def load_source_weights(path: str = SOURCE_METADATA_PATH) -> Dict[str, float]:
+    try:
+        with open(path, "r") as f:
+            return {k: float(v.get("weight", 1.0)) for k, v in json.load(f).items()}
+    except (OSError, ValueError) as e:
+        print(f"Failed to load source metadata {path}: {e}")
+        return {}
+
+
+def _passages_for_source(
+    source: Dict[str, Any], chunk_size: int, overlap: int
+) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """Yield (key suffix, text, date) for one configured source."""
+    path, fmt = source["path"], source["format"]
+    id_field = source.get("id_field")
+
+    if fmt == "markdown":
+        def sections():
+            for title, body, date in iter_markdown_sections(path):
+                chunks = chunk_words(body, chunk_size, overlap)
+                if title:
+                    chunks = [f"{title}: {chunk}" for chunk in chunks]
+                yield slugify(title) or "untitled", chunks, date
+
+        yield from _unique(sections())
+
+    elif fmt == "json":
+        text_fields = source.get("text_fields")
+
+        def records():
+            for record in iter_json_records(path):
+                fields = text_fields or [k for k, v in record.items() if isinstance(v, str)]
+                text = ". ".join(str(record[k]).strip() for k in fields if record.get(k))
+                date = _first_date(str(v) for v in record.values())
+                record_id = record.get(id_field) if id_field else None
+                suffix = str(record_id) if record_id is not None else _content_key(text)
+                yield suffix, chunk_words(text, chunk_size, overlap), date
+
+        yield from _unique(records())
+
+    elif fmt == "csv":
+        # Rows are atomic: pack whole rows into passages of up to chunk_size words
+        def passages():
+            rows: List[str] = []
+            ids: List[str] = []
+            words, date = 0, None
+
+            def emit():
+                text = " | ".join(rows)
+                suffix = f"{ids[0]}..{ids[-1]}" if id_field else _content_key(text)
+                return suffix, [text], date
+
+            for row in iter_csv_rows(path):
+                line = "; ".join(f"{k}: {v}" for k, v in row.items() if v)
+                row_words = len(line.split())
+                if rows and words + row_words > chunk_size:
+                    yield emit()
+                    rows, ids, words, date = [], [], 0, None
+                rows.append(line)
+                if id_field:
+                    ids.append(row.get(id_field) or "")
+                words += row_words
+                if date is None:
+                    date = _first_date(v for v in row.values() if v)
+            if rows:
+                yield emit()
+
+        yield from _unique(passages())
+
+    else:
+        raise ValueError(f"Unknown source format {fmt!r} for {path}")
+
+
+def iter_passages(
+    sources: Optional[List[Dict[str, Any]]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[Dict[str, Any]]:
+    """Stream chunked passages with metadata from every configured source."""
+    sources = SOURCES if sources is None else sources
+    weights = load_source_weights()
+    for source in sources:
+        if not Path(source["path"]).exists():
+            print(f"Skipping missing source {source['path']}")
+            continue
+        source_type = source["source_type"]
+        for suffix, text, date in _passages_for_source(source, chunk_size, overlap):
+            yield {
+                "key": f"{source['path']}:{suffix}",
+                "text": text,
+                "source": source["path"],
+                "source_type": source_type,
+                "date": date,
+                "weight": weights.get(source_type, 1.0),
+            }
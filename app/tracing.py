@@ -0,0 +1,261 @@
+"""Per-request stage spans and opt-in profiling of slow requests.
+
+A `Trace` collects named spans timed with `time.perf_counter_ns`. Stages
+wrap their work in `span(name)`:
+
+    with span("encode"):
+        q = self._encode(queries)
+
+`span` looks up the active trace in a context variable; with tracing
+disabled, or outside a traced request, it returns a shared no-op context
+manager, so an untraced stage costs one lookup. Work handed to another
+thread (executor workers do not inherit context variables) is wrapped with
+`bind(fn)` so its spans land in the same trace.
+
+`Tracer.trace(trace_id)` opens a trace for one request and passes it to
+`on_finish` when the request ends; the pipeline records per-stage timings
+into `MetricsCollector.record_stages`. A stage that runs more than once per
+request reports the sum of its spans, and nested spans (e.g. "encode"
+inside "retrieve") overlap, so stage times do not add up to the total.
+
+Profiling is opt-in: a `sample_rate` fraction of traces run under a
+profiler, and those slower than `slow_ms` are written to `profile_dir`:
+- "sample": a background thread samples the stacks of the threads working
+  on the request every `interval_ms`, written as collapsed stacks
+  (`frame;frame;frame count`, `.folded`) for flamegraph.pl or speedscope
+- "cprofile": cProfile on those threads, written as a `.prof` file for
+  pstats or snakeviz
+"""
+import contextlib
+import cProfile
+import functools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+PROFILE_MODES = ("sample", "cprofile")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class Trace:
+    """Spans of one request: (name, start_ns, duration_ns)."""
+
+    def __init__(self, trace_id: str, profile_mode: Optional[str] = None):
+        self.trace_id = trace_id
+        self.profile_mode = profile_mode
+        self.spans: List[Tuple[str, int, int]] = []
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        # Threads currently working on this trace, for the stack sampler
+        self.threads: Dict[int, int] = {}
+        self.profiles: List[cProfile.Profile] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+    def stage_ms(self) -> Dict[str, float]:
+        """Total milliseconds per span name."""
+        totals: Dict[str, int] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0) + duration
+        return {name: ns / 1e6 for name, ns in totals.items()}
+
+    def _enter_thread(self) -> Optional[cProfile.Profile]:
+        tid = threading.get_ident()
+        self.threads[tid] = self.threads.get(tid, 0) + 1
+        if self.profile_mode != "cprofile":
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread (or, on 3.12+, anywhere)
+            return None
+        self.profiles.append(profile)
+        return profile
+
+    def _exit_thread(self, profile: Optional[cProfile.Profile]) -> None:
+        if profile is not None:
+            profile.disable()
+        tid = threading.get_ident()
+        if self.threads.get(tid, 0) <= 1:
+            self.threads.pop(tid, None)
+        else:
+            self.threads[tid] -= 1
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run `fn` on the current thread as part of this trace."""
+        token = _current.set(self)
+        profile = self._enter_thread()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._exit_thread(profile)
+            _current.reset(token)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.trace.spans.append((self.name, self.start, time.perf_counter_ns() - self.start))
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def span(name: str):
+    """Context manager timing `name` in the active trace; a no-op without one."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+def bind(fn: Callable) -> Callable:
+    """`fn`, wrapped to run in the caller's trace when called from another thread."""
+    trace = _current.get()
+    if trace is None:
+        return fn
+    return functools.partial(trace.call, fn)
+
+
+def _fold(frame) -> str:
+    """A thread's stack, root first, in collapsed-stack form."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of a trace's threads every `interval` seconds."""
+
+    def __init__(self, trace: Trace, interval: float = 0.005):
+        self.trace = trace
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for tid in list(self.trace.threads):
+                frame = frames.get(tid)
+                if frame is not None:
+                    self.counts[_fold(frame)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+class Tracer:
+    """Opens a trace per request, records it, and profiles a sample of slow requests."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        on_finish: Optional[Callable[[Trace], None]] = None,
+        profile_mode: str = "sample",
+        sample_rate: float = 0.0,
+        slow_ms: float = 1000.0,
+        profile_dir: str = "logs/profiles",
+        interval_ms: float = 5.0,
+    ):
+        if profile_mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {profile_mode!r}; expected one of {PROFILE_MODES}")
+        self.enabled = enabled
+        self.on_finish = on_finish
+        self.profile_mode = profile_mode
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.profile_dir = Path(profile_dir)
+        self.interval_ms = interval_ms
+
+    @contextlib.contextmanager
+    def trace(self, trace_id: str, own_thread: bool = True) -> Iterator[Optional[Trace]]:
+        """
+        Trace the enclosed request. `own_thread=False` is for coroutines: the
+        event loop thread is shared, so only work run through `bind` is
+        profiled.
+        """
+        if not self.enabled:
+            yield None
+            return
+        profiled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace = Trace(trace_id, self.profile_mode if profiled else None)
+        token = _current.set(trace)
+        profile = trace._enter_thread() if own_thread else None
+        sampler = None
+        if profiled and self.profile_mode == "sample":
+            sampler = StackSampler(trace, self.interval_ms / 1000).start()
+        try:
+            yield trace
+        finally:
+            trace.end_ns = time.perf_counter_ns()
+            if own_thread:
+                trace._exit_thread(profile)
+            _current.reset(token)
+            if sampler is not None:
+                sampler.stop()
+            if profiled and trace.duration_ms >= self.slow_ms:
+                self._dump(trace, sampler)
+            if self.on_finish is not None:
+                try:
+                    self.on_finish(trace)
+                except Exception as e:
+                    print(f"Failed to record trace {trace_id}: {e}")
+
+    def _dump(self, trace: Trace, sampler: Optional[StackSampler]) -> Optional[Path]:
+        """Write a slow request's profile to `profile_dir`; returns its path."""
+        stem = f"{time.strftime('%Y%m%dT%H%M%S')}_{trace.trace_id}"
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            if sampler is not None:
+                path = self.profile_dir / f"{stem}.folded"
+                path.write_text(sampler.collapsed())
+            elif trace.profiles:
+                path = self.profile_dir / f"{stem}.prof"
+                stats = pstats.Stats(trace.profiles[0])
+                for profile in trace.profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(str(path))
+            else:
+                return None
+        except (OSError, TypeError) as e:
+            print(f"Failed to write profile for {trace.trace_id}: {e}")
+            return None
+        stages = ", ".join(f"{name}={ms:.1f}ms" for name, ms in trace.stage_ms().items())
+        print(f"Slow request {trace.trace_id} ({trace.duration_ms:.0f}ms; {stages}): profile in {path}")
+        return path
@@ -1,5 +1,20 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from app.api import router
+from app import pipeline
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: /health answers (ready=false) meanwhile, and
+    # queries arriving early wait for the warm-up to finish
+    warm_up = asyncio.get_running_loop().run_in_executor(None, pipeline.warm_up)
+    yield
+    await warm_up
+    pipeline.shutdown()
+
 
-app = FastAPI(title="SaaS Product Intelligence")
+app = FastAPI(title="SaaS Product Intelligence", lifespan=lifespan)
 app.include_router(router)
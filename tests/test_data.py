@@ -0,0 +1,52 @@
+"""Tests for data loading, validation and drift detection."""
+
+
+def test_data_loader_streams_typed_chunks(tmp_path):
+    """Test chunked typed parsing, per-chunk schema checks and the mtime-checked bounded cache."""
+    import os
+    import numpy as np
+    from app.data import DataLoader
+
+    path = tmp_path / "daily_metrics.csv"
+    path.write_text(
+        "date,metric_name,value,notes\n"
+        "2025-01-01,activation_rate,0.4,\n"
+        "2025-01-02,activation_rate,0.5,ok\n"
+        "2025-01-03,activation_rate,,late\n"
+        "bad,row\n"
+    )
+    loader = DataLoader(chunk_rows=2)
+    chunks = list(loader.iter_chunks(str(path)))
+    assert [len(c["date"]) for c in chunks] == [2, 1]
+    assert chunks[0]["date"].dtype == np.dtype("datetime64[D]")
+    assert chunks[0]["value"].dtype == np.float64 and np.isnan(chunks[1]["value"][0])
+
+    columns = loader.load_columns(str(path))
+    assert columns["notes"].tolist() == ["", "ok", "late"]
+    assert loader.load_columns(str(path)) is columns  # cached
+    path.write_text("date,metric_name,value\n2025-02-01,churn_rate,0.02\n")
+    os.utime(path, ns=(0, 10**9))
+    assert loader.load_columns(str(path))["metric_name"].tolist() == ["churn_rate"]
+
+    # Required columns are checked against each header, not per row
+    assert loader.load_columns(str(path), required={"segment"}) == {}
+    records = tmp_path / "tickets.json"
+    records.write_text('[{"id": "t1", "n": 1}, {"id": "t2", "n": 2, "tag": "x"}, {"id": "t3"}]')
+    cols = loader.load_columns(str(records))
+    assert cols["n"][:2].tolist() == [1.0, 2.0] and cols["tag"].tolist() == ["", "x", ""]
+
+    small = DataLoader(cache_bytes=64)
+    small.load_columns(str(path))
+    small.load_columns(str(records))
+    assert small.cache.current_bytes <= 64
+
+
+def test_detect_drift_reports_changed_documents():
+    """Test drift detection names added, removed and modified documents."""
+    from app.data import DataValidator
+
+    validator = DataValidator()
+    report = validator.detect_drift({"a": "one", "b": "two"}, {"a": "one!", "c": "three"})
+    assert report["drifted"] is True
+    assert (report["added"], report["removed"], report["modified"]) == (["c"], ["b"], ["a"])
+    assert validator.detect_drift(["x", "y"], ["y", "x"])["drifted"] is False
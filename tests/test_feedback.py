@@ -0,0 +1,173 @@
+"""Tests for feedback collection and stats."""
+import json
+
+from app.feedback import FeedbackCollector
+
+
+def test_feedback_for_unknown_interaction_is_ignored(tmp_path):
+    """Test feedback needs a logged interaction and unknown ids stay out of stats."""
+    log_path = tmp_path / "feedback.jsonl"
+    # Logged before interaction ids were registered: found in the log itself
+    log_path.write_text(json.dumps({"interaction_id": "legacy", "confidence": 0.5}) + "\n")
+    collector = FeedbackCollector(log_path=str(log_path))
+    collector.log_interaction("q", {"answer": "a", "confidence": 0.5}, interaction_id="qid-1")
+
+    assert collector.log_feedback("qid-1", helpful=True) is True
+    assert collector.log_feedback("legacy", helpful=False) is True
+    assert collector.log_feedback("qid-typo", helpful=True) is False
+    assert collector.store.count() == 2
+
+    stats = collector.get_feedback_stats()
+    assert stats["feedback_rate"] == 1.0 and stats["helpful_rate"] == 0.5
+
+
+def test_feedback_route_rejects_unknown_query_id(tmp_path, monkeypatch):
+    """Test POST /feedback returns 404 for a query_id that was never answered."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app import pipeline
+    from app.api import router
+
+    collector = FeedbackCollector(log_path=str(tmp_path / "feedback.jsonl"))
+    monkeypatch.setitem(pipeline._components, "feedback_collector", collector)
+    collector.log_interaction("q", {"answer": "a"}, interaction_id="qid-1")
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    assert client.post("/feedback", json={"query_id": "qid-1", "helpful": True}).status_code == 200
+    assert client.post("/feedback", json={"query_id": "no-such-id", "helpful": True}).status_code == 404
+    assert client.get("/feedback/stats").json()["feedback_rate"] == 1.0
+
+
+def test_buffered_interactions_are_registered_by_the_writer(tmp_path):
+    """Test logging an interaction does no SQLite write; feedback still finds buffered ids."""
+    from app.log_writer import BackgroundLogWriter
+
+    writer = BackgroundLogWriter(flush_interval=60)
+    collector = FeedbackCollector(log_path=str(tmp_path / "feedback.jsonl"), writer=writer)
+    collector.log_interaction("q", {"answer": "a"}, interaction_id="qid-1")
+    assert not collector.store.has_interaction("qid-1")
+    assert collector.log_feedback("qid-1", helpful=True) is True
+    assert collector.log_feedback("qid-2", helpful=True) is False
+    writer.close()
+
+
+def _add_feedback(db_path, worker, n):
+    from app.feedback import FeedbackStore
+
+    store = FeedbackStore(db_path)
+    for i in range(n):
+        store.add(f"w{worker}-{i}", helpful=i % 2 == 0)
+
+
+def test_feedback_events_join_and_concurrent_writers(tmp_path):
+    """Test feedback is appended, joined on read, and safe across processes."""
+    import multiprocessing
+    from app.feedback import FeedbackCollector, FeedbackStore
+
+    log_path = tmp_path / "feedback.jsonl"
+    collector = FeedbackCollector(log_path=str(log_path))
+    collector.log_interaction("q", {"answer": "a", "confidence": 0.5}, interaction_id="qid-1")
+    collector.log_interaction("q2", {"answer": "b", "confidence": 0.5})
+    before = log_path.read_text()
+
+    collector.log_feedback("qid-1", helpful=False)
+    collector.log_feedback("qid-1", helpful=True, feedback="better on reload")
+    # Feedback never rewrites the interaction log
+    assert log_path.read_text() == before
+
+    logs = {l["interaction_id"]: l for l in collector.load_feedback_logs()}
+    assert logs["qid-1"]["user_feedback"]["helpful"] is True
+    assert logs["qid-1"]["user_feedback"]["feedback"] == "better on reload"
+    stats = collector.get_feedback_stats()
+    assert stats["feedback_rate"] == 0.5 and stats["helpful_rate"] == 1.0
+
+    db_path = str(tmp_path / "shared.db")
+    FeedbackStore(db_path)
+    procs = [
+        multiprocessing.get_context("spawn").Process(target=_add_feedback, args=(db_path, w, 50))
+        for w in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    assert FeedbackStore(db_path).count() == 200
+
+
+def test_feedback_stats_are_incremental_and_checkpointed(tmp_path):
+    """Test stats fold in only new records, window by time, and resume from a checkpoint."""
+    import json
+    from datetime import datetime, timedelta
+    from app.feedback import FeedbackCollector
+
+    log_path = tmp_path / "feedback.jsonl"
+    old = (datetime.utcnow() - timedelta(hours=3)).isoformat()
+    log_path.write_text(json.dumps({"interaction_id": "old", "timestamp": old, "refused": True,
+                                    "confidence": 0.2}) + "\n")
+    collector = FeedbackCollector(log_path=str(log_path))
+    for i in range(3):
+        collector.log_interaction(f"q{i}", {"answer": "a", "confidence": 0.8}, interaction_id=f"id{i}")
+    collector.log_feedback("id0", helpful=True)
+    collector.log_feedback("id0", helpful=False)
+    collector.log_feedback("id1", helpful=True)
+
+    stats = collector.get_feedback_stats()
+    assert stats["total_interactions"] == 4
+    assert stats["refused_rate"] == 0.25
+    assert stats["feedback_rate"] == 0.5 and stats["helpful_rate"] == 0.5
+    assert stats["windows"]["1h"]["total_interactions"] == 3
+    assert stats["windows"]["1h"]["refused_rate"] == 0
+    assert stats["windows"]["24h"]["total_interactions"] == 4
+    offset = collector.stats.offset
+    assert offset == log_path.stat().st_size
+
+    collector.stats.save_checkpoint()
+    # A partially written line is left for the next refresh
+    with open(log_path, "a") as f:
+        f.write('{"interaction_id": "half"')
+    resumed = FeedbackCollector(log_path=str(log_path))
+    assert resumed.stats.offset == offset
+    assert resumed.get_feedback_stats()["total_interactions"] == 4
+    with open(log_path, "a") as f:
+        f.write(', "confidence": 1.0}\n')
+    assert resumed.get_feedback_stats()["total_interactions"] == 5
+
+
+def test_load_feedback_logs_returns_most_recent(tmp_path):
+    """Test load_feedback_logs keeps the newest records, oldest first."""
+    from app.feedback import FeedbackCollector
+
+    collector = FeedbackCollector(log_path=str(tmp_path / "fb.jsonl"))
+    for i in range(10):
+        collector.log_interaction(f"q{i}", {"answer": "a"}, interaction_id=f"id{i}")
+    collector.log_feedback("id9", helpful=True)
+
+    logs = collector.load_feedback_logs(limit=3)
+    assert [l["query"] for l in logs] == ["q7", "q8", "q9"]
+    assert logs[-1]["user_feedback"]["helpful"] is True
+    assert sum(1 for _ in collector.iter_feedback_logs(join_batch=4)) == 10
+
+
+def test_changed_feedback_moves_between_windows(tmp_path):
+    """Test feedback changed after its first event falls out of a window keeps rates in [0, 1]."""
+    from datetime import datetime, timedelta
+
+    collector = FeedbackCollector(log_path=str(tmp_path / "feedback.jsonl"))
+    for interaction_id in ("a", "b"):
+        collector.log_interaction("q", {"answer": "x"}, interaction_id=interaction_id)
+    two_hours_ago = (datetime.utcnow() - timedelta(hours=2)).isoformat()
+    with collector.store._connect() as conn:
+        conn.execute(
+            "INSERT INTO feedback_events (interaction_id, helpful, timestamp) VALUES ('a', 0, ?)",
+            (two_hours_ago,),
+        )
+    collector.log_feedback("a", helpful=True)
+    collector.log_feedback("b", helpful=True)
+
+    stats = collector.get_feedback_stats()
+    assert stats["feedback_rate"] == 1.0 and stats["helpful_rate"] == 1.0
+    assert stats["windows"]["1h"]["feedback_rate"] == 1.0
+    assert stats["windows"]["1h"]["helpful_rate"] == 1.0
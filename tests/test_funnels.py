@@ -0,0 +1,104 @@
+"""Tests for the funnel and cohort engine."""
+import numpy as np
+import pytest
+from app.funnels import FunnelEngine
+from app.metrics_engine import MetricsEngine
+
+STEPS = ["signup", "onboard", "activate"]
+
+
+def _random_events(n, seed=0):
+    rng = np.random.default_rng(seed)
+    users = [f"u{i}" for i in rng.integers(0, 200, n)]
+    names = [STEPS[i] for i in rng.integers(0, 3, n)]
+    times = (np.datetime64("2025-01-01T00:00:00") + rng.integers(0, 30 * 86400, n)).astype(str)
+    return users, names, list(times)
+
+
+def _reference_funnel(users, names, times, steps, window=None):
+    """Per-user loop with the same semantics as FunnelEngine.funnel."""
+    by_user = {}
+    for u, e, t in zip(users, names, times):
+        by_user.setdefault(u, []).append((np.datetime64(t, "s").astype(np.int64), e))
+    counts = [0] * len(steps)
+    for events in by_user.values():
+        events.sort()
+        entry = min((t for t, e in events if e == steps[0]), default=None)
+        if entry is None:
+            continue
+        counts[0] += 1
+        cur = entry
+        for k, step in enumerate(steps[1:], 1):
+            nxt = min((t for t, e in events if e == step and t >= cur), default=None)
+            if nxt is None or (window is not None and nxt - entry > window):
+                break
+            counts[k] += 1
+            cur = nxt
+    return counts
+
+
+def test_funnel_matches_per_user_reference_across_runs_and_chunks():
+    """Test vectorized funnels agree with a per-user loop when data spans many runs and chunks."""
+    users, names, times = _random_events(3000)
+    engine = FunnelEngine(chunk_rows=256)
+    for i in range(0, 3000, 500):
+        engine.append(users[i:i + 500], names[i:i + 500], times[i:i + 500])
+    assert len(engine) == 3000
+    assert len(engine._runs) < 6  # appended runs were merged
+
+    result = engine.funnel(STEPS)
+    assert [s["users"] for s in result["steps"]] == _reference_funnel(users, names, times, STEPS)
+    windowed = engine.funnel(STEPS, window_seconds=2 * 86400)
+    assert [s["users"] for s in windowed["steps"]] == _reference_funnel(
+        users, names, times, STEPS, window=2 * 86400
+    )
+    assert FunnelEngine(chunk_rows=10**6).funnel(STEPS)["steps"][0]["users"] == 0
+
+
+def test_refresh_reads_appended_events_and_cohorts(tmp_path):
+    """Test refresh tails events.csv and cohorts count retained users per period."""
+    path = tmp_path / "events.csv"
+    path.write_text(
+        "event_id,user_id,event_name,event_timestamp\n"
+        "e1,u1,signup,2025-01-06T10:00:00\n"
+        "e2,u2,signup,2025-01-07T10:00:00\n"
+        "e3,u1,login,2025-01-14T10:00:00\n"
+    )
+    engine = FunnelEngine(str(path))
+    assert engine.refresh() == 3
+    with open(path, "a") as f:
+        f.write("e4,u2,login,2025-01-21T11:00:00\ne5,u3,sig")  # last line still being written
+    assert engine.refresh() == 1
+    assert engine.refresh() == 0
+
+    result = engine.cohorts(period="week", periods=3, cohort_event="signup", activity_event="login")
+    assert result["cohorts"] == [{"cohort": "2025-01-06", "users": 2, "retention": [0.0, 0.5, 0.5]}]
+    with pytest.raises(ValueError):
+        engine.cohorts(period="fortnight")
+
+
+def test_funnel_breakdown_by_user_and_account_columns():
+    """Test the shipped events join users.csv / accounts.csv for breakdowns."""
+    metrics = MetricsEngine.load()
+    engine = FunnelEngine("data/structured/events.csv", metrics.users, metrics.accounts)
+    engine.refresh()
+    result = engine.funnel(["signup_completed", "onboarding_started", "onboarding_failed"], by="industry")
+    assert [s["users"] for s in result["steps"]] == [2, 2, 1]
+    assert result["breakdown"] == {"fintech": [2, 2, 1]}
+    with pytest.raises(ValueError):
+        engine.funnel(["signup_completed"], by="no_such_column")
+
+
+def test_funnel_api_route():
+    """Test the analytics routes serve funnels and reject bad parameters."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import router
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    resp = client.post("/analytics/funnel", json={"steps": ["signup_completed", "onboarding_started"], "by": "plan"})
+    assert resp.status_code == 200
+    assert resp.json()["breakdown"] == {"free": [2, 2]}
+    assert client.post("/analytics/cohorts", json={"period": "year"}).status_code == 400
@@ -0,0 +1,323 @@
+"""Tests for source ingestion and incremental indexing."""
+import json
+import numpy as np
+import pytest
+from app.ingestion import IncrementalIndexer, ingest_sources
+from app.ranking.features import FeatureExtractor
+from app.retrieval.dense_retrieval import DenseRetriever
+from app.retrieval.docstore import DocumentStore
+from app.retrieval.sparse_retrieval import SparseRetriever
+
+
+@pytest.fixture
+def sample_docs():
+    return [
+        "User activation drop by 20% in March after onboarding redesign",
+        "Release 2.3 included changes to the onboarding flow",
+        "Retention improved after fixing checkout bug in April",
+        "Database migration completed successfully",
+    ]
+
+
+@pytest.fixture(params=["list", "store"])
+def indexer(request, sample_docs):
+    docs = sample_docs if request.param == "list" else DocumentStore(sample_docs)
+    return IncrementalIndexer(
+        DenseRetriever(docs),
+        SparseRetriever(docs),
+        FeatureExtractor(docs),
+        keys=["a", "b", "c", "d"],
+        compaction_ratio=0.5,
+    )
+
+
+def _sparse_texts(indexer, query):
+    return [r["text"] for r in indexer.sparse.search(query)]
+
+
+def test_upsert_encodes_only_new_documents(indexer):
+    """Test adds and updates encode just the changed texts."""
+    encoded = []
+    build = indexer.dense._build_embeddings
+    indexer.dense._build_embeddings = lambda texts=None: encoded.extend(texts) or build(texts)
+
+    summary = indexer.upsert(
+        {
+            "a": "User activation drop by 20% in March after onboarding redesign",
+            "b": "Release 2.3.1 made the compliance checklist optional",
+            "e": "Pricing page experiment increased trial signups",
+        }
+    )
+    assert summary == {"added": 1, "updated": 1, "unchanged": 1}
+    assert sorted(encoded) == sorted(
+        [
+            "Release 2.3.1 made the compliance checklist optional",
+            "Pricing page experiment increased trial signups",
+        ]
+    )
+    assert indexer.num_docs == 5
+    assert _sparse_texts(indexer, "pricing") == ["Pricing page experiment increased trial signups"]
+    # The replaced version of "b" is no longer retrievable
+    assert "Release 2.3 included changes to the onboarding flow" not in _sparse_texts(
+        indexer, "onboarding"
+    )
+    dense_texts = [r["text"] for r in indexer.dense.search("anything", k=10)]
+    assert len(dense_texts) == 5
+    assert "Release 2.3 included changes to the onboarding flow" not in dense_texts
+
+
+def test_delete_and_compaction_keep_ids_aligned(indexer, sample_docs):
+    """Test tombstones, then compaction renumbers every component consistently."""
+    version = indexer.version
+    summary = ingest_sources(indexer, deleted_keys=["a", "missing"])
+    assert summary["deleted"] == 1
+    assert summary["compacted"] is False
+    assert indexer.version > version
+    assert sample_docs[0] not in _sparse_texts(indexer, "onboarding")
+
+    summary = ingest_sources(indexer, {"f": "Onboarding survey results"}, deleted_keys=["c", "d"])
+    assert summary["compacted"] is True
+    assert summary["num_docs"] == 2
+    assert list(indexer.dense.docs) == list(indexer.sparse.documents)
+    assert indexer.dense.num_deleted == 0
+    assert len(indexer.dense.emb) == 2
+
+    for r in indexer.sparse.search("onboarding"):
+        assert indexer.dense.docs[r["id"]] == r["text"]
+    features = indexer.feature_extractor.extract_batch_ids("onboarding survey", [0, 1], [0, 0], [0, 0])
+    expected = [
+        FeatureExtractor.extract_features("onboarding survey", d, 0, 0)
+        for d in indexer.dense.docs
+    ]
+    assert np.allclose(features, expected)
+
+
+def test_compaction_waits_for_in_flight_queries(indexer):
+    """Test compaction does not renumber ids while a query holds the read lock."""
+    import threading
+
+    indexer.delete(["a", "c", "d"])
+    compacted = threading.Event()
+    with indexer.reading():
+        worker = threading.Thread(target=lambda: (indexer.compact(), compacted.set()))
+        worker.start()
+        assert not compacted.wait(0.2)
+        assert len(indexer.dense.emb) == 4
+    worker.join()
+    assert compacted.is_set() and len(indexer.dense.emb) == 1
+
+
+
+def test_upserts_and_searches_run_concurrently(indexer):
+    """Test queries under the read lock never see a half-applied upsert."""
+    import threading
+
+    done = threading.Event()
+    errors = []
+
+    def search():
+        while not done.is_set():
+            try:
+                with indexer.reading():
+                    for r in indexer.sparse.search("onboarding release", top_k=10):
+                        assert indexer.dense.docs[r["id"]] == r["text"]
+                    indexer.dense.search("onboarding release", k=10)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=search) for _ in range(2)]
+    for t in readers:
+        t.start()
+    for i in range(30):
+        indexer.upsert({f"n{i}-{j}": f"onboarding release note {i} {j} word{i * j}" for j in range(3)})
+        indexer.delete([f"n{i - 1}-0"])
+    done.set()
+    for t in readers:
+        t.join()
+    assert not errors
+    assert indexer.num_docs == 4 + 30 * 3 - 29
+
+def test_dense_compaction_removes_replaced_files(sample_docs, tmp_path):
+    """Test compacting a persisted index deletes the files of the old one."""
+    dense = DenseRetriever(sample_docs, cache_dir=str(tmp_path))
+    before = {p.name for p in tmp_path.iterdir()}
+    dense.delete_documents([0])
+    dense.compact()
+    after = {p.name for p in tmp_path.iterdir()}
+    assert before and after and not before & after
+    assert {p.name for p in dense._persisted_paths()} == after
+
+
+def test_chunk_words_overlap():
+    """Test passages have the configured size and overlap."""
+    from app.sources import chunk_words
+
+    text = " ".join(str(i) for i in range(10))
+    chunks = chunk_words(text, chunk_size=4, overlap=1)
+    assert chunks == ["0 1 2 3", "3 4 5 6", "6 7 8 9"]
+    assert chunk_words("short text", 4, 1) == ["short text"]
+    assert chunk_words("   ", 4, 1) == []
+
+
+def test_streaming_json_reader(tmp_path):
+    """Test JSON arrays and JSON Lines decode record by record across small reads."""
+    from app.sources import iter_json_records
+
+    records = [{"id": i, "body": "x" * 50, "nested": [1, {"a": "]"}]} for i in range(20)]
+    array_path = tmp_path / "records.json"
+    array_path.write_text(json.dumps(records, indent=2))
+    assert list(iter_json_records(str(array_path), read_size=7)) == records
+
+    lines_path = tmp_path / "records.jsonl"
+    lines_path.write_text("\n".join(json.dumps(r) for r in records))
+    assert list(iter_json_records(str(lines_path), read_size=7)) == records
+
+
+def test_markdown_sections_inherit_dates(tmp_path):
+    """Test markdown sections carry heading paths and parent dates."""
+    from app.sources import iter_markdown_sections
+
+    path = tmp_path / "notes.md"
+    path.write_text(
+        "# Notes\n\n## Release 2.4 - Feb 10, 2025\n\n### Features\n- API v2\n\n## Misc\nNo date here\n"
+    )
+    sections = list(iter_markdown_sections(str(path)))
+    assert sections == [
+        ("Release 2.4 - Feb 10, 2025 > Features", "- API v2", "2025-02-10"),
+        ("Misc", "No date here", None),
+    ]
+
+
+def test_iter_passages_covers_all_sources():
+    """Test every configured source produces passages with metadata."""
+    from app.config import SOURCES
+    from app.sources import iter_passages
+
+    passages = list(iter_passages())
+    assert {p["source"] for p in passages} == {s["path"] for s in SOURCES}
+    assert len({p["key"] for p in passages}) == len(passages)
+    tickets = [p for p in passages if p["source_type"] == "ticket"]
+    assert tickets and all(p["weight"] == 0.6 for p in tickets)
+    assert all(p["date"] for p in tickets)
+
+
+
+def test_passage_keys_survive_unrelated_edits(tmp_path):
+    """Test keys follow headings, ids and content rather than position."""
+    from app.sources import iter_passages
+
+    md = tmp_path / "notes.md"
+    md.write_text("# Pricing\nTrial length cut\n\n# Churn\nChurn rose\n")
+    rows = tmp_path / "rows.csv"
+    rows.write_text("id,name\nr1,alpha\nr2,beta\n")
+    sources = [
+        {"path": str(md), "format": "markdown", "source_type": "doc"},
+        {"path": str(rows), "format": "csv", "source_type": "doc", "id_field": "id"},
+        {"path": str(rows), "format": "csv", "source_type": "doc"},
+    ]
+    before = {p["key"]: p["text"] for p in iter_passages(sources, chunk_size=3)}
+    assert f"{md}:churn:0" in before and f"{rows}:r2..r2:0" in before
+
+    md.write_text("# Onboarding\nNew checklist\n\n# Pricing\nTrial length cut\n\n# Churn\nChurn rose\n")
+    rows.write_text("id,name\nr0,zero\nr1,alpha\nr2,beta\n")
+    after = {p["key"]: p["text"] for p in iter_passages(sources, chunk_size=3)}
+    assert {k: after[k] for k in before} == before
+    assert len(after) == len(before) + 3
+
+def test_ingest_sources_streams_and_syncs(indexer, tmp_path):
+    """Test source ingestion upserts passages and sync removes vanished ones."""
+    path = tmp_path / "tickets.json"
+    path.write_text(json.dumps([
+        {"ticket_id": "t1", "created_at": "2025-01-20", "subject": "Login broken"},
+        {"ticket_id": "t2", "created_at": "2025-01-21", "subject": "Export slow"},
+    ]))
+    source = {"path": str(path), "format": "json", "source_type": "ticket", "id_field": "ticket_id"}
+
+    summary = ingest_sources(indexer, sources=[source], batch_size=1)
+    assert summary["added"] == 2
+    assert summary["sources"] == [str(path)]
+    if indexer.store is not None:
+        doc_id = indexer.doc_id(f"{path}:t1:0")
+        assert indexer.store.metadata(doc_id)["date"] == "2025-01-20"
+        assert indexer.store.metadata(doc_id)["source_type"] == "ticket"
+
+    path.write_text(json.dumps([{"ticket_id": "t2", "subject": "Export slow"}]))
+    summary = ingest_sources(indexer, sources=[source], sync=True)
+    assert summary["deleted"] == 1
+    assert f"{path}:t1:0" not in indexer.keys()
+    assert indexer.doc_id(f"{path}:t1:0") is None
+
+
+def test_unchanged_sources_are_skipped(indexer, tmp_path):
+    """Test re-ingesting an unchanged file reads nothing, and a touched file is re-read."""
+    path = tmp_path / "notes.md"
+    path.write_text("# Notes\nChurn rose after the pricing change\n")
+    source = {"path": str(path), "format": "markdown", "source_type": "doc"}
+
+    assert ingest_sources(indexer, sources=[source])["added"] == 1
+    summary = ingest_sources(indexer, sources=[source], sync=True)
+    assert summary["skipped_sources"] == [str(path)] and summary["deleted"] == 0
+    assert ingest_sources(indexer, sources=[source], force=True)["unchanged"] == 1
+
+    path.write_text("# Notes\nChurn fell after the pricing rollback\n")
+    summary = ingest_sources(indexer, sources=[source])
+    assert summary["sources"] == [str(path)] and summary["updated"] == 1
+
+
+def test_fingerprint_table_diff_persistence_and_distribution(tmp_path):
+    """Test bucket-level diffs, .npz round trips and incremental distribution aggregates."""
+    from app.fingerprints import FingerprintTable
+
+    docs = {f"k{i}": f"document {i} about activation and retention" for i in range(500)}
+    table = FingerprintTable.from_documents(docs.items(), embeddings=np.eye(4)[np.arange(500) % 4])
+    table.mark_source(str(tmp_path))
+    table.save(str(tmp_path / "fp.npz"))
+    baseline = FingerprintTable.load(str(tmp_path / "fp.npz"))
+    assert baseline.root == table.root and baseline.sources == table.sources
+    assert baseline.diff(table) == {"added": [], "removed": [], "modified": []}
+    assert np.array_equal(baseline.token_counts, table.token_counts)
+    assert FingerprintTable.load(str(tmp_path / "missing.npz")) is None
+
+    assert table.update("k1", "document 1 about churn") == "modified"
+    assert table.update("k2", docs["k2"]) == "unchanged"
+    assert table.update("new", "pricing page experiment") == "added"
+    assert table.remove("k3") and not table.remove("k3")
+    assert table.diff(baseline) == {"added": ["new"], "removed": ["k3"], "modified": ["k1"]}
+
+    # Aggregates after incremental updates equal a table built from scratch
+    docs.update({"k1": "document 1 about churn", "new": "pricing page experiment"})
+    del docs["k3"]
+    fresh = FingerprintTable.from_documents(docs.items())
+    assert fresh.root == table.root
+    assert np.array_equal(fresh.token_counts, table.token_counts)
+    report = table.drift_report(baseline)
+    assert report["changed"] and 0 < report["token_js_divergence"] < 0.05
+    assert not report["distribution_drifted"]
+
+    table.add_embeddings(np.tile([1.0, 0, 0, 0], (500, 1)))
+    assert table.drift_report(baseline)["centroid_cosine_distance"] > 0.05
+
+
+def test_indexer_fingerprints_follow_upserts_and_deletes(indexer):
+    """Test the indexer's fingerprint table reports exactly what changed and tracks the centroid."""
+    from app.fingerprints import FingerprintTable
+
+    snapshot = FingerprintTable()
+    for key, text in zip(["a", "b", "c", "d"], [
+        "User activation drop by 20% in March after onboarding redesign",
+        "Release 2.3 included changes to the onboarding flow",
+        "Retention improved after fixing checkout bug in April",
+        "Database migration completed successfully",
+    ]):
+        snapshot.update(key, text)
+
+    indexer.upsert({"b": "Release 2.3.1 made the checklist optional", "e": "New pricing page"})
+    indexer.delete(["d"])
+    report = indexer.drift_report(snapshot)
+    assert (report["added"], report["removed"], report["modified"]) == (["e"], ["d"], ["b"])
+
+    live = [indexer.doc_id(k) for k in indexer.keys()]
+    expected = np.asarray(indexer.dense.emb)[live].mean(axis=0)
+    assert indexer.fingerprints.emb_count == len(live)
+    assert np.allclose(indexer.fingerprints.centroid, expected, atol=1e-5)
@@ -0,0 +1,114 @@
+"""Tests for streaming log readers and the background log writer."""
+import pytest
+
+
+def test_background_log_writer(tmp_path):
+    """Test background writer appends queued records."""
+    import json
+    from app.log_writer import BackgroundLogWriter
+    from app.feedback import FeedbackCollector
+
+    writer = BackgroundLogWriter()
+    collector = FeedbackCollector(log_path=str(tmp_path / "fb.jsonl"), writer=writer)
+    for i in range(5):
+        collector.log_interaction(f"q{i}", {"answer": "a", "confidence": 0.5})
+
+    # Reads see everything queued before them
+    assert len(collector.load_feedback_logs()) == 5
+
+    writer.close()
+    lines = (tmp_path / "fb.jsonl").read_text().splitlines()
+    assert [json.loads(l)["query"] for l in lines] == [f"q{i}" for i in range(5)]
+
+
+def test_log_writer_batches_and_drains(tmp_path, monkeypatch):
+    """Test size/time flush thresholds, fsync per batch, overflow and drain on close."""
+    import json
+    import time
+    from app import log_writer
+    from app.log_writer import BackgroundLogWriter
+
+    syncs = []
+    monkeypatch.setattr(log_writer.os, "fsync", lambda fd: syncs.append(fd))
+    path = tmp_path / "metrics.jsonl"
+
+    # Size threshold: a full batch is written without waiting for the interval
+    writer = BackgroundLogWriter(batch_size=3, flush_interval=60, fsync="batch")
+    for i in range(3):
+        writer.write(path, {"i": i})
+    deadline = time.time() + 5
+    while writer.pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(path.read_text().splitlines()) == 3
+    assert len(syncs) == 1
+
+    # Below the threshold nothing is written until close drains the buffer
+    writer.write(path, {"i": 3})
+    time.sleep(0.05)
+    assert len(path.read_text().splitlines()) == 3
+    writer.close()
+    assert [json.loads(l)["i"] for l in path.read_text().splitlines()] == [0, 1, 2, 3]
+
+    # Time threshold
+    writer = BackgroundLogWriter(batch_size=100, flush_interval=0.05)
+    writer.write(path, {"i": 4})
+    deadline = time.time() + 5
+    while writer.pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert json.loads(path.read_text().splitlines()[-1]) == {"i": 4}
+    writer.close()
+
+
+def test_log_writer_drops_oldest_when_full(tmp_path):
+    """Test a full buffer drops the oldest pending records when configured to."""
+    from app.log_writer import BackgroundLogWriter
+
+    writer = BackgroundLogWriter(max_records=2, drop_when_full=True)
+    writer._ensure_started = lambda: None  # no writer thread: the buffer only fills
+    for i in range(5):
+        writer.write(tmp_path / "x.jsonl", {"i": i})
+    assert writer.dropped == 3
+    assert [r["i"] for _, r in writer._buffer] == [3, 4]
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_log_reader_streams_from_tail(tmp_path, fast):
+    """Test reverse block reads, time filtering and torn trailing lines."""
+    import json
+    from app.log_reader import iter_lines_reverse, iter_records
+
+    path = tmp_path / "log.jsonl"
+    records = [{"i": i, "timestamp": f"2025-01-{i + 1:02d}T00:00:00", "pad": "x" * (i * 7)}
+               for i in range(20)]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records) + '{"i": 99, "timest')
+
+    # Blocks smaller than a line still reassemble every line
+    lines = list(iter_lines_reverse(path, block_size=16))
+    assert [json.loads(l)["i"] for l in lines[1:]] == list(range(19, -1, -1))
+
+    newest = list(iter_records(path, newest_first=True, fast=fast, block_size=32))
+    assert [r["i"] for r in newest] == list(range(19, -1, -1))
+    window = iter_records(path, since="2025-01-05", until="2025-01-08", newest_first=True, fast=fast)
+    assert [r["i"] for r in window] == [6, 5, 4]
+    forward = iter_records(path, since="2025-01-18", fast=fast)
+    assert [r["i"] for r in forward] == [17, 18, 19]
+
+
+def test_log_reader_tolerates_interleaved_timestamps(tmp_path):
+    """Test backward reads keep in-window records behind slightly older ones."""
+    import json
+    from datetime import timedelta
+    from app.log_reader import iter_records
+
+    path = tmp_path / "log.jsonl"
+    # Batches from several workers: timestamps interleave by a few seconds
+    stamps = ["10:00:00", "10:00:07", "10:00:03", "10:00:09", "10:00:05", "10:00:11"]
+    path.write_text("".join(
+        json.dumps({"i": i, "timestamp": f"2025-01-01T{t}"}) + "\n" for i, t in enumerate(stamps)
+    ))
+    window = iter_records(path, since="2025-01-01T10:00:06", newest_first=True)
+    assert [r["i"] for r in window] == [5, 3, 1]
+    # Records older than since - slack end the scan
+    strict = iter_records(path, since="2025-01-01T10:00:06", newest_first=True,
+                          slack=timedelta(0))
+    assert [r["i"] for r in strict] == [5]
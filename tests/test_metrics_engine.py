@@ -0,0 +1,96 @@
+"""Tests for the structured metrics engine."""
+import numpy as np
+import pytest
+from app.metrics_engine import MetricsEngine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    rows = ["date,metric_name,value,segment,notes"]
+    # Mon 2025-01-06 .. Sun 2025-01-19: one week flat, then a drop on the 15th
+    for day in range(6, 20):
+        value = 0.5 if day < 15 else 0.3
+        rows.append(f"2025-01-{day:02d},activation_rate,{value},all,")
+        rows.append(f"2025-01-{day:02d},activation_rate,{value + 0.1},pro,")
+    rows.append("2024-12-20,churn_rate,0.02,all,")
+    (tmp_path / "daily_metrics.csv").write_text("\n".join(rows) + "\n")
+    (tmp_path / "events.csv").write_text(
+        "event_id,user_id,event_name,event_timestamp\n"
+        "e1,u1,signup_completed,2025-01-10T10:00:00\n"
+        "e2,u2,signup_completed,2025-01-09T09:00:00\n"
+        "e3,u1,onboarding_started,2025-01-10T10:05:00\n"
+        "e4,u3,signup_completed,2025-01-12T11:00:00\n"
+    )
+    (tmp_path / "users.csv").write_text("user_id,account_id,plan,signup_date\nu1,a1,free,2025-01-10\n")
+    return MetricsEngine.load(str(tmp_path))
+
+
+def test_series_rollups_and_deltas(engine):
+    """Test typed columns, segment series, and daily / weekly rollups with deltas."""
+    s = engine.get_series("activation_rate")
+    assert s.dates.dtype == np.dtype("datetime64[D]") and len(s) == 14
+    assert engine.get_series("activation_rate", "pro").values[0] == pytest.approx(0.6)
+    assert np.isnan(s.daily_delta[0])
+    assert s.daily_delta[9] == pytest.approx(-0.2)
+    assert [str(w) for w in s.weeks] == ["2025-01-06", "2025-01-13"]
+    assert s.weekly == pytest.approx([0.5, (2 * 0.5 + 5 * 0.3) / 7])
+    assert s.weekly_delta[1] == pytest.approx(s.weekly[1] - 0.5)
+
+
+def test_evidence_for_question(engine):
+    """Test metric and period are found in a question and summarized over that period."""
+    assert engine.find_metrics("Why did activation drop?") == ["activation_rate"]
+    assert engine.find_metrics("How is the weather?") == []
+    start, end = engine.parse_period("what happened in January")
+    assert (str(start), str(end)) == ("2025-01-01", "2025-02-01")
+    assert str(engine.parse_period("december")[0]) == "2024-12-01"
+    assert str(engine.parse_period("on 2025-01-15")[1]) == "2025-01-16"
+    # Dates that do not exist name no period rather than raising
+    assert engine.parse_period("activation on 2025-02-30") is None
+    assert engine.parse_period("activation in 2025-13") is None
+    assert engine.evidence("What was activation on 2025-02-30?")[0]["metric"] == "activation_rate"
+
+    [summary] = engine.evidence("Why did activation drop in January?")
+    assert summary["metric"] == "activation_rate"
+    assert summary["largest_drop"] == {"date": "2025-01-15", "delta": pytest.approx(-0.2)}
+    assert summary["min"] == pytest.approx(0.3) and summary["min_date"] == "2025-01-15"
+    assert summary["change"] == pytest.approx(-0.2)
+    assert [w["week"] for w in summary["weekly"]] == ["2025-01-06", "2025-01-13"]
+
+    later = engine.summarize("activation_rate", np.datetime64("2025-01-13"), np.datetime64("2025-01-20"))
+    assert later["previous_mean"] == pytest.approx(0.5)
+    assert engine.summarize("activation_rate", np.datetime64("2026-01-01")) is None
+
+
+def test_event_lookups(engine):
+    """Test events are counted by binary search within each event's slice."""
+    assert engine.events.count("signup_completed") == 3
+    assert engine.events.count("signup_completed", np.datetime64("2025-01-10"), np.datetime64("2025-01-12")) == 1
+    assert engine.events.count("unknown") == 0
+    days, counts = engine.events.daily["signup_completed"]
+    assert [str(d) for d in days] == ["2025-01-09", "2025-01-10", "2025-01-12"]
+    assert counts.tolist() == [1, 1, 1]
+    assert engine.users.row("u1")["plan"] == "free"
+    assert len(engine.accounts) == 0  # missing CSV loads empty
+
+
+def test_repo_data_explains_january_drop():
+    """Test the shipped CSVs give evidence for the activation drop."""
+    [summary] = MetricsEngine.load().evidence("Why did activation drop in January?")
+    assert summary["min_date"] == "2025-01-22"
+    assert summary["largest_drop"]["date"] == "2025-01-18"
+
+
+def test_unparseable_values_are_skipped(tmp_path):
+    """Test a non-numeric value or bad date drops its row instead of failing the load."""
+    (tmp_path / "daily_metrics.csv").write_text(
+        "date,metric_name,value,segment\n"
+        "2025-01-06,activation_rate,0.5,all\n"
+        "2025-01-07,activation_rate,n/a,all\n"
+        "not-a-date,activation_rate,0.4,all\n"
+        "2025-01-08,activation_rate,0.3,all\n"
+    )
+    s = MetricsEngine.load(str(tmp_path)).get_series("activation_rate")
+    assert [str(d) for d in s.dates] == ["2025-01-06", "2025-01-08"]
+    assert s.values == pytest.approx([0.5, 0.3])
+    assert MetricsEngine.empty().metrics == []
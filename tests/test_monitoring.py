@@ -0,0 +1,131 @@
+"""Tests for streaming metrics."""
+import numpy as np
+import pytest
+from app.histogram import LogHistogram, MultiWindowHistogram
+from app.monitoring import MetricsCollector
+
+
+def test_log_histogram_quantiles_within_precision():
+    """Test quantiles match exact nearest-rank values to the configured precision."""
+    values = np.random.default_rng(0).lognormal(mean=4, sigma=1, size=20000)
+    h = LogHistogram(precision=0.01)
+    for v in values:
+        h.add(v)
+
+    exact = np.sort(values)
+    for q in (0.5, 0.95, 0.99):
+        assert h.quantile(q) == pytest.approx(exact[int(q * len(values))], rel=0.011)
+    assert h.mean() == pytest.approx(values.mean())
+    assert h.quantile(1.0) == pytest.approx(values.max())
+    assert h.counts.nbytes == LogHistogram().counts.nbytes
+
+
+def test_windows_expire_old_values():
+    """Test 1m / 5m windows forget values older than the window; all-time keeps them."""
+    now = [0.0]
+    h = MultiWindowHistogram(clock=lambda: now[0])
+    for _ in range(10):
+        h.add(1000.0)
+    now[0] = 120.0
+    h.add(10.0)
+
+    assert h.summary("1m")["count"] == 1
+    assert h.summary("1m")["p95"] == pytest.approx(10.0)
+    assert h.summary("5m")["count"] == 11
+    assert h.summary()["count"] == 11
+
+    now[0] = 400.0
+    assert h.summary("5m")["count"] == 0
+    assert h.summary("5m")["p50"] is None
+    assert h.summary("1h")["count"] == 11
+
+
+def test_metrics_collector_stats_and_drift(tmp_path):
+    """Test session and windowed stats, and drift on the recent window."""
+    now = [0.0]
+    metrics = MetricsCollector(str(tmp_path / "metrics.jsonl"), clock=lambda: now[0])
+    for i in range(100):
+        metrics.record_query(f"q{i}", latency_ms=50.0 + i, retrieval_recall=0.9,
+                             ranker_ndcg=0.5, llm_refused=False, confidence=0.8)
+
+    stats = metrics.get_current_stats()
+    assert stats["latency_p50"] == pytest.approx(100.0, rel=0.01)
+    assert stats["latency_p95_1m"] == pytest.approx(145.0, rel=0.01)
+    assert stats["refused_mean"] == 0.0
+    assert metrics.detect_drift() == {}
+
+    # An hour later only slow, refused queries are recent
+    now[0] = 3600.0
+    for i in range(10):
+        metrics.record_query(f"s{i}", latency_ms=5000.0, retrieval_recall=0.9,
+                             ranker_ndcg=0.5, llm_refused=True, confidence=0.1)
+    drift = metrics.detect_drift()
+    assert set(drift) == {"latency", "refusal"}
+    assert metrics.get_current_stats()["latency_p50"] == pytest.approx(104.0, rel=0.02)
+
+
+def test_tracer_records_stage_spans_across_threads(tmp_path):
+    """Test spans are summed per stage, bound calls join the trace, and stats report them."""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.tracing import Tracer, bind, current_trace, span
+
+    metrics = MetricsCollector(str(tmp_path / "metrics.jsonl"))
+    tracer = Tracer(on_finish=lambda t: metrics.record_stages(t.stage_ms()))
+
+    def work():
+        with span("worker"):
+            return current_trace().trace_id
+
+    with tracer.trace("q1") as trace:
+        with span("encode"):
+            pass
+        with span("encode"):
+            pass
+        with ThreadPoolExecutor(1) as pool:
+            assert pool.submit(bind(work)).result() == "q1"
+    assert current_trace() is None
+    assert [name for name, _, _ in trace.spans] == ["encode", "encode", "worker"]
+    assert set(trace.stage_ms()) == {"encode", "worker"}
+
+    stats = metrics.get_current_stats()
+    assert stats["stage_encode_p50_ms"] >= 0
+    assert "stage_worker_p99_ms" in stats
+    assert "stage_worker_p95_ms_5m" in stats
+
+    # Disabled: no trace, spans and bind are no-ops
+    with Tracer(enabled=False).trace("q2") as trace:
+        assert trace is None
+        assert span("encode") is span("other")
+        assert bind(work) is work
+
+
+@pytest.mark.parametrize("mode, suffix", [("sample", ".folded"), ("cprofile", ".prof")])
+def test_tracer_profiles_slow_requests(tmp_path, mode, suffix):
+    """Test sampled requests over the slow threshold dump a profile; fast ones do not."""
+    import time
+    from app.tracing import Tracer
+
+    def busy(seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    tracer = Tracer(profile_mode=mode, sample_rate=1.0, slow_ms=50,
+                    profile_dir=str(tmp_path), interval_ms=1)
+    with tracer.trace("fast"):
+        pass
+    with tracer.trace("slow"):
+        busy(0.1)
+
+    dumps = list(tmp_path.iterdir())
+    assert [p.suffix for p in dumps] == [suffix]
+    assert "slow" in dumps[0].name
+    if mode == "sample":
+        stack, count = dumps[0].read_text().splitlines()[0].rsplit(" ", 1)
+        assert "busy" in stack and int(count) > 0
+    else:
+        import pstats
+        assert any(func[2] == "busy" for func in pstats.Stats(str(dumps[0])).stats)
+
+    with pytest.raises(ValueError):
+        Tracer(profile_mode="perf")
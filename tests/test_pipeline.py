@@ -1,6 +1,7 @@
 """Tests for end-to-end pipeline."""
+import asyncio
 import pytest
-from app.pipeline import run_pipeline
+from app.pipeline import run_pipeline, run_pipeline_async, run_pipeline_batch
 
 
 def test_pipeline_basic_query():
@@ -46,3 +47,190 @@ def test_pipeline_error_handling():
     assert "query_id" in result
     assert "refused" in result
     assert "latency_ms" in result
+
+
+def test_pipeline_batch():
+    """Test batched pipeline returns one well-formed response per query."""
+    queries = ["What happened in March?", "Why did activation drop?"]
+    results = run_pipeline_batch(queries)
+
+    assert len(results) == len(queries)
+    assert len({r["query_id"] for r in results}) == len(queries)
+    for result in results:
+        assert isinstance(result["citations"], list)
+        assert isinstance(result["refused"], bool)
+        assert result["latency_ms"] >= 0
+
+    assert run_pipeline_batch([]) == []
+
+
+def test_pipeline_async_concurrent_queries():
+    """Test async pipeline serves concurrent queries off the event loop."""
+    queries = ["What happened in March?", "Why did activation drop?", ""]
+
+    async def run_all():
+        return await asyncio.gather(*(run_pipeline_async(q) for q in queries))
+
+    results = asyncio.run(run_all())
+    assert len(results) == len(queries)
+    for result in results:
+        assert "query_id" in result
+        assert isinstance(result["refused"], bool)
+        assert result["latency_ms"] >= 0
+
+
+def test_pipeline_result_cache_hit_and_invalidation():
+    """Test repeated queries are served from cache until versions change."""
+    from app import pipeline
+
+    pipeline.result_cache.clear()
+    first = run_pipeline("Why did activation drop in January?")
+    hits_before = pipeline.metrics.cache_counters["result"]["hits"]
+
+    second = run_pipeline("  why did ACTIVATION drop in january?")
+    assert pipeline.metrics.cache_counters["result"]["hits"] == hits_before + 1
+    assert second["answer"] == first["answer"]
+    assert second["query_id"] != first["query_id"]
+
+    # A new ranker version invalidates cached answers
+    original = pipeline.ranker.model.created_at
+    pipeline.ranker.model.created_at = "retrained"
+    try:
+        run_pipeline("Why did activation drop in January?")
+        assert pipeline.metrics.cache_counters["result"]["hits"] == hits_before + 1
+    finally:
+        pipeline.ranker.model.created_at = original
+
+
+def test_pipeline_does_not_cache_answers_across_versions(monkeypatch):
+    """Test an answer computed while the ranker changed is not served for the new version."""
+    from app import pipeline
+
+    pipeline.result_cache.clear()
+    original = pipeline.ranker.model.created_at
+    synthesize = pipeline._synthesize
+
+    def reload_mid_query(query, ranked):
+        pipeline.ranker.model.created_at = "reloaded"
+        return synthesize(query, ranked)
+
+    monkeypatch.setattr(pipeline, "_synthesize", reload_mid_query)
+    try:
+        run_pipeline("How did retention change in April?")
+        monkeypatch.setattr(pipeline, "_synthesize", synthesize)
+        hits_before = pipeline.metrics.cache_counters["result"]["hits"]
+        run_pipeline("How did retention change in April?")
+        assert pipeline.metrics.cache_counters["result"]["hits"] == hits_before
+    finally:
+        pipeline.ranker.model.created_at = original
+
+
+def test_ttl_cache_expiry_and_lru():
+    """Test TTL expiry, LRU eviction and namespace invalidation."""
+    from app.cache import TTLCache
+
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts least recently used "b"
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    now[0] = 11.0
+    assert cache.get("a") is None
+
+    cache.set("d", 4)
+    cache.bind("v2")
+    assert cache.get("d") is None
+
+    # Values computed under an older namespace are not stored
+    cache.set("e", 5, namespace="v1")
+    assert cache.get("e") is None
+    cache.set("e", 5, namespace="v2")
+    assert cache.get("e") == 5
+
+
+def test_pipeline_import_is_lazy():
+    """Test importing the pipeline builds no components and loads no models."""
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, app.pipeline as p; "
+        "assert not p._components and not p.is_ready(); "
+        "assert 'app.retrieval.dense_retrieval' not in sys.modules; "
+        "assert 'app.ranking.model' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_warm_up_sets_ready_flag():
+    """Test warm-up builds every component and /health reports readiness."""
+    from fastapi.testclient import TestClient
+    from fastapi import FastAPI
+    from app import pipeline
+    from app.api import router
+
+    pipeline.warm_up()
+    assert pipeline.is_ready()
+    assert set(pipeline._components) == set(pipeline._FACTORIES)
+    assert pipeline.get("hybrid").dense is pipeline.dense
+
+    app = FastAPI()
+    app.include_router(router)
+    assert TestClient(app).get("/health").json()["ready"] is True
+
+
+def test_pipeline_attaches_metric_evidence():
+    """Test answers carry numeric evidence for the metrics a query names."""
+    result = run_pipeline("Why did activation drop in January?")
+    assert [e["metric"] for e in result["evidence"]] == ["activation_rate"]
+    assert run_pipeline("Tell me about quantum physics")["evidence"] == []
+
+    # An invalid date in the question does not fail the answer
+    result = run_pipeline("What was activation on 2025-02-30?")
+    assert "error" not in result and result["answer"] is not None
+
+
+def test_pipeline_records_stage_latencies():
+    """Test a traced query reports per-stage latency percentiles."""
+    from app import pipeline
+
+    pipeline.result_cache.clear()
+    run_pipeline("Which accounts churned in February?")
+    stats = pipeline.metrics.get_current_stats()
+    for stage in ("retrieve", "encode", "dense_search", "sparse_search", "fusion",
+                  "features", "ranker_model", "synthesis", "evidence"):
+        assert f"stage_{stage}_p95_ms" in stats
+
+
+def test_pipeline_batch_async_reports_warm_up_failure(monkeypatch):
+    """Test a failed warm-up yields one error response per query, not an exception."""
+    from app import pipeline
+    from app.pipeline import run_pipeline_batch_async
+
+    async def failing_warm_up(loop):
+        raise RuntimeError("warm-up failed")
+
+    monkeypatch.setattr(pipeline, "_ensure_ready", failing_warm_up)
+    results = asyncio.run(run_pipeline_batch_async(["a", "b"]))
+    assert [r["error"] for r in results] == ["warm-up failed"] * 2
+    assert all(r["refused"] for r in results)
+
+
+def test_batch_route_limits_queries_per_request():
+    """Test POST /query/batch rejects more than MAX_BATCH_QUERIES queries."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import router
+    from app.config import MAX_BATCH_QUERIES
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    response = client.post("/query/batch", json={"queries": ["q"] * (MAX_BATCH_QUERIES + 1)})
+    assert response.status_code == 422
+    response = client.post("/query/batch", json={"queries": ["What happened in March?"]})
+    assert response.status_code == 200 and len(response.json()["results"]) == 1
@@ -40,6 +40,26 @@ def test_feature_extraction(feature_extractor, sample_candidates):
     assert all(isinstance(f, (int, float, np.number)) for f in features_list[0])
 
 
+def test_extract_batch_ids_matches_per_document(sample_candidates):
+    """Test vectorized extraction matches per-candidate extraction."""
+    docs = [c["text"] for c in sample_candidates] + ["Activation dropped, onboarding why"]
+    extractor = FeatureExtractor(docs)
+    query = "Why did activation drop in March"
+    doc_ids = [3, 0, 2, 1]
+    dense = [0.9, 0.8, 0.7, 0.6]
+    sparse = [2.0, 1.5, 0.0, 0.3]
+
+    batch = extractor.extract_batch_ids(query, doc_ids, dense, sparse)
+    assert batch.shape == (4, 6)
+    assert batch.dtype == np.float32
+    for row, i, ds, ss in zip(batch, doc_ids, dense, sparse):
+        expected = FeatureExtractor.extract_features(query, docs[i], ds, ss)
+        assert row == pytest.approx(expected)
+
+    with pytest.raises(RuntimeError):
+        FeatureExtractor().extract_batch_ids(query, [0], [0.5], [0.5])
+
+
 def test_ranking_model_initialization():
     """Test ranking model can be initialized."""
     model = LambdaRankModel()
@@ -62,5 +82,48 @@ def test_ranking_model_fallback():
     scores = model.rank(features)
     assert len(scores) == 3
     assert all(isinstance(s, (int, float, np.number)) for s in scores)
-    # Should be sorted descending
-    assert scores[0] >= scores[1] >= scores[2]
+    # Scores stay aligned with input rows
+    for row, score in zip(features, scores):
+        assert model.rank(row[None, :])[0] == pytest.approx(score)
+
+    top = model.top_k(scores, 2)
+    assert top.tolist() == list(np.argsort(-scores)[:2])
+    assert scores[top[0]] >= scores[top[1]]
+
+
+def test_rank_candidates_scores_follow_candidates():
+    """Test orchestrator keeps each candidate paired with its own score."""
+    from app.ranking.ranker import RankingOrchestrator
+
+    orchestrator = RankingOrchestrator()
+    candidates = [
+        {"text": "weak match", "dense_score": 0.1, "sparse_score": 0.0},
+        {"text": "strong match", "dense_score": 0.9, "sparse_score": 3.0},
+        {"text": "medium match", "dense_score": 0.5, "sparse_score": 1.0},
+    ]
+    ranked = orchestrator.rank_candidates("match", candidates, top_k=2)
+
+    assert [r["text"] for r in ranked] == ["strong match", "medium match"]
+    assert ranked[0]["rank_score"] > ranked[1]["rank_score"]
+    assert "rank_score" not in candidates[1]
+
+
+def test_rank_ids_matches_rank_candidates():
+    """Test the id/array path selects the same top-k as the dict path."""
+    from app.ranking.ranker import RankingOrchestrator
+
+    docs = ["weak match", "strong match here", "medium match", "unrelated"]
+    orchestrator = RankingOrchestrator(docs)
+    ids = np.array([0, 1, 2])
+    dense = np.array([0.1, 0.9, 0.5], dtype=np.float32)
+    sparse = np.array([0.0, 3.0, 1.0], dtype=np.float32)
+
+    positions, scores = orchestrator.rank_ids("match", ids, dense, sparse, top_k=2)
+    ranked = orchestrator.rank_candidates(
+        "match",
+        [{"id": int(i), "text": docs[i], "dense_score": d, "sparse_score": s}
+         for i, d, s in zip(ids, dense, sparse)],
+        top_k=2,
+    )
+    assert ids[positions].tolist() == [r["id"] for r in ranked]
+    assert scores.tolist() == pytest.approx([r["rank_score"] for r in ranked])
@@ -1,8 +1,12 @@
 """Tests for retrieval layer."""
+import os
+import numpy as np
 import pytest
-from app.retrieval.dense_retrieval import DenseRetriever
+from app.retrieval.dense_retrieval import DenseRetriever, QueryEmbeddingCache
 from app.retrieval.sparse_retrieval import SparseRetriever
 from app.retrieval.hybrid_retrieval import HybridRetriever
+from app.retrieval.fusion import fuse
+from app.retrieval.docstore import DocumentStore
 
 
 @pytest.fixture
@@ -30,6 +34,63 @@ def test_dense_retrieval_search(sample_docs):
     assert all("text" in r and "score" in r for r in results)
 
 
+def test_dense_index_persisted_and_memory_mapped(sample_docs, tmp_path):
+    """Test dense embeddings are persisted and re-opened as a memmap."""
+    first = DenseRetriever(sample_docs, cache_dir=str(tmp_path))
+    files = list(tmp_path.glob("dense-*.npy"))
+    assert len(files) == 1
+
+    second = DenseRetriever(sample_docs, cache_dir=str(tmp_path))
+    assert isinstance(second.emb, np.memmap)
+    assert np.allclose(first.emb, second.emb)
+    assert second.search("onboarding activation")[0] == first.search("onboarding activation")[0]
+
+    # A different corpus gets its own index file
+    DenseRetriever(sample_docs[:2], cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob("dense-*.npy"))) == 2
+
+
+def test_query_embedding_cache(sample_docs, tmp_path):
+    """Test query vectors are reused from memory and from the shared disk tier."""
+    calls = []
+    retriever = DenseRetriever(
+        sample_docs, query_cache=QueryEmbeddingCache(10_000, disk_dir=str(tmp_path))
+    )
+    encode = retriever._encode_uncached
+    retriever._encode_uncached = lambda texts: calls.append(list(texts)) or encode(texts)
+
+    first = retriever.search("onboarding activation")
+    assert retriever.search("  onboarding   activation ") == first
+    retriever.search_batch(["onboarding activation", "checkout", "checkout"])
+    assert calls == [["onboarding activation"], ["checkout"]]
+
+    # A fresh process-local cache picks vectors up from disk
+    other = DenseRetriever(
+        sample_docs, query_cache=QueryEmbeddingCache(10_000, disk_dir=str(tmp_path))
+    )
+    other._encode_uncached = lambda texts: pytest.fail("should hit the disk cache")
+    assert other.search("onboarding activation") == first
+
+    # Memory tier is bounded by bytes
+    small = QueryEmbeddingCache(max_bytes=2 * 384 * 4)
+    for i in range(5):
+        small.set(str(i), np.zeros(384, dtype=np.float32))
+    assert len(small.memory) == 2
+    assert small.memory.current_bytes <= small.memory.max_bytes
+
+    # Disk tier evicts the least recently used files past its cap
+    disk = QueryEmbeddingCache(0, disk_dir=str(tmp_path / "q"))
+    keys = [QueryEmbeddingCache.key("test", f"q{i}") for i in range(4)]
+    for i, key in enumerate(keys):
+        disk.set(key, np.zeros(384, dtype=np.float32))
+        os.utime(disk._disk_path(key), (i, i))
+    assert disk.get(keys[0]) is not None  # refreshes its mtime
+    file_size = disk._disk_path(keys[0]).stat().st_size
+    disk.max_disk_bytes = 3 * file_size
+    assert disk.prune() == 2
+    assert [disk._disk_path(k).exists() for k in keys] == [True, False, False, True]
+
+
 def test_sparse_retrieval_initialization(sample_docs):
     """Test sparse retriever can initialize."""
     retriever = SparseRetriever(sample_docs)
@@ -44,6 +105,29 @@ def test_sparse_retrieval_search(sample_docs):
     assert all("text" in r and "score" in r for r in results)
 
 
+def test_sparse_retrieval_only_returns_matching_docs(sample_docs):
+    """Test the inverted index skips documents without query terms."""
+    retriever = SparseRetriever(sample_docs)
+    results = retriever.search("onboarding")
+    assert {r["text"] for r in results} == {sample_docs[0], sample_docs[1]}
+    assert results[0]["score"] >= results[1]["score"]
+    assert len(retriever.search("onboarding", top_k=1)) == 1
+    assert retriever.search("nonexistentterm") == []
+
+
+def test_sparse_scores_match_rank_bm25(sample_docs):
+    """Test inverted-index BM25 scores match BM25Okapi."""
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    retriever = SparseRetriever(sample_docs)
+    reference = rank_bm25.BM25Okapi([retriever._tokenize(d) for d in sample_docs])
+
+    query = "onboarding activation in march"
+    expected = reference.get_scores(retriever._tokenize(query))
+    for r in retriever.search(query):
+        i = sample_docs.index(r["text"])
+        assert r["score"] == pytest.approx(expected[i], rel=1e-5)
+
+
 def test_hybrid_retrieval(sample_docs):
     """Test hybrid retrieval combines dense and sparse."""
     dense = DenseRetriever(sample_docs)
@@ -54,3 +138,171 @@ def test_hybrid_retrieval(sample_docs):
     assert len(results) > 0
     # Hybrid should return merged results
     assert all("text" in r and "score" in r for r in results)
+
+    # Closing stops the fan-out pool; searches still work, inline
+    pool = hybrid._pool
+    hybrid.close()
+    assert pool._shutdown and hybrid._pool is None
+    assert [r["id"] for r in hybrid.search("onboarding")] == [r["id"] for r in results]
+
+
+def test_hybrid_keeps_per_retriever_scores(sample_docs):
+    """Test hybrid results carry dense and sparse scores and respect the budget."""
+    dense = DenseRetriever(sample_docs)
+    sparse = SparseRetriever(sample_docs)
+    sparse_scores = {r["id"]: r["score"] for r in sparse.search("onboarding")}
+
+    for strategy in ("rrf", "minmax", "zscore"):
+        hybrid = HybridRetriever(dense, sparse, strategy=strategy, candidate_budget=3)
+        results = hybrid.search("onboarding")
+        assert len(results) == 3
+        assert [r["score"] for r in results] == sorted(
+            (r["score"] for r in results), reverse=True
+        )
+        for r in results:
+            assert r["text"] == sample_docs[r["id"]]
+            assert r["sparse_score"] == pytest.approx(sparse_scores.get(r["id"], 0.0))
+
+
+def test_fuse_strategies():
+    """Test fusion keys on doc ids and orders by fused score."""
+    dense_run = (np.array([2, 0, 1]), np.array([0.9, 0.5, 0.1]))
+    sparse_run = (np.array([0, 3]), np.array([7.0, 1.0]))
+
+    ids, fused, run_scores = fuse([dense_run, sparse_run], strategy="rrf")
+    # doc 0 appears in both runs so it wins under RRF
+    assert ids[0] == 0
+    assert fused[0] == pytest.approx(1 / 62 + 1 / 61)
+    assert run_scores[0].tolist() == pytest.approx([0.5, 7.0])
+    assert sorted(ids.tolist()) == [0, 1, 2, 3]
+
+    ids, fused, _ = fuse([dense_run, sparse_run], strategy="minmax", budget=2)
+    assert ids.tolist() == [0, 2]
+    assert fused.tolist() == pytest.approx([0.5 + 1.0, 1.0])
+
+    with pytest.raises(ValueError):
+        fuse([dense_run], strategy="sum")
+
+
+def test_search_batch_matches_single_queries(sample_docs):
+    """Test batched search returns the same results as per-query search."""
+    dense = DenseRetriever(sample_docs)
+    sparse = SparseRetriever(sample_docs)
+    hybrid = HybridRetriever(dense, sparse)
+    queries = ["onboarding activation", "checkout bug", "database"]
+
+    for retriever in (dense, sparse, hybrid):
+        batch = retriever.search_batch(queries)
+        assert len(batch) == len(queries)
+        for q, results in zip(queries, batch):
+            single = retriever.search(q)
+            assert [r["text"] for r in results] == [r["text"] for r in single]
+            assert [r["score"] for r in results] == pytest.approx(
+                [r["score"] for r in single], rel=1e-5
+            )
+
+
+def test_document_store_columns_and_materialize():
+    """Test metadata columns stay aligned through append and compaction."""
+    store = DocumentStore(
+        ["first doc", "second longer doc"],
+        [{"source_type": "doc", "date": "2025-01-18", "weight": 1.0}, {"source_type": "ticket"}],
+    )
+    ids = store.append(["third doc here now"], [{"source_type": "doc", "weight": 0.5}])
+    assert ids.tolist() == [2]
+    assert store.metadata(1) == {"source_type": "ticket", "date": None, "weight": 1.0, "token_count": 3}
+
+    store.compact(np.array([True, False, True]))
+    assert list(store) == ["first doc", "third doc here now"]
+    rows = store.materialize(np.array([1, 0]), score=np.array([0.9, 0.1], dtype=np.float32))
+    assert [r["id"] for r in rows] == [1, 0]
+    assert rows[0]["token_count"] == 4 and rows[0]["weight"] == 0.5
+    assert rows[1]["date"] == "2025-01-18"
+    assert rows[0]["score"] == pytest.approx(0.9)
+
+
+def test_hybrid_id_path_matches_dicts(sample_docs):
+    """Test search_ids returns the same candidates as the dict API over a shared store."""
+    store = DocumentStore(sample_docs)
+    hybrid = HybridRetriever(DenseRetriever(store), SparseRetriever(store), parallel=False)
+    doc_ids, fused, run_scores = hybrid.search_ids("onboarding release")
+    results = hybrid.search("onboarding release")
+    assert doc_ids.tolist() == [r["id"] for r in results]
+    assert run_scores[:, 1].tolist() == pytest.approx([r["sparse_score"] for r in results])
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "hnsw", "ivf_pq"])
+def test_ann_index_types(index_type, tmp_path):
+    """Test ANN indexes find the exact neighbors on an easy corpus and survive reloads."""
+    pytest.importorskip("faiss")
+    docs = [f"passage {i} about topic {i % 7}" for i in range(400)]
+    params = {"nlist": 8, "nprobe": 8, "pq_m": 16}
+    retriever = DenseRetriever(docs, cache_dir=str(tmp_path), index_type=index_type, index_params=params)
+    assert retriever._use_faiss
+
+    # Deterministic embeddings of the query text itself: the doc must be the top hit
+    for i in (0, 123, 399):
+        assert retriever.search(docs[i], k=3)[0]["text"] == docs[i]
+
+    reloaded = DenseRetriever(docs, cache_dir=str(tmp_path), index_type=index_type, index_params=params)
+    assert reloaded.search(docs[5], k=1)[0]["text"] == docs[5]
+    ids = reloaded.add_documents(["a brand new passage"])
+    assert reloaded.search("a brand new passage", k=1)[0]["id"] == ids[0]
+
+
+def test_ann_recall_report():
+    """Test the report compares every config against the exact flat baseline."""
+    pytest.importorskip("faiss")
+    from app.retrieval.ann import recall_latency_report
+
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((500, 32)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    rows = recall_latency_report(emb, emb[:20], [("ivf_flat", {"nlist": 4, "nprobe": 4})], k=5)
+
+    assert [r["index_type"] for r in rows] == ["flat", "ivf_flat"]
+    assert rows[0]["recall"] == 1.0
+    # Probing every cell is exact
+    assert rows[1]["recall"] == 1.0
+    assert rows[1]["params"] == {"nlist": 4, "nprobe": 4}
+
+
+@pytest.mark.parametrize("storage,use_faiss", [
+    ("float16", False), ("int8", False), ("float16", True), ("int8", True),
+])
+def test_quantized_storage_recall(storage, use_faiss, tmp_path, monkeypatch):
+    """Test reduced-precision storage with float32 rescoring keeps recall close to exact."""
+    from app.retrieval import dense_retrieval
+    if use_faiss:
+        pytest.importorskip("faiss")
+    else:
+        monkeypatch.setattr(dense_retrieval, "faiss", None)
+
+    docs = [f"passage number {i}" for i in range(600)]
+    queries = [f"query text {i}" for i in range(30)]
+    exact = DenseRetriever(docs)
+    quantized = DenseRetriever(docs, cache_dir=str(tmp_path), storage=storage)
+    assert quantized.quantized and quantized._use_faiss == use_faiss
+    if use_faiss:
+        # Vectors are held once, scalar-quantized inside the FAISS index
+        assert type(quantized._index).__name__ == "IndexScalarQuantizer"
+        assert quantized._quant is None
+    else:
+        assert quantized._quant.nbytes * (2 if storage == "float16" else 4) == quantized.emb.nbytes
+
+    hits = 0
+    q = exact._encode(queries)
+    for row, ((ids, scores), (true_ids, _)) in enumerate(
+        zip(quantized.search_ids_batch(queries, k=10), exact.search_ids_batch(queries, k=10))
+    ):
+        hits += len(np.intersect1d(ids, true_ids))
+        # Returned scores are the exact float32 ones, best first
+        assert scores == pytest.approx(exact.emb[ids] @ q[row], abs=1e-5)
+        assert np.all(np.diff(scores) <= 0)
+    assert hits / (10 * len(queries)) >= 0.95
+
+    # Incremental adds are quantized too, and reloads reuse the persisted copy
+    new_id = quantized.add_documents(["freshly added passage"])[0]
+    assert quantized.search("freshly added passage", k=1)[0]["id"] == new_id
+    reloaded = DenseRetriever(docs, cache_dir=str(tmp_path), storage=storage)
+    assert reloaded.search(docs[42], k=1)[0]["text"] == docs[42]
@@ -1,6 +1,7 @@
 """Training pipeline for continuous model improvement."""
 import json
 import numpy as np
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 from typing import List, Tuple
@@ -28,21 +29,20 @@ class TrainingPipeline:
             - y: NDCG scores [n_samples]
             - group_sizes: queries per group for pairwise ranking
         """
-        logs = self.feedback.load_feedback_logs(limit=10000)
-        
-        if len(logs) < self.min_feedback:
-            print(f"Insufficient feedback: {len(logs)} < {self.min_feedback}")
-            return None
+        # Stream the newest logs instead of materializing them
+        logs = islice(self.feedback.iter_feedback_logs(), 10000)
         
         # Group by query
         queries_data = {}
+        num_logs = 0
         for log in logs:
+            num_logs += 1
             query = log.get("query")
             if query not in queries_data:
                 queries_data[query] = []
             
             # Generate label based on feedback
-            helpful = log.get("user_feedback", {}).get("helpful", False)
+            helpful = (log.get("user_feedback") or {}).get("helpful", False)
             confidence = log.get("confidence", 0.5)
             refused = log.get("refused", False)
             
@@ -56,6 +56,10 @@ class TrainingPipeline:
                 "ndcg_score": ndcg_score
             })
         
+        if num_logs < self.min_feedback:
+            print(f"Insufficient feedback: {num_logs} < {self.min_feedback}")
+            return None
+        
         # Build feature matrix
         X_list, y_list, group_sizes = [], [], []
         